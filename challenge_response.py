@@ -69,7 +69,7 @@ def emotion_response(face, challenge: str, model: EmotionPredictor):
 
 
 def result_challenge_response(
-    frame: np.ndarray, challenge: str, question, model: list, mtcnn: MTCNN
+    frame: np.ndarray, challenge: str, question, model: list, mtcnn: MTCNN, track=False
 ):
     """
     Process the response to a challenge based on the input frame.
@@ -80,11 +80,14 @@ def result_challenge_response(
         question:  A question or instruction related to the challenge.
         model (list): List of models used, including [blink_model, face_orientation_model, emotion_model].
         mtcnn (MTCNN): MTCNN object used for face extraction.
+        track (bool): Whether frame is the next frame of a live stream, so faces can be tracked from
+                      the previous frame with MTCNN.track instead of being detected from scratch.
+                      Call mtcnn.reset_tracking() when a new stream starts.
 
     Returns:
         bool: The result of the challenge (True if correct, False if incorrect).
     """
-    face, box, landmarks = extract_face(frame, mtcnn, padding=10)
+    face, box, landmarks = extract_face(frame, mtcnn, padding=10, track=track)
     if box is not None:
         if challenge in ["smile", "surprise"]:
             isCorrect = emotion_response(face, challenge, model[2])
@@ -105,7 +108,8 @@ if __name__ == "__main__":
 
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
-    mtcnn = MTCNN()
+    # Frames of one size detected on this thread only, so their buffers can be reused
+    mtcnn = MTCNN(plan_cache_size=1)
     blink_detector = BlinkDetector()
     emotion_predictor = EmotionPredictor()
     face_orientation_detector = FaceOrientationDetector()
@@ -125,7 +129,7 @@ if __name__ == "__main__":
 
                 rgb_frame = cv.cvtColor(frame, cv.COLOR_BGR2RGB)
                 challengeIsCorrect = result_challenge_response(
-                    rgb_frame, challenge, question, model, mtcnn
+                    rgb_frame, challenge, question, model, mtcnn, track=True
                 )
 
                 if isinstance(question, list):
@@ -0,0 +1,58 @@
+"""Export the detection, verification and emotion models to ONNX graphs.
+
+Every graph has a dynamic batch dimension and is checked against the eager PyTorch model before
+being written next to the model weights, where backend='onnx' of MTCNN, VGGFace2.load_model and
+EmotionPredictor looks for it:
+    python export_onnx.py [--models mtcnn vggface2 emotion] [--mtcnn-dir DIR]
+"""
+import argparse
+import os
+
+import torch
+
+from facenet.models.mtcnn import MTCNN
+from facenet.models.utils.onnx_backend import export_onnx
+from liveness_detection import emotion_prediction
+from verification_models import VGGFace2
+
+VGGFACE2_WEIGHTS = "weights/vggface2_weights.pt"
+EMOTION_WEIGHTS = "landmarks/emotion_weights.pt"
+
+
+def onnx_path(module, weights):
+    return os.path.splitext(os.path.join(os.path.dirname(module.__file__), weights))[0] + ".onnx"
+
+
+def export_models(models, mtcnn_dir=None):
+    paths = []
+    if "mtcnn" in models:
+        paths.extend(MTCNN().export_onnx(mtcnn_dir).values())
+    if "vggface2" in models:
+        paths.append(export_onnx(
+            VGGFace2.load_model(VGGFACE2_WEIGHTS, inference_only=True),
+            torch.rand(2, 3, 160, 160) * 2 - 1,
+            onnx_path(VGGFace2, VGGFACE2_WEIGHTS),
+            ["embedding"],
+        ))
+    if "emotion" in models:
+        predictor = emotion_prediction.EmotionPredictor(EMOTION_WEIGHTS)
+        paths.append(export_onnx(
+            predictor.model,
+            torch.rand(2, 1, *predictor.img_size) * 2 - 1,
+            onnx_path(emotion_prediction, EMOTION_WEIGHTS),
+            ["logits"],
+        ))
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--models", nargs="+", choices=["mtcnn", "vggface2", "emotion"],
+        default=["mtcnn", "vggface2", "emotion"]
+    )
+    parser.add_argument("--mtcnn-dir", default=None, help="Output directory of the MTCNN graphs")
+    args = parser.parse_args()
+
+    for path in export_models(args.models, args.mtcnn_dir):
+        print("Exported", path)
@@ -35,15 +35,10 @@ def face_matching(
 
     distance_func = distance_metric.get(distance_metric_name, Euclidean_Distance)
 
-    device = model.device()
+    # Both faces go through the model in a single forward pass
+    embeddings = VGGFace2.embed_faces([face1, face2], model)
 
-    face1 = face_transform(face1, model_name=model_name, device=device)
-    face2 = face_transform(face2, model_name=model_name, device=device)
-
-    result1 = model(face1)
-    result2 = model(face2)
-
-    dis = distance_func(result1, result2)
+    dis = distance_func(embeddings[0:1], embeddings[1:2])
 
     threshold = findThreshold(
         model_name=model_name, distance_metric=distance_metric_name
@@ -72,8 +67,8 @@ def verify(
         bool: True if the faces are verified to be similar, False otherwise.
     """
 
-    face1, box1, landmarks = extract_face(img1, detector_model, padding=1)
-    face2, box2, landmarks = extract_face(img2, detector_model, padding=1)
+    # Both images go through the detector in a single batch, even if their sizes differ
+    (face1, box1, _), (face2, box2, _) = extract_faces([img1, img2], detector_model, padding=1)
 
     verified = face_matching(
         face1,
@@ -97,7 +92,7 @@ if __name__ == "__main__":
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
     detector_model = MTCNN(device=device)
-    verifier_model = VGGFace2.load_model(device=device)
+    verifier_model = VGGFace2.load_model(device=device, inference_only=True)
 
     results = verify(image1, image2, detector_model, verifier_model)
 
@@ -2,8 +2,28 @@ import torch
 from torch import nn
 import numpy as np
 import os
-
-from .utils.detect_face import detect_face, extract_face
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+from .utils.detect_face import (
+    extract_face, propose_faces, refine_faces, track_face, image_size, PlanCache,
+    compute_scales, imresample, generateBoundingBox, pnet_bbreg, summed_area_table,
+    crop_candidates, rnet_outputs, onet_outputs, bbreg, rerec, batched_nms, batched_nms_torch,
+    import_torchvision
+)
+from .utils.detections import Detections
+from .utils.profiling import DetectionProfile
+from .utils.onnx_backend import export_onnx, OnnxModule
+from .utils.packed_weights import load_packed
+from .utils.quantization import load_quantized_net, quantized_path
+
+# Example input shape, output names and extra dynamic input axes of the ONNX graph of every network
+ONNX_GRAPHS = {
+    'pnet': ((2, 3, 48, 64), ['reg', 'probs'], {2: 'height', 3: 'width'}),
+    'rnet': ((2, 3, 24, 24), ['reg', 'probs'], None),
+    'onet': ((2, 3, 48, 48), ['reg', 'landmarks', 'probs'], None),
+}
 
 
 class PNet(nn.Module):
@@ -154,6 +174,114 @@ class ONet(nn.Module):
         return b, c, a
 
 
+class MTCNNCascade(nn.Module):
+    """The P-, R- and O-net cascade of detect_face as a single TorchScript-compatible module.
+
+    forward() runs detection on a batch of equally sized images with the default settings of
+    MTCNN.detect() (torch pyramid, no mosaic, no candidate caps) and returns the same boxes and
+    landmarks, but as flat tensors. Compiled with torch.jit.script, as done by MTCNN.script(),
+    the whole cascade runs in the TorchScript interpreter, and a saved module can be loaded with
+    torch.jit.load() in a process that only imports torch and torchvision:
+
+        >>> import torch, torchvision
+        >>> cascade = torch.jit.load('mtcnn.pt')
+        >>> boxes, points, image_inds = cascade(torch.from_numpy(frames))
+
+    Arguments:
+        pnet {PNet} -- Proposal network.
+        rnet {RNet} -- Refinement network.
+        onet {ONet} -- Output network.
+
+    Keyword Arguments:
+        min_face_size {float} -- See MTCNN. (default: {20})
+        thresholds {list} -- See MTCNN. (default: {[0.6, 0.7, 0.7]})
+        factor {float} -- See MTCNN. (default: {0.709})
+        max_face_size {float} -- See MTCNN. (default: {None})
+    """
+
+    max_face_size: Optional[float]
+
+    def __init__(
+        self, pnet, rnet, onet, min_face_size=20, thresholds=[0.6, 0.7, 0.7], factor=0.709,
+        max_face_size=None
+    ):
+        super().__init__()
+        self.pnet = pnet
+        self.rnet = rnet
+        self.onet = onet
+        self.min_face_size = float(min_face_size)
+        self.thresholds = [float(t) for t in thresholds]
+        self.factor = float(factor)
+        self.max_face_size = None if max_face_size is None else float(max_face_size)
+
+    def forward(self, imgs: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        """Detect faces in a (B, H, W, 3) or (H, W, 3) uint8 or float tensor of RGB images.
+
+        Runs without autograd, like detect_face, so that the outputs need no detach().
+
+        Returns:
+            tuple(torch.Tensor) -- Nx5 boxes (x1, y1, x2, y2, probability), Nx5x2 landmarks and
+                the batch index of the image of every face.
+        """
+        with torch.no_grad():
+            boxes, points, image_inds = self.detect(imgs)
+        return boxes, points, image_inds
+
+    def detect(self, imgs: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        if imgs.dim() == 3:
+            imgs = imgs.unsqueeze(0)
+        h, w = imgs.shape[1], imgs.shape[2]
+        model_dtype = self.pnet.conv1.weight.dtype
+        device = imgs.device
+
+        # First stage, PNet on every pyramid level
+        frame = imgs.to(model_dtype).permute(0, 3, 1, 2)
+        boxes_list: List[torch.Tensor] = [torch.zeros(0, 9, dtype=model_dtype, device=device)]
+        inds_list: List[torch.Tensor] = [torch.zeros(0, dtype=torch.int64, device=device)]
+        for scale in compute_scales(h, w, self.min_face_size, self.factor, self.max_face_size):
+            im_data = imresample(frame, [int(h * scale + 1), int(w * scale + 1)])
+            reg, probs = self.pnet(im_data.sub_(127.5).mul_(0.0078125))
+            boxes, image_inds = generateBoundingBox(reg, probs[:, 1], scale, self.thresholds[0])
+            pick = batched_nms(boxes[:, :4], boxes[:, 4], image_inds, 0.5)
+            boxes_list.append(boxes[pick])
+            inds_list.append(image_inds[pick])
+        boxes = torch.cat(boxes_list)
+        image_inds = torch.cat(inds_list)
+        pick = batched_nms(boxes[:, :4], boxes[:, 4], image_inds, 0.7)
+        boxes = pnet_bbreg(boxes[pick])
+        image_inds = image_inds[pick]
+
+        points = torch.zeros(0, 5, 2, device=device)
+        if boxes.shape[0] > 0:
+            # Second stage, RNet
+            integral_dtype = torch.float64 if imgs.is_floating_point() else torch.int64
+            integral = summed_area_table(imgs.permute(0, 3, 1, 2), integral_dtype)
+            w_max = torch.tensor(w, device=device)
+            h_max = torch.tensor(h, device=device)
+            boxes, image_inds, im_data = crop_candidates(
+                integral, boxes, image_inds, w_max, h_max, 24, model_dtype
+            )
+            reg, probs = self.rnet(im_data)
+            boxes, image_inds, mv = rnet_outputs(boxes, image_inds, reg, probs, self.thresholds[1])
+            pick = batched_nms(boxes[:, :4], boxes[:, 4], image_inds, 0.7)
+            boxes = rerec(bbreg(boxes[pick], mv[pick]))
+            image_inds = image_inds[pick]
+
+            # Third stage, ONet
+            if boxes.shape[0] > 0:
+                boxes, image_inds, im_data = crop_candidates(
+                    integral, boxes, image_inds, w_max, h_max, 48, model_dtype
+                )
+                reg, landmarks, probs = self.onet(im_data)
+                boxes, image_inds, points = onet_outputs(
+                    boxes, image_inds, reg, landmarks, probs, self.thresholds[2]
+                )
+                pick = batched_nms_torch(boxes[:, :4], boxes[:, 4], image_inds, 0.7, 'Min')
+                boxes, image_inds, points = boxes[pick], image_inds[pick], points[pick]
+
+        return boxes, points, image_inds
+
+
 class MTCNN(nn.Module):
     """MTCNN face detection module.
 
@@ -172,6 +300,9 @@ class MTCNN(nn.Module):
             dependent on the original image size (this is a bug in davidsandberg/facenet).
             (default: {0})
         min_face_size {int} -- Minimum face size to search for. (default: {20})
+        max_face_size {int} -- Maximum face size to search for. Pyramid levels that can only find
+            larger faces are skipped. If None, faces up to the full image size are searched for.
+            (default: {None})
         thresholds {list} -- MTCNN face detection thresholds (default: {[0.6, 0.7, 0.7]})
         factor {float} -- Factor used to create a scaling pyramid of face sizes. (default: {0.709})
         post_process {bool} -- Whether or not to post process images tensors before returning.
@@ -192,34 +323,128 @@ class MTCNN(nn.Module):
             (default: {False})
         device {torch.device} -- The device on which to run neural net passes. Image tensors and
             models are copied to this device before running forward passes. (default: {None})
+        mosaic {bool} -- If True, all pyramid levels are packed into one mosaic image and PNet
+            runs once per call instead of once per scale. (default: {False})
+        track_interval {int} -- Number of consecutive MTCNN.track() calls served by ONet alone
+            before a full detection is forced. (default: {10})
+        track_threshold {float} -- MTCNN.track() falls back to a full detection when a tracked
+            face's ONet probability drops below this value. (default: {0.9})
+        max_candidates {list} -- Per-image caps on the number of PNet and RNet survivors passed on
+            to the next stage. The highest-scoring candidates after NMS are kept, which bounds
+            the RNet/ONet cost on cluttered images. None means no cap. The number of candidates
+            dropped by the last detection, by MTCNN.detect() or on the last frame finished by
+            MTCNN.stream(), is kept in self.dropped_candidates.
+            (default: {[None, None]})
+        cv2_pyramid {bool} -- If True, uint8 images on the CPU have their scale pyramid built
+            with cv2.resize(INTER_AREA), each level from the previous one, and only the resized
+            levels are converted to float. Falls back to the torch pyramid for other inputs.
+            (default: {False})
+        plan_cache_size {int} -- Number of input shapes whose scale pyramid and preallocated work
+            buffers are kept between MTCNN.detect() calls, least recently used first out. Frames
+            of a fixed size, such as camera frames, then reuse the same buffers every call: the
+            float frame, the integral image and, with mosaic or cv2_pyramid, the pyramid levels.
+            The default torch pyramid still allocates its levels, as interpolate() cannot write
+            into a buffer. Every call overwrites these buffers, so with the cache enabled an MTCNN
+            must not run detections from several threads at once. 0 disables the cache.
+            (default: {0})
+        profile_sink {callable} -- Opt-in instrumentation. If set, every detection records the wall
+            time of each stage, the number of pyramid scales and the number of candidates left
+            after each threshold and NMS step, and passes them as a dict to this callable. Any
+            function works, as do the HistogramSink and JsonLinesSink classes of
+            facenet.models.utils.profiling. None disables profiling. (default: {None})
+        batch_memory_budget {int} -- Bytes the RNet and ONet passes may take at once. Candidates
+            are run in chunks sized from the measured peak memory of one candidate in each
+            network, so that images with many candidates cannot exhaust (GPU) memory. Budgets
+            small enough to split a batch into chunks of less than ~100 candidates may change
+            scores in the last float digits, as BLAS picks its kernels by batch size. None runs
+            fixed chunks of 512 candidates. (default: {None})
+        backend {str} -- 'torch' runs the P-, R- and O-nets as eager PyTorch modules, 'onnx' runs
+            their ONNX graphs on ONNX Runtime's CPU provider (requires onnx and onnxruntime from
+            requirements-onnx.txt, and a CPU device). Missing graphs are exported on first use.
+            (default: {'torch'})
+        onnx_dir {str} -- Directory of the pnet.onnx, rnet.onnx and onet.onnx graphs. If None,
+            the directory of the pretrained weights. (default: {None})
+        quantized {bool or list} -- Load int8 networks saved by
+            facenet.models.utils.quantization.quantize_mtcnn instead of the float ones: True for
+            all three, or a list of names among 'pnet', 'rnet' and 'onet'. Int8 networks only run
+            on the CPU with the torch backend. (default: {False})
+        quantized_dir {str} -- Directory of the pnet_int8.pt, rnet_int8.pt and onet_int8.pt
+            state dicts, the data_dir of quantize_mtcnn. If None, the directory of the pretrained
+            weights. (default: {None})
+        packed_weights {str or PackedWeights} -- File written by
+            facenet.models.utils.packed_weights.pack_weights with 'pnet', 'rnet' and 'onet'
+            entries. The networks then map their weights from it instead of loading the .pt
+            files, sharing page cache pages with other processes.
+            (default: {None})
     """
 
     def __init__(
-        self, image_size=160, margin=0, min_face_size=20,
+        self, image_size=160, margin=0, min_face_size=20, max_face_size=None,
         thresholds=[0.6, 0.7, 0.7], factor=0.709, post_process=True,
-        select_largest=True, selection_method=None, keep_all=False, device=None
+        select_largest=True, selection_method=None, keep_all=False, device=None,
+        mosaic=False, track_interval=10, track_threshold=0.9, max_candidates=[None, None],
+        cv2_pyramid=False, plan_cache_size=0, profile_sink=None, batch_memory_budget=None,
+        backend='torch', onnx_dir=None, quantized=False, quantized_dir=None, packed_weights=None
     ):
         super().__init__()
 
         self.image_size = image_size
         self.margin = margin
         self.min_face_size = min_face_size
+        self.max_face_size = max_face_size
         self.thresholds = thresholds
         self.factor = factor
         self.post_process = post_process
         self.select_largest = select_largest
         self.keep_all = keep_all
         self.selection_method = selection_method
+        self.mosaic = mosaic
+        self.track_interval = track_interval
+        self.track_threshold = track_threshold
+        self.max_candidates = max_candidates
+        self.cv2_pyramid = cv2_pyramid
+        self.plans = PlanCache(plan_cache_size)
+        self.profile_sink = profile_sink
+        self.batch_memory_budget = batch_memory_budget
+        self.dropped_candidates = {'pnet': 0, 'rnet': 0}
+        self.reset_tracking()
+
+        if packed_weights is not None:
+            with torch.device('meta'):
+                self.pnet = PNet(pretrained=False)
+                self.rnet = RNet(pretrained=False)
+                self.onet = ONet(pretrained=False)
+            for name in ('pnet', 'rnet', 'onet'):
+                load_packed(getattr(self, name), packed_weights, name)
+        else:
+            self.pnet = PNet()
+            self.rnet = RNet()
+            self.onet = ONet()
 
-        self.pnet = PNet()
-        self.rnet = RNet()
-        self.onet = ONet()
+        if quantized:
+            if backend != 'torch' or torch.device(device or 'cpu').type != 'cpu':
+                raise ValueError('Quantized networks only run on the CPU with the torch backend')
+            for name in (('pnet', 'rnet', 'onet') if quantized is True else quantized):
+                path = quantized_path(name, quantized_dir)
+                setattr(self, name, load_quantized_net(getattr(self, name), path))
 
         self.device = torch.device('cpu')
         if device is not None:
             self.device = device
             self.to(device)
 
+        self.backend = backend
+        if backend == 'onnx':
+            if torch.device(self.device).type != 'cpu':
+                raise ValueError('The ONNX backend only runs on the CPU')
+            paths = self.onnx_paths(onnx_dir)
+            if not all(os.path.exists(path) for path in paths.values()):
+                self.export_onnx(onnx_dir)
+            for name, path in paths.items():
+                setattr(self, name, OnnxModule(path))
+        elif backend != 'torch':
+            raise ValueError('Unknown backend {}'.format(backend))
+
         if not self.selection_method:
             self.selection_method = 'largest' if self.select_largest else 'probability'
 
@@ -269,7 +494,7 @@ class MTCNN(nn.Module):
         else:
             return faces
 
-    def detect(self, img, landmarks=False):
+    def detect(self, img, landmarks=False, face_size_range=None):
         """Detect all faces in PIL image and return bounding boxes and optional facial landmarks.
  
         This method is used by the forward method and is also useful for face detection tasks
@@ -279,10 +504,15 @@ class MTCNN(nn.Module):
         
         Arguments:
             img {PIL.Image, np.ndarray, or list} -- A PIL image, np.ndarray, torch.Tensor, or list.
+                Images in a list may have different sizes; they are then detected in one pass
+                with a separate scale pyramid per image.
 
         Keyword Arguments:
             landmarks {bool} -- Whether to return facial landmarks in addition to bounding boxes.
                 (default: {False})
+            face_size_range {tuple} -- Optional (min, max) face size in pixels expected in this
+                call, overriding self.min_face_size and self.max_face_size. Either bound may be
+                None to keep the instance setting. (default: {None})
         
         Returns:
             tuple(numpy.ndarray, list) -- For N detected faces, a tuple containing an
@@ -309,14 +539,191 @@ class MTCNN(nn.Module):
         >>> img_draw.save('annotated_faces.png')
         """
 
+        batch_boxes, batch_points = self._detect_face(img, face_size_range)
+
+        return self._format_detections(img, batch_boxes, batch_points, landmarks)
+
+    def detect_flat(self, img, face_size_range=None):
+        """Detect faces like MTCNN.detect(), but return a Detections object of flat arrays.
+
+        The boxes, probabilities and landmarks of all images are concatenated into contiguous
+        arrays, grouped by image and indexed by image_inds and offsets, instead of per-image
+        dtype=object arrays. Within every image, faces are ordered as by MTCNN.detect(). A
+        single image is treated as a batch of one.
+
+        Arguments:
+            img {PIL.Image, np.ndarray, or list} -- A PIL image, np.ndarray, torch.Tensor, or list.
+
+        Keyword Arguments:
+            face_size_range {tuple} -- Same as for MTCNN.detect(). (default: {None})
+
+        Returns:
+            Detections -- Faces found in all images.
+        """
+        boxes, points, image_inds = self._detect_face(img, face_size_range, flat=True)
+
+        if isinstance(img, (list, tuple)):
+            image_sizes = [image_size(im) for im in img]
+        elif isinstance(img, (np.ndarray, torch.Tensor)) and len(img.shape) == 4:
+            image_sizes = [tuple(img.shape[1:3])] * len(img)
+        else:
+            image_sizes = [image_size(img)]
+
+        order = np.argsort(image_inds, kind='stable')
+        detections = Detections(
+            boxes[order, :4], boxes[order, 4], points[order], image_inds[order], image_sizes
+        )
+        if self.select_largest:
+            detections = detections.sort(detections.areas)
+        return detections
+
+    def _detect_face(self, img, face_size_range=None, flat=False):
+        stats = {}
+        profile = self._new_profile()
         with torch.no_grad():
-            batch_boxes, batch_points = detect_face(
-                img, self.min_face_size,
-                self.pnet, self.rnet, self.onet,
-                self.thresholds, self.factor,
-                self.device
-            )
+            proposals = self._propose(img, face_size_range, self.plans, profile)
+            out = self._refine(proposals, stats, flat, profile)
+        self.dropped_candidates = dict(zip(['pnet', 'rnet'], stats['dropped']))
+        if profile is not None:
+            self.profile_sink(profile.as_dict())
+        return out
+
+    def _new_profile(self):
+        if self.profile_sink is None:
+            return None
+        return DetectionProfile(sync=torch.device(self.device).type == 'cuda')
+
+    def _propose(self, img, face_size_range, plans, profile=None):
+        min_face_size, max_face_size = self.min_face_size, self.max_face_size
+        if face_size_range is not None:
+            if face_size_range[0] is not None:
+                min_face_size = face_size_range[0]
+            if face_size_range[1] is not None:
+                max_face_size = face_size_range[1]
+
+        return propose_faces(
+            img, min_face_size, self.pnet, self.thresholds[0], self.factor, self.device,
+            mosaic=self.mosaic, maxsize=max_face_size, max_candidates=self.max_candidates[0],
+            cv2_pyramid=self.cv2_pyramid, plans=plans, profile=profile
+        )
+
+    def _refine(self, proposals, stats=None, flat=False, profile=None):
+        return refine_faces(
+            proposals, self.rnet, self.onet, self.thresholds, self.max_candidates[1], stats, flat,
+            profile, self.batch_memory_budget
+        )
+
+    def script(self, path=None):
+        """Compile the detection cascade with TorchScript.
 
+        Keyword Arguments:
+            path {str} -- If given, the compiled module is also saved to this file, for use with
+                torch.jit.load(). (default: {None})
+
+        Returns:
+            torch.jit.ScriptModule -- MTCNNCascade compiled with torch.jit.script.
+        """
+        if self.backend != 'torch':
+            raise ValueError('Only the torch backend can be compiled with TorchScript')
+        # The compiled cascade calls torch.ops.torchvision.nms, which must be registered by then
+        import_torchvision()
+        cascade = torch.jit.script(MTCNNCascade(
+            self.pnet, self.rnet, self.onet, self.min_face_size, self.thresholds, self.factor,
+            self.max_face_size
+        ))
+        if path is not None:
+            cascade.save(path)
+        return cascade
+
+    @staticmethod
+    def onnx_paths(onnx_dir=None):
+        if onnx_dir is None:
+            onnx_dir = os.path.join(os.path.dirname(__file__), '../data')
+        return {name: os.path.join(onnx_dir, name + '.onnx') for name in ONNX_GRAPHS}
+
+    def export_onnx(self, onnx_dir=None):
+        """Export the P-, R- and O-nets to ONNX graphs with a dynamic batch dimension (and
+        dynamic image size for PNet), checking them against the eager networks.
+
+        Keyword Arguments:
+            onnx_dir {str} -- Output directory. If None, the directory of the pretrained weights.
+                (default: {None})
+
+        Returns:
+            dict -- Path of the graph of every network.
+        """
+        paths = self.onnx_paths(onnx_dir)
+        for name, (shape, output_names, dynamic_axes) in ONNX_GRAPHS.items():
+            net = getattr(self, name)
+            if isinstance(net, OnnxModule):
+                raise ValueError('Networks must be eager PyTorch modules to be exported')
+            sample = torch.rand(shape, device=self.device) * 2 - 1
+            export_onnx(net.eval(), sample, paths[name], output_names, dynamic_axes)
+        return paths
+
+    def stream(self, depth=2, landmarks=False):
+        """Create a StreamingDetector that pipelines detection over consecutive frames.
+
+        Keyword Arguments:
+            depth {int} -- Maximum number of frames in flight. (default: {2})
+            landmarks {bool} -- Whether results include facial landmarks. (default: {False})
+
+        Returns:
+            StreamingDetector -- Detector with submit() and results() methods.
+        """
+        return StreamingDetector(self, depth, landmarks)
+
+    def track(self, img, prev_boxes=None, landmarks=False):
+        """Detect faces in a video frame by refreshing the previous frame's boxes with ONet only.
+
+        The previous boxes are grown and passed straight to ONet, skipping the PNet pyramid and
+        RNet. A full MTCNN.detect() is run instead on the first frame, every
+        self.track_interval frames, and whenever a tracked face is lost or its probability drops
+        below self.track_threshold. Only single images are supported.
+
+        Arguments:
+            img {PIL.Image, np.ndarray} -- A single video frame.
+
+        Keyword Arguments:
+            prev_boxes {np.ndarray} -- Nx4 array of face boxes in the previous frame. If None,
+                the boxes found by the previous call to this method are used. (default: {None})
+            landmarks {bool} -- Whether to return facial landmarks in addition to bounding boxes.
+                (default: {False})
+
+        Returns:
+            tuple -- Same as MTCNN.detect().
+        """
+        if prev_boxes is None:
+            prev_boxes = self.track_boxes
+
+        self.track_count += 1
+        detections = None
+        if prev_boxes is not None and len(prev_boxes) > 0 and self.track_count < self.track_interval:
+            with torch.no_grad():
+                batch_boxes, batch_points = track_face(
+                    img, [prev_boxes], self.onet, self.thresholds[2], self.device,
+                    memory_budget=self.batch_memory_budget
+                )
+            boxes = batch_boxes[0]
+            if len(boxes) == len(prev_boxes) and boxes[:, 4].min() >= self.track_threshold:
+                detections = self._format_detections(img, batch_boxes, batch_points, True)
+
+        if detections is None:
+            self.track_count = 0
+            detections = self.detect(img, landmarks=True)
+
+        self.track_boxes = detections[0]
+        if landmarks:
+            return detections
+
+        return detections[:2]
+
+    def reset_tracking(self):
+        """Forget the boxes kept by MTCNN.track(), e.g. when a new video stream starts."""
+        self.track_boxes = None
+        self.track_count = 0
+
+    def _format_detections(self, img, batch_boxes, batch_points, landmarks):
         boxes, probs, points = [], [], []
         for box, point in zip(batch_boxes, batch_points):
             box = np.array(box)
@@ -517,3 +924,92 @@ def prewhiten(x):
     y = (x - mean) / std_adj
     return y
 
+
+
+class StreamingDetector(object):
+    """Pipelined MTCNN face detection over a stream of frames.
+
+    Detection is split in two stages, PNet on one side and RNet/ONet on the other, each run by its
+    own worker thread. While frame N is in RNet/ONet, frame N + 1 is already going through PNet,
+    so the small tensors of one stage no longer leave the CPU idle during the other. This trades
+    up to one frame of extra latency for throughput. Results come out in submission order and
+    are identical to MTCNN.detect() on the same frames.
+
+    Frames are not copied: a frame must not be modified until its result has been returned.
+    Use MTCNN.stream() to create one, and close() (or a `with` block) to stop the workers.
+
+    Arguments:
+        mtcnn {MTCNN} -- Detector whose networks and settings are used.
+
+    Keyword Arguments:
+        depth {int} -- Maximum number of frames in flight. submit() waits for the oldest frame to
+            finish once this many are pending. (default: {2})
+        landmarks {bool} -- Whether results include facial landmarks, as for MTCNN.detect().
+            (default: {False})
+
+    Example:
+    >>> with mtcnn.stream() as stream:
+    ...     for frame in frames:
+    ...         stream.submit(frame)
+    ...         for boxes, probs in stream.results():
+    ...             draw(boxes)
+    ...     for boxes, probs in stream.results(wait=True):
+    ...         draw(boxes)
+    """
+
+    def __init__(self, mtcnn, depth=2, landmarks=False):
+        self.mtcnn = mtcnn
+        self.depth = depth
+        self.landmarks = landmarks
+        # The plans' work buffers must not be shared with MTCNN.detect() calls on other threads
+        self.plans = PlanCache(mtcnn.plans.maxsize)
+        self._propose = ThreadPoolExecutor(max_workers=1)
+        self._refine = ThreadPoolExecutor(max_workers=1)
+        self._pending = deque()
+        self._done = deque()
+
+    def submit(self, img, face_size_range=None):
+        """Queue a frame (or batch) accepted by MTCNN.detect() for detection."""
+        while len(self._pending) >= self.depth:
+            self._done.append(self._pending.popleft().result())
+        proposals = self._propose.submit(self._propose_stage, img, face_size_range)
+        self._pending.append(self._refine.submit(self._refine_stage, img, proposals))
+
+    def results(self, wait=False):
+        """Yield the results of finished frames in submission order.
+
+        Keyword Arguments:
+            wait {bool} -- If True, also wait for every frame still in flight. (default: {False})
+        """
+        while self._done:
+            yield self._done.popleft()
+        while self._pending and (wait or self._pending[0].done()):
+            yield self._pending.popleft().result()
+
+    def close(self):
+        self._propose.shutdown()
+        self._refine.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _propose_stage(self, img, face_size_range):
+        profile = self.mtcnn._new_profile()
+        with torch.no_grad():
+            return self.mtcnn._propose(img, face_size_range, self.plans, profile), profile
+
+    def _refine_stage(self, img, proposals):
+        proposals, profile = proposals.result()
+        if profile is not None:
+            # Time spent queued behind the previous frame is not charged to any stage
+            profile.start()
+        stats = {}
+        with torch.no_grad():
+            batch_boxes, batch_points = self.mtcnn._refine(proposals, stats, profile=profile)
+        self.mtcnn.dropped_candidates = dict(zip(['pnet', 'rnet'], stats['dropped']))
+        if profile is not None:
+            self.mtcnn.profile_sink(profile.as_dict())
+        return self.mtcnn._format_detections(img, batch_boxes, batch_points, self.landmarks)
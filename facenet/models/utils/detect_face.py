@@ -1,11 +1,12 @@
 import torch
 from torch.nn.functional import interpolate
-from torchvision.transforms import functional as F
-from torchvision.ops.boxes import batched_nms
 from PIL import Image
 import numpy as np
 import os
 import math
+import weakref
+from collections import OrderedDict, namedtuple
+from typing import List, Optional
 
 # OpenCV is optional, but required if using numpy arrays instead of PIL
 try:
@@ -13,19 +14,98 @@ try:
 except:
     pass
 
-def fixed_batch_process(im_data, model):
-    batch_size = 512
-    out = []
+# Blank border (in pixels) left between pyramid levels packed into a mosaic, so that no PNet
+# window read back from the mosaic straddles two levels.
+MOSAIC_GUARD = 12
+
+# Chunk size of fixed_batch_process when no memory budget is given
+BATCH_SIZE = 512
+
+# Peak bytes per input and output shapes of every RNet/ONet seen by probe_model, by input shape
+# and dtype
+_candidate_bytes = weakref.WeakKeyDictionary()
+
+def probe_model(model, im_data):
+    """Peak bytes per input and (shape, dtype) of every output of model on inputs like im_data.
+
+    Measured once, with forward hooks on a single zero input, and cached per model, input shape
+    and dtype.
+    """
+    key = (tuple(im_data.shape[1:]), im_data.dtype, im_data.device)
+    cache = _candidate_bytes.setdefault(model, {})
+    if key not in cache:
+        peak = [0]
+
+        def nbytes(tensors):
+            if isinstance(tensors, torch.Tensor):
+                tensors = (tensors,)
+            return sum(t.numel() * t.element_size() for t in tensors if isinstance(t, torch.Tensor))
+
+        def hook(module, inputs, output):
+            peak[0] = max(peak[0], nbytes(inputs) + nbytes(output))
+
+        handles = [m.register_forward_hook(hook) for m in model.modules() if m is not model]
+        try:
+            with torch.no_grad():
+                out = model(im_data.new_zeros((1,) + key[0]))
+        finally:
+            for handle in handles:
+                handle.remove()
+        cache[key] = peak[0] + nbytes(out), [(o.shape[1:], o.dtype) for o in out]
+    return cache[key]
+
+def candidate_bytes(model, im_data):
+    """Peak memory one input of im_data takes in a forward pass of model, in bytes.
+
+    This is the largest input plus output of any layer, plus the outputs kept for every candidate.
+    """
+    return probe_model(model, im_data)[0]
+
+def empty_outputs(model, im_data):
+    """Outputs of model for an empty batch of inputs like those of im_data."""
+    specs = probe_model(model, im_data)[1]
+    return tuple(im_data.new_empty((0,) + shape, dtype=dtype) for shape, dtype in specs)
+
+def parameter_dtype(model):
+    """dtype of the parameters of model, float32 for models without any (e.g. ONNX Runtime)."""
+    param = next(model.parameters(), None)
+    return torch.float32 if param is None else param.dtype
+
+def fixed_batch_process(im_data, model, memory_budget=None):
+    """Run model on im_data in chunks, to bound the memory of the RNet and ONet stages.
+
+    Chunks hold BATCH_SIZE inputs, or as many as fit in memory_budget bytes according to
+    candidate_bytes(). Chunk outputs are copied into one output tensor per model output, allocated
+    once the first chunk has run, instead of being concatenated at the end. An empty im_data gives
+    empty outputs without running model on it.
+    """
+    if len(im_data) == 0:
+        return empty_outputs(model, im_data)
+    if memory_budget is None:
+        batch_size = BATCH_SIZE
+    else:
+        batch_size = max(1, int(memory_budget // candidate_bytes(model, im_data)))
+
+    out = None
     for i in range(0, len(im_data), batch_size):
-        batch = im_data[i:(i+batch_size)]
-        out.append(model(batch))
+        batch_out = model(im_data[i:(i+batch_size)])
+        if len(im_data) <= batch_size:
+            return batch_out
+        if out is None:
+            out = tuple(o.new_empty((len(im_data),) + o.shape[1:]) for o in batch_out)
+        for o, b in zip(out, batch_out):
+            o[i:(i + len(b))] = b
 
-    return tuple(torch.cat(v, dim=0) for v in zip(*out))
+    return out
 
-def detect_face(imgs, minsize, pnet, rnet, onet, threshold, factor, device):
+def load_images(imgs, device):
+    """Convert a PIL image, np.ndarray, torch.Tensor, or list of them to a (B, H, W, C) tensor."""
     if isinstance(imgs, (np.ndarray, torch.Tensor)):
         if isinstance(imgs,np.ndarray):
-            imgs = torch.as_tensor(imgs.copy(), device=device)
+            # Only copy arrays torch cannot wrap as they are (e.g. flipped or read-only views)
+            if not (imgs.flags.c_contiguous and imgs.flags.writeable):
+                imgs = imgs.copy()
+            imgs = torch.as_tensor(imgs, device=device)
 
         if isinstance(imgs,torch.Tensor):
             imgs = torch.as_tensor(imgs, device=device)
@@ -38,136 +118,417 @@ def detect_face(imgs, minsize, pnet, rnet, onet, threshold, factor, device):
         if any(img.size != imgs[0].size for img in imgs):
             raise Exception("MTCNN batch processing only compatible with equal-dimension images.")
         imgs = np.stack([np.uint8(img) for img in imgs])
-        imgs = torch.as_tensor(imgs.copy(), device=device)
+        imgs = torch.as_tensor(imgs, device=device)
 
-    
+    return imgs
 
-    model_dtype = next(pnet.parameters()).dtype
-    imgs = imgs.permute(0, 3, 1, 2).type(model_dtype)
 
-    batch_size = len(imgs)
-    h, w = imgs.shape[2:4]
+def image_size(img):
+    """(height, width) of a PIL image or of an (H, W, C) np.ndarray or torch.Tensor."""
+    if isinstance(img, (np.ndarray, torch.Tensor)):
+        return tuple(img.shape[:2])
+    return img.size[::-1]
+
+
+def load_mixed_images(imgs, device):
+    """Zero-pad a list of differently sized images into a single (B, H, W, C) tensor.
+
+    Images are anchored at the top-left corner, so pixel coordinates in the batch are those of
+    the original images. Returns the batch and the (height, width) of every image.
+    """
+    imgs = [load_images(img, device)[0] for img in imgs]
+    sizes = [tuple(img.shape[:2]) for img in imgs]
+    batch = imgs[0].new_zeros(
+        (len(imgs), max(h for h, _ in sizes), max(w for _, w in sizes), imgs[0].shape[2])
+    )
+    for k, (img, (h, w)) in enumerate(zip(imgs, sizes)):
+        batch[k, :h, :w] = img
+    return batch, sizes
+
+
+def compute_scales(
+    h: int, w: int, minsize: float, factor: float, maxsize: Optional[float] = None
+) -> List[float]:
+    """Scale pyramid for PNet, which finds faces of about 12 / scale pixels at each level.
+
+    Levels stop once the image is smaller than a PNet window or, if maxsize is given, after the
+    first level whose face size reaches maxsize.
+    """
     m = 12.0 / minsize
-    minl = min(h, w)
-    minl = minl * m
+    minl = min(h, w) * m
 
-    # Create scale pyramid
     scale_i = m
-    scales = []
+    scales: List[float] = []
     while minl >= 12:
         scales.append(scale_i)
+        if maxsize is not None and 12.0 / scale_i >= maxsize:
+            break
         scale_i = scale_i * factor
         minl = minl * factor
 
-    # First stage
-    boxes = []
-    image_inds = []
+    return scales
 
-    scale_picks = []
 
-    all_i = 0
-    offset = 0
-    for scale in scales:
-        im_data = imresample(imgs, (int(h * scale + 1), int(w * scale + 1)))
-        im_data = (im_data - 127.5) * 0.0078125
-        reg, probs = pnet(im_data)
-    
-        boxes_scale, image_inds_scale = generateBoundingBox(reg, probs[:, 1], scale, threshold[0])
-        boxes.append(boxes_scale)
-        image_inds.append(image_inds_scale)
+class DetectionPlan(object):
+    """Shape-specific state of detect_face that is reused across calls on same-sized inputs.
+
+    Holds the scale pyramid, the size of every level, the mosaic layout and named work buffers
+    that are allocated on first use. Buffers are overwritten by every call, so a plan must not be
+    shared by two detections running at the same time.
+    """
 
-        pick = batched_nms(boxes_scale[:, :4], boxes_scale[:, 4], image_inds_scale, 0.5)
-        scale_picks.append(pick + offset)
-        offset += boxes_scale.shape[0]
+    def __init__(self, h, w, minsize, factor, maxsize=None):
+        self.scales = compute_scales(h, w, minsize, factor, maxsize)
+        self.sizes = [(int(h * scale + 1), int(w * scale + 1)) for scale in self.scales]
+        self.buffers = {}
+        self._mosaic = None
+
+    def buffer(self, name, shape, dtype, device):
+        """Zero-initialized buffer, reallocated only if its shape or dtype changes, or if it was
+        allocated under torch.inference_mode() and cannot be written to outside of it."""
+        shape = torch.Size(shape)
+        buf = self.buffers.get(name)
+        if (
+            buf is None or buf.shape != shape or buf.dtype != dtype
+            or (buf.is_inference() and not torch.is_inference_mode_enabled())
+        ):
+            buf = torch.zeros(shape, dtype=dtype, device=device)
+            self.buffers[name] = buf
+        return buf
+
+    def mosaic_layout(self, device):
+        """Level offsets, canvas size and PNet level map of the mosaic, computed once."""
+        if self._mosaic is None:
+            offsets, canvas_size = pack_mosaic(self.sizes)
+            level_map = mosaic_level_map(self.sizes, offsets, canvas_size, device)
+            self._mosaic = offsets, canvas_size, level_map
+        return self._mosaic
+
+
+class PlanCache(object):
+    """Least-recently-used cache of DetectionPlan objects.
+
+    Cached plans share their buffers between calls, so a cache must only be used by one thread
+    at a time.
+
+    Keyword Arguments:
+        maxsize {int} -- Number of plans (and their buffers) kept alive. 0 disables caching.
+            (default: {0})
+    """
 
-    boxes = torch.cat(boxes, dim=0)
-    image_inds = torch.cat(image_inds, dim=0)
+    def __init__(self, maxsize=0):
+        self.maxsize = maxsize
+        self.plans = OrderedDict()
 
-    scale_picks = torch.cat(scale_picks, dim=0)
+    def get(self, key, h, w, minsize, factor, maxsize=None):
+        plan = self.plans.pop(key, None)
+        if plan is None:
+            plan = DetectionPlan(h, w, minsize, factor, maxsize)
+        if self.maxsize > 0:
+            self.plans[key] = plan
+            while len(self.plans) > self.maxsize:
+                self.plans.popitem(last=False)
+        return plan
 
-    # NMS within each scale + image
-    boxes, image_inds = boxes[scale_picks], image_inds[scale_picks]
+    def clear(self):
+        self.plans.clear()
+
+
+def pyramid_levels(imgs, sizes, outs=None):
+    """Area-resample a (B, C, H, W) float batch to every pyramid size and normalize it.
+
+    If `outs` is given, every level is written into the matching tensor of `outs`.
+    """
+    for k, size in enumerate(sizes):
+        im_data = imresample(imgs, size).sub_(127.5).mul_(0.0078125)
+        if outs is not None:
+            im_data = outs[k].copy_(im_data)
+        yield im_data
+
+
+def pyramid_levels_cv2(frames, sizes, frame_bufs, outs):
+    """Build the pyramid on uint8 (B, H, W, C) frames with cv2 before converting to tensors.
+
+    Each level is resized with INTER_AREA from the previous, already smaller level rather than
+    from full resolution into the uint8 arrays of `frame_bufs`, and only the small level is
+    converted into the matching (B, C, h, w) tensor of `outs` and normalized.
+    """
+    level = frames
+    for (hs, ws), dst, out in zip(sizes, frame_bufs, outs):
+        for frame, frame_dst in zip(level, dst):
+            cv2.resize(frame, (ws, hs), dst=frame_dst, interpolation=cv2.INTER_AREA)
+        level = dst
+        yield out.copy_(torch.from_numpy(dst).permute(0, 3, 1, 2)).sub_(127.5).mul_(0.0078125)
+
+
+def pyramid_first_stage(
+    imgs, minsize, factor, maxsize, pnet, thresh, mosaic, cv2_pyramid, plans, profile=None
+):
+    """PNet stage for a (B, H, W, C) batch of equally sized images.
+
+    Returns the candidate boxes, their image indices and the DetectionPlan used, whose buffers
+    the later stages can reuse.
+    """
+    model_dtype = parameter_dtype(pnet)
+    batch_size, h, w = imgs.shape[:3]
+
+    # Create scale pyramid, reusing the plan of an earlier call on the same input shape
+    if plans is None:
+        plan = DetectionPlan(h, w, minsize, factor, maxsize)
+    else:
+        key = (tuple(imgs.shape), imgs.dtype, model_dtype, str(imgs.device), minsize, factor, maxsize)
+        plan = plans.get(key, h, w, minsize, factor, maxsize)
+    scales = plan.scales
+    if profile is not None:
+        profile.count('scales', len(scales))
+
+    if mosaic:
+        offsets, (canvas_h, canvas_w), level_map = plan.mosaic_layout(imgs.device)
+        canvas = plan.buffer('canvas', (batch_size, 3, canvas_h, canvas_w), model_dtype, imgs.device)
+        outs = [
+            canvas[:, :, oy:(oy + hs), ox:(ox + ws)] for (hs, ws), (oy, ox) in zip(plan.sizes, offsets)
+        ]
+    else:
+        outs = None
+
+    if cv2_pyramid and 'cv2' in globals() and imgs.dtype == torch.uint8 and imgs.device.type == 'cpu':
+        if outs is None:
+            outs = [
+                plan.buffer(('level', k), (batch_size,) + size + (3,), model_dtype, imgs.device)
+                .permute(0, 3, 1, 2)
+                for k, size in enumerate(plan.sizes)
+            ]
+        frame_bufs = [
+            plan.buffer(('frame', k), (batch_size,) + size + (3,), torch.uint8, imgs.device).numpy()
+            for k, size in enumerate(plan.sizes)
+        ]
+        levels = pyramid_levels_cv2(imgs.numpy(), plan.sizes, frame_bufs, outs)
+    else:
+        frame = plan.buffer('frame', imgs.shape, model_dtype, imgs.device).copy_(imgs)
+        levels = pyramid_levels(frame.permute(0, 3, 1, 2), plan.sizes, outs)
+
+    if mosaic:
+        # Consuming the levels writes them into their regions of the canvas
+        for _ in levels:
+            pass
+        if profile is not None:
+            profile.lap('pyramid')
+        boxes, image_inds = mosaic_first_stage(
+            canvas, level_map, plan.sizes, offsets, scales, pnet, thresh, profile
+        )
+    else:
+        boxes = []
+        image_inds = []
+
+        scale_picks = []
+
+        all_i = 0
+        offset = 0
+        for scale, im_data in zip(scales, levels):
+            if profile is not None:
+                profile.lap('pyramid')
+            reg, probs = pnet(im_data)
+        
+            boxes_scale, image_inds_scale = generateBoundingBox(reg, probs[:, 1], scale, thresh)
+            boxes.append(boxes_scale)
+            image_inds.append(image_inds_scale)
+
+            pick = batched_nms(boxes_scale[:, :4], boxes_scale[:, 4], image_inds_scale, 0.5)
+            scale_picks.append(pick + offset)
+            offset += boxes_scale.shape[0]
+            if profile is not None:
+                profile.lap('pnet')
+
+        boxes = torch.cat(boxes, dim=0)
+        image_inds = torch.cat(image_inds, dim=0)
+
+        scale_picks = torch.cat(scale_picks, dim=0)
+
+        # NMS within each scale + image
+        if profile is not None:
+            profile.count('pnet_threshold', len(boxes))
+            profile.count('pnet_scale_nms', len(scale_picks))
+        boxes, image_inds = boxes[scale_picks], image_inds[scale_picks]
+
+    return boxes, image_inds, plan
+
+
+# PNet-stage output of a batch, consumed by refine_faces
+Proposals = namedtuple(
+    'Proposals', ['raw_imgs', 'boxes', 'image_inds', 'plan', 'w', 'h', 'image_sizes', 'dropped']
+)
+
+
+def detect_face(
+    imgs, minsize, pnet, rnet, onet, threshold, factor, device, mosaic=False, maxsize=None,
+    max_candidates=(None, None), stats=None, cv2_pyramid=False, plans=None, flat=False,
+    profile=None, memory_budget=None
+):
+    proposals = propose_faces(
+        imgs, minsize, pnet, threshold[0], factor, device, mosaic, maxsize, max_candidates[0],
+        cv2_pyramid, plans, profile
+    )
+    return refine_faces(
+        proposals, rnet, onet, threshold, max_candidates[1], stats, flat, profile, memory_budget
+    )
+
+
+def propose_faces(
+    imgs, minsize, pnet, threshold, factor, device, mosaic=False, maxsize=None,
+    max_candidates=None, cv2_pyramid=False, plans=None, profile=None
+):
+    """First half of detect_face: the PNet stage, NMS and box regression.
+
+    Returns Proposals holding the square candidate boxes and what refine_faces needs to crop them.
+    If a DetectionProfile is given, stage times and candidate counts are recorded in it.
+    """
+    mixed = isinstance(imgs, (list, tuple)) and len(set(image_size(img) for img in imgs)) > 1
+    if mixed:
+        imgs, image_sizes = load_mixed_images(imgs, device)
+    else:
+        imgs = load_images(imgs, device)
+        image_sizes = None
+    dropped = 0
+    if profile is not None:
+        profile.batch_size = len(imgs)
+        profile.lap('load')
 
+    raw_imgs = imgs.permute(0, 3, 1, 2)
+    h, w = raw_imgs.shape[2:4]
+
+    # First stage
+    if mixed:
+        plan = None
+        boxes, image_inds = mixed_first_stage(
+            imgs, image_sizes, minsize, factor, maxsize, pnet, threshold, mosaic, cv2_pyramid, plans,
+            profile
+        )
+        # Boxes are clipped to their own image rather than to the padded batch
+        h = torch.tensor([size[0] for size in image_sizes], device=imgs.device)
+        w = torch.tensor([size[1] for size in image_sizes], device=imgs.device)
+    else:
+        boxes, image_inds, plan = pyramid_first_stage(
+            imgs, minsize, factor, maxsize, pnet, threshold, mosaic, cv2_pyramid, plans, profile
+        )
 
     # NMS within each image
     pick = batched_nms(boxes[:, :4], boxes[:, 4], image_inds, 0.7)
+    if max_candidates is not None:
+        pick, dropped = cap_candidates(pick, boxes[pick, 4], image_inds[pick], max_candidates)
     boxes, image_inds = boxes[pick], image_inds[pick]
 
-    regw = boxes[:, 2] - boxes[:, 0]
-    regh = boxes[:, 3] - boxes[:, 1]
-    qq1 = boxes[:, 0] + boxes[:, 5] * regw
-    qq2 = boxes[:, 1] + boxes[:, 6] * regh
-    qq3 = boxes[:, 2] + boxes[:, 7] * regw
-    qq4 = boxes[:, 3] + boxes[:, 8] * regh
-    boxes = torch.stack([qq1, qq2, qq3, qq4, boxes[:, 4]]).permute(1, 0)
-    boxes = rerec(boxes)
-    y, ey, x, ex = pad(boxes, w, h)
-    
+    boxes = pnet_bbreg(boxes)
+    if profile is not None:
+        profile.count('pnet_nms', len(boxes))
+        profile.lap('pnet_nms')
+
+    return Proposals(raw_imgs, boxes, image_inds, plan, w, h, image_sizes, dropped)
+
+
+def refine_faces(
+    proposals, rnet, onet, threshold, max_candidates=None, stats=None, flat=False, profile=None,
+    memory_budget=None
+):
+    """Second half of detect_face: the RNet and ONet stages on the output of propose_faces."""
+    raw_imgs, boxes, image_inds, plan, w, h, image_sizes, _ = proposals
+    model_dtype = parameter_dtype(rnet)
+    device = boxes.device
+    batch_size = len(raw_imgs)
+    dropped = [proposals.dropped, 0]
+
     # Second stage
     if len(boxes) > 0:
-        im_data = []
-        for k in range(len(y)):
-            if ey[k] > (y[k] - 1) and ex[k] > (x[k] - 1):
-                img_k = imgs[image_inds[k], :, (y[k] - 1):ey[k], (x[k] - 1):ex[k]].unsqueeze(0)
-                im_data.append(imresample(img_k, (24, 24)))
-        im_data = torch.cat(im_data, dim=0)
-        im_data = (im_data - 127.5) * 0.0078125
+        integral = integral_image(raw_imgs, plan, image_sizes)
+        if profile is not None:
+            profile.lap('integral')
+        boxes, image_inds, im_data = crop_candidates(
+            integral, boxes, image_inds, *image_bounds(w, h, image_inds), 24, model_dtype
+        )
+        if profile is not None:
+            profile.lap('rnet_crop')
 
         # This is equivalent to out = rnet(im_data) to avoid GPU out of memory.
-        out = fixed_batch_process(im_data, rnet)
+        out = fixed_batch_process(im_data, rnet, memory_budget)
+        if profile is not None:
+            profile.lap('rnet')
 
-        out0 = out[0].permute(1, 0)
-        out1 = out[1].permute(1, 0)
-        score = out1[1, :]
-        ipass = score > threshold[1]
-        boxes = torch.cat((boxes[ipass, :4], score[ipass].unsqueeze(1)), dim=1)
-        image_inds = image_inds[ipass]
-        mv = out0[:, ipass].permute(1, 0)
+        boxes, image_inds, mv = rnet_outputs(boxes, image_inds, out[0], out[1], threshold[1])
+        num_passed = len(boxes)
 
         # NMS within each image
         pick = batched_nms(boxes[:, :4], boxes[:, 4], image_inds, 0.7)
+        if max_candidates is not None:
+            pick, dropped[1] = cap_candidates(pick, boxes[pick, 4], image_inds[pick], max_candidates)
         boxes, image_inds, mv = boxes[pick], image_inds[pick], mv[pick]
         boxes = bbreg(boxes, mv)
         boxes = rerec(boxes)
+        if profile is not None:
+            profile.count('rnet_threshold', num_passed)
+            profile.count('rnet_nms', len(boxes))
+            profile.lap('rnet_nms')
 
     # Third stage
     points = torch.zeros(0, 5, 2, device=device)
     if len(boxes) > 0:
-        y, ey, x, ex = pad(boxes, w, h)
-        im_data = []
-        for k in range(len(y)):
-            if ey[k] > (y[k] - 1) and ex[k] > (x[k] - 1):
-                img_k = imgs[image_inds[k], :, (y[k] - 1):ey[k], (x[k] - 1):ex[k]].unsqueeze(0)
-                im_data.append(imresample(img_k, (48, 48)))
-        im_data = torch.cat(im_data, dim=0)
-        im_data = (im_data - 127.5) * 0.0078125
-        
-        # This is equivalent to out = onet(im_data) to avoid GPU out of memory.
-        out = fixed_batch_process(im_data, onet)
-
-        out0 = out[0].permute(1, 0)
-        out1 = out[1].permute(1, 0)
-        out2 = out[2].permute(1, 0)
-        score = out2[1, :]
-        points = out1
-        ipass = score > threshold[2]
-        points = points[:, ipass]
-        boxes = torch.cat((boxes[ipass, :4], score[ipass].unsqueeze(1)), dim=1)
-        image_inds = image_inds[ipass]
-        mv = out0[:, ipass].permute(1, 0)
-
-        w_i = boxes[:, 2] - boxes[:, 0] + 1
-        h_i = boxes[:, 3] - boxes[:, 1] + 1
-        points_x = w_i.repeat(5, 1) * points[:5, :] + boxes[:, 0].repeat(5, 1) - 1
-        points_y = h_i.repeat(5, 1) * points[5:10, :] + boxes[:, 1].repeat(5, 1) - 1
-        points = torch.stack((points_x, points_y)).permute(2, 1, 0)
-        boxes = bbreg(boxes, mv)
+        boxes, image_inds, points = onet_stage(
+            integral, boxes, image_inds, onet, threshold[2], w, h, profile, memory_budget
+        )
+
+    if stats is not None:
+        stats['dropped'] = dropped
+
+    if flat:
+        out = boxes.cpu().numpy(), points.cpu().numpy(), image_inds.cpu().numpy()
+    else:
+        out = split_by_image(boxes, points, image_inds, batch_size)
+    if profile is not None:
+        profile.lap('output')
+    return out
+
+
+def cap_candidates(pick, scores, image_inds, k):
+    """Keep at most the k highest-scoring entries of `pick` per image, preserving their order.
+
+    Returns the capped indices and the number of candidates dropped.
+    """
+    order = scores.argsort(descending=True)
+    order = order[image_inds[order].argsort(stable=True)]
+    sorted_inds = image_inds[order]
+    counts = torch.bincount(sorted_inds)
+    starts = counts.cumsum(0) - counts
+    rank = torch.arange(len(order), device=order.device) - starts[sorted_inds]
+    keep = order[rank < k].sort()[0]
+    return pick[keep], len(pick) - len(keep)
+
+
+def onet_stage(
+    integral, boxes, image_inds, onet, thresh, w, h, profile=None, memory_budget=None
+):
+    """Run ONet on square candidate boxes and return refined boxes, image indices and landmarks."""
+    boxes, image_inds, im_data = crop_candidates(
+        integral, boxes, image_inds, *image_bounds(w, h, image_inds), 48, parameter_dtype(onet)
+    )
+    if profile is not None:
+        profile.lap('onet_crop')
+    
+    # This is equivalent to out = onet(im_data) to avoid GPU out of memory.
+    out = fixed_batch_process(im_data, onet, memory_budget)
+    if profile is not None:
+        profile.lap('onet')
+
+    boxes, image_inds, points = onet_outputs(boxes, image_inds, out[0], out[1], out[2], thresh)
+
+    # NMS within each image using "Min" strategy
+    # pick = batched_nms(boxes[:, :4], boxes[:, 4], image_inds, 0.7)
+    pick = batched_nms_torch(boxes[:, :4], boxes[:, 4], image_inds, 0.7, 'Min')
+    if profile is not None:
+        profile.count('onet_threshold', len(boxes))
+        profile.count('onet_nms', len(pick))
+        profile.lap('onet_nms')
+    return boxes[pick], image_inds[pick], points[pick]
 
-        # NMS within each image using "Min" strategy
-        # pick = batched_nms(boxes[:, :4], boxes[:, 4], image_inds, 0.7)
-        pick = batched_nms_numpy(boxes[:, :4], boxes[:, 4], image_inds, 0.7, 'Min')
-        boxes, image_inds, points = boxes[pick], image_inds[pick], points[pick]
 
+def split_by_image(boxes, points, image_inds, batch_size):
     boxes = boxes.cpu().numpy()
     points = points.cpu().numpy()
 
@@ -185,6 +546,50 @@ def detect_face(imgs, minsize, pnet, rnet, onet, threshold, factor, device):
     return batch_boxes, batch_points
 
 
+def track_face(imgs, prev_boxes, onet, threshold, device, grow=1.1, memory_budget=None):
+    """Refresh face boxes and landmarks from the previous frame's boxes with ONet only.
+
+    Each previous box is grown by `grow` around its center and squared (rerec) so that a face
+    that moved slightly between frames still falls inside the ONet window, then goes through
+    the same ONet stage as detect_face. PNet and RNet are skipped entirely. Boxes that are
+    outside the frame, or empty, are dropped, so fewer boxes than given may be returned.
+
+    Arguments:
+        imgs -- Frame(s) in any format accepted by detect_face.
+        prev_boxes {list} -- For each image, an Nx4 array of boxes from the previous frame.
+        threshold {float} -- ONet score threshold.
+        memory_budget {int} -- Bytes an ONet chunk may take, see fixed_batch_process.
+    """
+    imgs = load_images(imgs, device)
+    raw_imgs = imgs.permute(0, 3, 1, 2)
+    batch_size = len(imgs)
+    h, w = raw_imgs.shape[2:4]
+    model_dtype = parameter_dtype(onet)
+
+    boxes = [torch.as_tensor(np.asarray(b, dtype=np.float32).reshape(-1, 4)) for b in prev_boxes]
+    image_inds = torch.cat([torch.full((len(b),), i, dtype=torch.int64) for i, b in enumerate(boxes)])
+    boxes = torch.cat(boxes).to(device=device, dtype=model_dtype)
+    image_inds = image_inds.to(device)
+
+    points = torch.zeros(0, 5, 2, device=device)
+    if len(boxes) > 0:
+        center = (boxes[:, :2] + boxes[:, 2:]) / 2
+        half = (boxes[:, 2:] - boxes[:, :2]) * (grow / 2)
+        boxes = torch.cat([center - half, center + half, torch.zeros_like(boxes[:, :1])], dim=1)
+        boxes = rerec(boxes)
+        # Boxes that left the frame or have no area leave ONet nothing to look at
+        y, ey, x, ex = pad(boxes, w, h)
+        inside = (ey > (y - 1)) & (ex > (x - 1)) & (boxes[:, 2] > boxes[:, 0])
+        boxes, image_inds = boxes[inside], image_inds[inside]
+    if len(boxes) > 0:
+        integral = integral_image(raw_imgs)
+        boxes, image_inds, points = onet_stage(
+            integral, boxes, image_inds, onet, threshold, w, h, memory_budget=memory_budget
+        )
+
+    return split_by_image(boxes, points, image_inds, batch_size)
+
+
 def bbreg(boundingbox, reg):
     if reg.shape[1] == 1:
         reg = torch.reshape(reg, (reg.shape[2], reg.shape[3]))
@@ -200,7 +605,7 @@ def bbreg(boundingbox, reg):
     return boundingbox
 
 
-def generateBoundingBox(reg, probs, scale, thresh):
+def generateBoundingBox(reg, probs, scale: float, thresh: float):
     stride = 2
     cellsize = 12
 
@@ -211,13 +616,214 @@ def generateBoundingBox(reg, probs, scale, thresh):
     image_inds = mask_inds[:, 0]
     score = probs[mask]
     reg = reg[:, mask].permute(1, 0)
-    bb = mask_inds[:, 1:].type(reg.dtype).flip(1)
+    bb = mask_inds[:, 1:].to(reg.dtype).flip(1)
     q1 = ((stride * bb + 1) / scale).floor()
     q2 = ((stride * bb + cellsize - 1 + 1) / scale).floor()
     boundingbox = torch.cat([q1, q2, score.unsqueeze(1), reg], dim=1)
     return boundingbox, image_inds
 
 
+def pnet_output_size(size):
+    # conv 3x3 -> maxpool 2x2 (ceil) -> conv 3x3 -> conv 3x3
+    return math.ceil((size - 2) / 2) - 4
+
+
+def pack_mosaic(sizes, guard=MOSAIC_GUARD):
+    """Shelf-pack pyramid levels, largest first, into columns of a single canvas.
+
+    Offsets are kept even so that PNet output cells (stride 2) stay aligned with each level.
+    Returns the (y, x) offset of every level and the (height, width) of the canvas.
+    """
+    col_h = sizes[0][0]
+    offsets = []
+    col_x, col_w, y = 0, 0, 0
+    for h, w in sizes:
+        if y > 0 and y + h > col_h:
+            col_x += col_w + guard
+            col_x += col_x % 2
+            col_w, y = 0, 0
+        offsets.append((y, col_x))
+        col_w = max(col_w, w)
+        y += h + guard
+        y += y % 2
+
+    canvas_h = max(oy + h for (oy, _), (h, _) in zip(offsets, sizes)) + guard
+    canvas_w = max(ox + w for (_, ox), (_, w) in zip(offsets, sizes)) + guard
+    return offsets, (canvas_h, canvas_w)
+
+
+def mosaic_level_map(sizes, offsets, canvas_size, device):
+    """Map every PNet output cell of the mosaic canvas to its pyramid level (-1 in the guards)."""
+    canvas_h, canvas_w = canvas_size
+    level_map = torch.full(
+        (pnet_output_size(canvas_h), pnet_output_size(canvas_w)), -1,
+        dtype=torch.int64, device=device
+    )
+    for level, ((hs, ws), (oy, ox)) in enumerate(zip(sizes, offsets)):
+        level_map[
+            (oy // 2):(oy // 2 + pnet_output_size(hs)),
+            (ox // 2):(ox // 2 + pnet_output_size(ws))
+        ] = level
+    return level_map
+
+
+def mosaic_edge_cells(canvas, reg, probs, sizes, offsets, pnet):
+    """Recompute, in place, the PNet outputs of the mosaic on the last row and column of levels
+    with an odd height or width.
+
+    There, the ceil-mode 2x2 max pool of PNet reads one guard pixel, where the per-scale loop pools
+    the last level row or column alone. These cells only see the last 11 rows (or columns) of the
+    level, which start at an even offset, so PNet on that strip gives exactly the loop's values.
+    """
+    for (hs, ws), (oy, ox) in zip(sizes, offsets):
+        y, x = oy // 2, ox // 2
+        if hs % 2:
+            strip_reg, strip_probs = pnet(canvas[:, :, (oy + hs - 11):(oy + hs), ox:(ox + ws)])
+            rows = slice(y + pnet_output_size(hs) - 1, y + pnet_output_size(hs))
+            cols = slice(x, x + pnet_output_size(ws))
+            reg[:, :, rows, cols] = strip_reg
+            probs[:, :, rows, cols] = strip_probs
+        if ws % 2:
+            strip_reg, strip_probs = pnet(canvas[:, :, oy:(oy + hs), (ox + ws - 11):(ox + ws)])
+            rows = slice(y, y + pnet_output_size(hs))
+            cols = slice(x + pnet_output_size(ws) - 1, x + pnet_output_size(ws))
+            reg[:, :, rows, cols] = strip_reg
+            probs[:, :, rows, cols] = strip_probs
+
+
+def mosaic_first_stage(canvas, level_map, sizes, offsets, scales, pnet, thresh, profile=None):
+    """PNet stage over all pyramid levels in a single forward pass.
+
+    Every normalized level has been written into its own region of one mosaic canvas, PNet runs
+    once over the canvas, and hits are mapped back to their level through a per-cell level map.
+    Per-scale NMS is done by a single batched_nms call keyed on (image, level).
+    """
+    device = canvas.device
+    reg, probs = pnet(canvas)
+    mosaic_edge_cells(canvas, reg, probs, sizes, offsets, pnet)
+
+    level_offsets = torch.tensor(offsets, dtype=torch.int64, device=device) // 2
+    level_scales = torch.tensor(scales, dtype=reg.dtype, device=device)
+    boxes, image_inds, level_inds = generateBoundingBoxMosaic(
+        reg, probs[:, 1], level_map, level_offsets, level_scales, thresh
+    )
+
+    # NMS within each scale + image
+    pick = batched_nms(boxes[:, :4], boxes[:, 4], image_inds * len(scales) + level_inds, 0.5)
+    if profile is not None:
+        profile.count('pnet_threshold', len(boxes))
+        profile.count('pnet_scale_nms', len(pick))
+        profile.lap('pnet')
+    return boxes[pick], image_inds[pick]
+
+
+def mixed_first_stage(
+    imgs, image_sizes, minsize, factor, maxsize, pnet, thresh, mosaic, cv2_pyramid, plans,
+    profile=None
+):
+    """PNet stage for a zero-padded batch of differently sized images.
+
+    Every image gets its own scale pyramid, built from the image alone exactly as in a
+    single-image call. With `mosaic`, the levels of all images are packed into one canvas and PNet
+    runs once, hits being mapped back to their image and level through the level map. Otherwise
+    each image goes through pyramid_first_stage on its own.
+    """
+    model_dtype = parameter_dtype(pnet)
+    device = imgs.device
+
+    # Images too small for a single PNet window have no levels and yield no candidates
+    boxes = [torch.zeros((0, 9), dtype=model_dtype, device=device)]
+    image_inds = [torch.zeros((0,), dtype=torch.int64, device=device)]
+    if not mosaic:
+        for k, (h, w) in enumerate(image_sizes):
+            if not compute_scales(h, w, minsize, factor, maxsize):
+                continue
+            frame = imgs[k:(k + 1), :h, :w].contiguous()
+            boxes_k, _, _ = pyramid_first_stage(
+                frame, minsize, factor, maxsize, pnet, thresh, False, cv2_pyramid, plans, profile
+            )
+            boxes.append(boxes_k)
+            image_inds.append(torch.full((len(boxes_k),), k, dtype=torch.int64, device=device))
+        return torch.cat(boxes, dim=0), torch.cat(image_inds, dim=0)
+
+    level_images, scales, sizes = [], [], []
+    for k, (h, w) in enumerate(image_sizes):
+        for scale in compute_scales(h, w, minsize, factor, maxsize):
+            level_images.append(k)
+            scales.append(scale)
+            sizes.append((int(h * scale + 1), int(w * scale + 1)))
+    if profile is not None:
+        profile.count('scales', len(sizes))
+    if not sizes:
+        return boxes[0], image_inds[0]
+
+    # Levels are packed tallest first, whichever image they come from
+    order = sorted(range(len(sizes)), key=lambda i: -sizes[i][0])
+    packed, canvas_size = pack_mosaic([sizes[i] for i in order])
+    offsets = [None] * len(sizes)
+    for i, offset in zip(order, packed):
+        offsets[i] = offset
+    level_map = mosaic_level_map(sizes, offsets, canvas_size, device)
+
+    canvas = torch.zeros((1, 3) + canvas_size, dtype=model_dtype, device=device)
+    use_cv2 = cv2_pyramid and 'cv2' in globals() and imgs.dtype == torch.uint8 and device.type == 'cpu'
+    for k, (h, w) in enumerate(image_sizes):
+        inds = [i for i, image in enumerate(level_images) if image == k]
+        image_level_sizes = [sizes[i] for i in inds]
+        outs = [
+            canvas[:, :, oy:(oy + hs), ox:(ox + ws)]
+            for (hs, ws), (oy, ox) in zip(image_level_sizes, [offsets[i] for i in inds])
+        ]
+        frame = imgs[k:(k + 1), :h, :w].contiguous()
+        if use_cv2:
+            frame_bufs = [np.empty((1,) + size + (3,), dtype=np.uint8) for size in image_level_sizes]
+            levels = pyramid_levels_cv2(frame.numpy(), image_level_sizes, frame_bufs, outs)
+        else:
+            levels = pyramid_levels(frame.type(model_dtype).permute(0, 3, 1, 2), image_level_sizes, outs)
+        for _ in levels:
+            pass
+    if profile is not None:
+        profile.lap('pyramid')
+
+    reg, probs = pnet(canvas)
+    mosaic_edge_cells(canvas, reg, probs, sizes, offsets, pnet)
+
+    level_offsets = torch.tensor(offsets, dtype=torch.int64, device=device).view(-1, 2) // 2
+    level_scales = torch.tensor(scales, dtype=reg.dtype, device=device)
+    boxes, _, level_inds = generateBoundingBoxMosaic(
+        reg, probs[:, 1], level_map, level_offsets, level_scales, thresh
+    )
+    image_inds = torch.tensor(level_images, dtype=torch.int64, device=device)[level_inds]
+
+    # NMS within each scale + image
+    pick = batched_nms(boxes[:, :4], boxes[:, 4], level_inds, 0.5)
+    if profile is not None:
+        profile.count('pnet_threshold', len(boxes))
+        profile.count('pnet_scale_nms', len(pick))
+        profile.lap('pnet')
+    return boxes[pick], image_inds[pick]
+
+
+def generateBoundingBoxMosaic(reg, probs, level_map, level_offsets, level_scales, thresh):
+    stride = 2
+    cellsize = 12
+
+    reg = reg.permute(1, 0, 2, 3)
+
+    mask = (probs >= thresh) & (level_map >= 0)
+    mask_inds = mask.nonzero()
+    image_inds = mask_inds[:, 0]
+    score = probs[mask]
+    reg = reg[:, mask].permute(1, 0)
+    level_inds = level_map[mask_inds[:, 1], mask_inds[:, 2]]
+    bb = (mask_inds[:, 1:] - level_offsets[level_inds]).type(reg.dtype).flip(1)
+    scale = level_scales[level_inds].unsqueeze(1)
+    q1 = ((stride * bb + 1) / scale).floor()
+    q2 = ((stride * bb + cellsize - 1 + 1) / scale).floor()
+    boundingbox = torch.cat([q1, q2, score.unsqueeze(1), reg], dim=1)
+    return boundingbox, image_inds, level_inds
+
+
 def nms_numpy(boxes, scores, threshold, method):
     if boxes.size == 0:
         return np.empty((0, 3))
@@ -257,6 +863,26 @@ def nms_numpy(boxes, scores, threshold, method):
     return pick
 
 
+@torch.jit.unused
+def import_torchvision():
+    """Import torchvision, which registers torch.ops.torchvision.nms. It takes about as long as
+    importing torch, so it is done by the first call of batched_nms instead of on import."""
+    import torchvision  # noqa: F401
+
+
+def batched_nms(boxes, scores, idxs, iou_threshold: float):
+    """torchvision.ops.batched_nms: NMS of every idxs value separately, by the same per-index
+    offset strategy as batched_nms_numpy. Indices of kept boxes are sorted by decreasing score."""
+    if not torch.jit.is_scripting():
+        import_torchvision()
+    if boxes.numel() == 0:
+        return torch.empty((0,), dtype=torch.int64, device=boxes.device)
+    max_coordinate = boxes.max()
+    offsets = idxs.to(boxes) * (max_coordinate + 1)
+    boxes_for_nms = boxes + offsets[:, None]
+    return torch.ops.torchvision.nms(boxes_for_nms, scores, iou_threshold)
+
+
 def batched_nms_numpy(boxes, scores, idxs, threshold, method):
     device = boxes.device
     if boxes.numel() == 0:
@@ -274,21 +900,118 @@ def batched_nms_numpy(boxes, scores, idxs, threshold, method):
     return torch.as_tensor(keep, dtype=torch.long, device=device)
 
 
-def pad(boxes, w, h):
-    boxes = boxes.trunc().int().cpu().numpy()
-    x = boxes[:, 0]
-    y = boxes[:, 1]
-    ex = boxes[:, 2]
-    ey = boxes[:, 3]
+def nms_torch(boxes, scores, threshold: float, method: str):
+    """Greedy NMS with the same 'Union'/'Min' overlap and +1 pixel area convention as nms_numpy.
 
-    x[x < 1] = 1
-    y[y < 1] = 1
-    ex[ex > w] = w
-    ey[ey > h] = h
+    The full overlap matrix is computed once up front; the greedy pass then only indexes into
+    it, once per kept box.
+    """
+    if boxes.numel() == 0:
+        return torch.empty((0,), dtype=torch.int64, device=boxes.device)
+
+    x1, y1, x2, y2 = boxes.unbind(1)
+    area = (x2 - x1 + 1) * (y2 - y1 + 1)
+
+    w = (torch.min(x2[:, None], x2[None, :]) - torch.max(x1[:, None], x1[None, :]) + 1).clamp(min=0)
+    h = (torch.min(y2[:, None], y2[None, :]) - torch.max(y1[:, None], y1[None, :]) + 1).clamp(min=0)
+    inter = w * h
+    if method == 'Min':
+        overlap = inter / torch.min(area[:, None], area[None, :])
+    else:
+        overlap = inter / (area[:, None] + area[None, :] - inter)
+    suppress = overlap > threshold
+
+    order = scores.argsort(descending=True)
+    pick: List[torch.Tensor] = []
+    while order.numel() > 0:
+        i = order[0]
+        pick.append(i)
+        order = order[1:]
+        order = order[~suppress[i, order]]
+
+    return torch.stack(pick)
+
+
+def batched_nms_torch(boxes, scores, idxs, threshold: float, method: str):
+    if boxes.numel() == 0:
+        return torch.empty((0,), dtype=torch.int64, device=boxes.device)
+    # Same per-image offset strategy as batched_nms_numpy
+    max_coordinate = boxes.max()
+    offsets = idxs.to(boxes) * (max_coordinate + 1)
+    boxes_for_nms = boxes + offsets[:, None]
+    return nms_torch(boxes_for_nms, scores, threshold, method)
+
+
+def image_bounds(w, h, image_inds):
+    """Width and height to clip boxes to: the batch size, or per box for mixed-size batches."""
+    if isinstance(w, torch.Tensor):
+        return w[image_inds], h[image_inds]
+    return w, h
+
+
+def pad(boxes, w, h):
+    boxes = boxes.trunc().long()
+    x = boxes[:, 0].clamp(min=1)
+    y = boxes[:, 1].clamp(min=1)
+    ex = boxes[:, 2].clamp(max=w)
+    ey = boxes[:, 3].clamp(max=h)
 
     return y, ey, x, ex
 
 
+def crop_candidates(integral, boxes, image_inds, w, h, size: int, dtype: torch.dtype):
+    """Crop square candidate boxes out of the integral image for RNet (size 24) or ONet (48).
+
+    Boxes with no pixel inside their image are dropped. Returns the remaining boxes, their image
+    indices and their crops, resampled to size x size and normalized.
+    """
+    y, ey, x, ex = pad(boxes, w, h)
+    ok = (ey > (y - 1)) & (ex > (x - 1))
+    boxes, image_inds = boxes[ok], image_inds[ok]
+    im_data = crop_resample(integral, image_inds, y[ok], ey[ok], x[ok], ex[ok], [size, size])
+    return boxes, image_inds, im_data.to(dtype).sub_(127.5).mul_(0.0078125)
+
+
+def pnet_bbreg(boxes):
+    """Apply the PNet box regression of (N, 9) candidates and make them square."""
+    regw = boxes[:, 2] - boxes[:, 0]
+    regh = boxes[:, 3] - boxes[:, 1]
+    qq1 = boxes[:, 0] + boxes[:, 5] * regw
+    qq2 = boxes[:, 1] + boxes[:, 6] * regh
+    qq3 = boxes[:, 2] + boxes[:, 7] * regw
+    qq4 = boxes[:, 3] + boxes[:, 8] * regh
+    boxes = torch.stack([qq1, qq2, qq3, qq4, boxes[:, 4]]).permute(1, 0)
+    return rerec(boxes)
+
+
+def rnet_outputs(boxes, image_inds, reg, probs, thresh: float):
+    """Candidates RNet scores above thresh, as (x1, y1, x2, y2, score) boxes, with their image
+    indices and box regression."""
+    score = probs[:, 1]
+    ipass = score > thresh
+    boxes = torch.cat((boxes[ipass, :4], score[ipass].unsqueeze(1)), dim=1)
+    return boxes, image_inds[ipass], reg[ipass]
+
+
+def onet_outputs(boxes, image_inds, reg, landmarks, probs, thresh: float):
+    """Candidates ONet scores above thresh, with their image indices and landmarks, and the box
+    regression applied."""
+    score = probs[:, 1]
+    ipass = score > thresh
+    points = landmarks[ipass].permute(1, 0)
+    boxes = torch.cat((boxes[ipass, :4], score[ipass].unsqueeze(1)), dim=1)
+    image_inds = image_inds[ipass]
+    mv = reg[ipass]
+
+    w_i = boxes[:, 2] - boxes[:, 0] + 1
+    h_i = boxes[:, 3] - boxes[:, 1] + 1
+    points_x = w_i.repeat(5, 1) * points[:5, :] + boxes[:, 0].repeat(5, 1) - 1
+    points_y = h_i.repeat(5, 1) * points[5:10, :] + boxes[:, 1].repeat(5, 1) - 1
+    points = torch.stack((points_x, points_y)).permute(2, 1, 0)
+    boxes = bbreg(boxes, mv)
+    return boxes, image_inds, points
+
+
 def rerec(bboxA):
     h = bboxA[:, 3] - bboxA[:, 1]
     w = bboxA[:, 2] - bboxA[:, 0]
@@ -301,11 +1024,89 @@ def rerec(bboxA):
     return bboxA
 
 
-def imresample(img, sz):
+def imresample(img, sz: List[int]):
     im_data = interpolate(img, size=sz, mode="area")
     return im_data
 
 
+def integral_image(imgs, plan=None, sizes=None):
+    """Summed-area table of a (B, C, H, W) batch, zero-padded to (B, H + 1, W + 1, C).
+
+    Integer images are accumulated in int32 (int64 if a frame could overflow it) and float
+    images in float64, so that box sums over a full frame stay exact. If a DetectionPlan is
+    given, the table is built in its preallocated buffers. For a zero-padded batch of mixed-size
+    images, `sizes` gives the (height, width) of every image and only that area is summed.
+    """
+    batch_size, channels, h, w = imgs.shape
+    if imgs.is_floating_point():
+        dtype = torch.float64
+    elif torch.iinfo(imgs.dtype).max * h * w < 2 ** 31:
+        dtype = torch.int32
+    else:
+        dtype = torch.int64
+    if sizes is not None:
+        integral = imgs.new_zeros((batch_size, h + 1, w + 1, channels), dtype=dtype)
+        for k, (hk, wk) in enumerate(sizes):
+            rows = imgs[k, :, :hk, :wk].permute(1, 2, 0).to(dtype, copy=True)
+            integral[k, 1:(hk + 1), 1:(wk + 1)] = rows.cumsum_(0).cumsum_(1)
+        return integral
+    if plan is None:
+        return summed_area_table(imgs, dtype)
+    integral = plan.buffer('integral', (batch_size, h + 1, w + 1, channels), dtype, imgs.device)
+    rows = plan.buffer('rows', (batch_size, h, w, channels), dtype, imgs.device)
+    rows.copy_(imgs.permute(0, 2, 3, 1))
+    torch.cumsum(rows.cumsum_(1), 2, out=integral[:, 1:, 1:])
+    return integral
+
+
+def summed_area_table(imgs, dtype: torch.dtype):
+    """integral_image of a (B, C, H, W) batch accumulated in `dtype`, in a new tensor."""
+    shape = imgs.shape
+    integral = imgs.new_zeros((shape[0], shape[2] + 1, shape[3] + 1, shape[1]), dtype=dtype)
+    rows = imgs.permute(0, 2, 3, 1).to(dtype, copy=True)
+    torch.cumsum(rows.cumsum_(1), 2, out=integral[:, 1:, 1:])
+    return integral
+
+
+def crop_resample(integral, image_inds, y, ey, x, ex, sz: List[int]):
+    """Crop boxes (in `pad` coordinates) out of their images and resample them to `sz`.
+
+    Equivalent to running `imresample` on each `imgs[k, :, (y - 1):ey, (x - 1):ex]` crop, but
+    all boxes are handled at once: every output cell is the mean over the same adaptive bin
+    used by area interpolation, read from the integral image with four gathers.
+    """
+    oh, ow = sz[0], sz[1]
+    y0, x0 = y - 1, x - 1
+    rows = torch.arange(oh + 1, device=y.device)
+    cols = torch.arange(ow + 1, device=x.device)
+    hc = (ey - y0).unsqueeze(1)
+    wc = (ex - x0).unsqueeze(1)
+    # Area bins: [floor(i * n / out), ceil((i + 1) * n / out))
+    rs = y0.unsqueeze(1) + (rows[:-1] * hc) // oh
+    re = y0.unsqueeze(1) - (-(rows[1:] * hc) // oh)
+    cs = x0.unsqueeze(1) + (cols[:-1] * wc) // ow
+    ce = x0.unsqueeze(1) - (-(cols[1:] * wc) // ow)
+
+    # Gather the four corners of every bin from the flattened integral image
+    ih, iw, channels = integral.shape[1], integral.shape[2], integral.shape[3]
+    flat = integral.reshape(-1, channels)
+    base = image_inds.view(-1, 1, 1) * (ih * iw)
+    rs, re = rs.unsqueeze(2), re.unsqueeze(2)
+    cs, ce = cs.unsqueeze(1), ce.unsqueeze(1)
+
+    total = (
+        integral_corner(flat, base, re, ce, iw) - integral_corner(flat, base, rs, ce, iw) -
+        integral_corner(flat, base, re, cs, iw) + integral_corner(flat, base, rs, cs, iw)
+    )
+    area = ((re - rs) * (ce - cs)).view(-1, 1)
+
+    return (total / area).view(-1, oh, ow, channels).permute(0, 3, 1, 2)
+
+
+def integral_corner(flat, base, r, c, iw: int):
+    return flat.index_select(0, (base + r * iw + c).view(-1))
+
+
 def crop_resize(img, box, image_size):
     if isinstance(img, np.ndarray):
         img = img[box[1]:box[3], box[0]:box[2]]
@@ -373,6 +1174,9 @@ def extract_face(img, box, image_size=160, margin=0, save_path=None):
         os.makedirs(os.path.dirname(save_path) + "/", exist_ok=True)
         save_img(face, save_path)
 
+    # torchvision is only imported by the few callers that extract faces this way
+    from torchvision.transforms import functional as F
+
     face = F.to_tensor(np.float32(face))
 
     return face
@@ -0,0 +1,129 @@
+import numpy as np
+
+
+class Detections(object):
+    """Face detections of a batch of images stored as flat arrays.
+
+    Faces of all images are kept in contiguous arrays grouped by image, in CSR fashion: the faces
+    of image i are rows offsets[i]:offsets[i + 1]. Filtering, selection and padding run over the
+    whole batch at once instead of looping over per-image arrays.
+
+    Arguments:
+        boxes {np.ndarray} -- Nx4 array of (x1, y1, x2, y2) boxes.
+        probs {np.ndarray} -- Length N array of detection probabilities.
+        landmarks {np.ndarray} -- Nx5x2 array of facial landmarks.
+        image_inds {np.ndarray} -- Length N array with the batch index of the image of every face.
+            Must be sorted.
+        image_sizes {np.ndarray} -- Bx2 array with the (height, width) of every image.
+    """
+
+    def __init__(self, boxes, probs, landmarks, image_inds, image_sizes):
+        self.boxes = np.ascontiguousarray(boxes, dtype=np.float32).reshape(-1, 4)
+        self.probs = np.ascontiguousarray(probs, dtype=np.float32).reshape(-1)
+        self.landmarks = np.ascontiguousarray(landmarks, dtype=np.float32).reshape(-1, 5, 2)
+        self.image_inds = np.ascontiguousarray(image_inds, dtype=np.int64).reshape(-1)
+        self.image_sizes = np.asarray(image_sizes, dtype=np.int64).reshape(-1, 2)
+        counts = np.bincount(self.image_inds, minlength=self.num_images)
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    @classmethod
+    def from_batch(cls, batch_boxes, batch_points, image_sizes):
+        """Build from the per-image Nx5 box (with probability) and Nx5x2 landmark arrays of
+        detect_face."""
+        counts = [len(boxes) for boxes in batch_boxes]
+        boxes = np.concatenate([np.reshape(b, (-1, 5)) for b in batch_boxes] + [np.zeros((0, 5))])
+        landmarks = np.concatenate(
+            [np.reshape(p, (-1, 5, 2)) for p in batch_points] + [np.zeros((0, 5, 2))]
+        )
+        image_inds = np.repeat(np.arange(len(counts)), counts)
+        return cls(boxes[:, :4], boxes[:, 4], landmarks, image_inds, image_sizes)
+
+    @property
+    def num_images(self):
+        return len(self.image_sizes)
+
+    @property
+    def counts(self):
+        """Number of faces in every image."""
+        return np.diff(self.offsets)
+
+    @property
+    def areas(self):
+        return (self.boxes[:, 2] - self.boxes[:, 0]) * (self.boxes[:, 3] - self.boxes[:, 1])
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def __getitem__(self, i):
+        """Boxes, probabilities and landmarks of image i."""
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.boxes[start:end], self.probs[start:end], self.landmarks[start:end]
+
+    def take(self, inds):
+        """Detections restricted to the faces at `inds`, which must keep them grouped by image."""
+        return Detections(
+            self.boxes[inds], self.probs[inds], self.landmarks[inds], self.image_inds[inds],
+            self.image_sizes
+        )
+
+    def filter(self, min_prob):
+        """Detections with probability above min_prob."""
+        return self.take(np.flatnonzero(self.probs > min_prob))
+
+    def order(self, key):
+        """Face indices sorted by image, then by descending key, ties kept in their current order."""
+        return np.lexsort((np.arange(len(self)), -np.asarray(key), self.image_inds))
+
+    def sort(self, key):
+        """Detections reordered within every image by descending key."""
+        return self.take(self.order(key))
+
+    def first(self, order=None):
+        """Index of the first face of every image, in `order` if given, and -1 for no faces."""
+        if order is None:
+            order = np.arange(len(self))
+        counts = self.counts
+        first = np.full(self.num_images, -1, dtype=np.int64)
+        first[counts > 0] = order[self.offsets[:-1][counts > 0]]
+        return first
+
+    def select(self, method='probability', threshold=0.9, center_weight=2.0):
+        """Index of the face picked in every image, or -1, with the heuristics of
+        MTCNN.select_boxes()."""
+        if method == 'largest':
+            key = self.areas
+        elif method == 'probability':
+            key = self.probs
+        elif method == 'center_weighted_size':
+            centers = (self.boxes[:, :2] + self.boxes[:, 2:]) / 2
+            img_centers = self.image_sizes[self.image_inds][:, ::-1] / 2
+            offset_dist_squared = np.sum((centers - img_centers) ** 2, 1)
+            key = self.areas - offset_dist_squared * center_weight
+        elif method == 'largest_over_threshold':
+            key = np.where(self.probs > threshold, self.areas, -np.inf)
+        else:
+            raise ValueError('Unknown selection method {}'.format(method))
+
+        first = self.first(self.order(key))
+        if method == 'largest_over_threshold':
+            first[(first >= 0) & (self.probs[first] <= threshold)] = -1
+        return first
+
+    def to_batch(self):
+        """Per-image boxes, probabilities and landmarks as returned by MTCNN.detect() for a list
+        of images."""
+        boxes, probs, points = [], [], []
+        for i in range(self.num_images):
+            box, prob, point = self[i]
+            if len(box) == 0:
+                boxes.append(None)
+                probs.append([None])
+                points.append(None)
+            else:
+                boxes.append(box)
+                probs.append(prob)
+                points.append(point)
+        boxes = np.array(boxes, dtype=object)
+        probs = np.array(probs, dtype=object)
+        points = np.array(points, dtype=object)
+        return boxes, probs, points
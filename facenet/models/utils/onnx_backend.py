@@ -0,0 +1,133 @@
+import inspect
+import os
+
+import numpy as np
+import torch
+from torch import nn
+
+OPSET_VERSION = 17
+
+# Newer torch exports through dynamo by default; the TorchScript exporter handles dynamic_axes
+# the same way on every version
+EXPORT_KWARGS = {}
+if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+    EXPORT_KWARGS['dynamo'] = False
+
+MISSING_MESSAGE = (
+    'The ONNX backend needs onnx and onnxruntime, which are optional: '
+    'pip install -r requirements-onnx.txt'
+)
+
+
+def import_onnxruntime():
+    """Import ONNX Runtime, which is optional and slow to import, on first use of the backend.
+
+    Raises:
+        ImportError -- onnx or onnxruntime is not installed.
+    """
+    try:
+        import onnx  # noqa: F401, needed by torch.onnx.export
+        import onnxruntime
+    except ImportError as e:
+        raise ImportError(MISSING_MESSAGE) from e
+    return onnxruntime
+
+
+def export_onnx(model, sample, path, output_names, dynamic_axes=None, atol=1e-4):
+    """Export an eager model to an ONNX graph with a dynamic batch dimension, and check it.
+
+    The graph is run with ONNX Runtime on `sample` and its outputs compared with the eager model's.
+
+    Arguments:
+        model {torch.nn.Module} -- Model to export, in eval mode.
+        sample {torch.Tensor} -- Example input batch.
+        path {str} -- Output .onnx file.
+        output_names {list} -- Names of the model outputs, in order.
+
+    Keyword Arguments:
+        dynamic_axes {dict} -- Extra dynamic axes of the input, e.g. {2: 'height', 3: 'width'}
+            for fully convolutional models. The batch axis of the input and outputs is always
+            dynamic. (default: {None})
+        atol {float} -- Largest absolute difference allowed between eager and ONNX Runtime
+            outputs. (default: {1e-4})
+
+    Returns:
+        str -- path
+    """
+    import_onnxruntime()
+    axes = {'input': {0: 'batch'}}
+    axes['input'].update(dynamic_axes or {})
+    axes.update({name: {0: 'batch'} for name in output_names})
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with torch.no_grad():
+        torch.onnx.export(
+            model, (sample,), path, input_names=['input'], output_names=list(output_names),
+            dynamic_axes=axes, opset_version=OPSET_VERSION, **EXPORT_KWARGS
+        )
+    check_onnx(model, OnnxModule(path), sample, atol)
+    return path
+
+
+def check_onnx(model, onnx_model, sample, atol=1e-4):
+    """Raise a ValueError if ONNX Runtime and the eager model disagree on `sample`."""
+    with torch.no_grad():
+        expected = model(sample)
+    actual = onnx_model(sample)
+    if isinstance(expected, torch.Tensor):
+        expected, actual = (expected,), (actual,)
+    for e, a in zip(expected, actual):
+        diff = (e.cpu() - a).abs().max().item()
+        if diff > atol:
+            raise ValueError(
+                '{} differs from the eager model by {:.3g}'.format(onnx_model.path, diff)
+            )
+
+
+def load_onnx(path, build_model, sample, output_names, dynamic_axes=None):
+    """OnnxModule for `path`. If the file does not exist yet, the eager model returned by
+    build_model() is exported to it first; otherwise the eager model is never built.
+
+    Raises:
+        ImportError -- onnx or onnxruntime is not installed (see requirements-onnx.txt).
+    """
+    import_onnxruntime()
+    if not os.path.exists(path):
+        export_onnx(build_model().eval(), sample, path, output_names, dynamic_axes)
+    return OnnxModule(path)
+
+
+class OnnxModule(nn.Module):
+    """Drop-in replacement of an eager model running its ONNX graph on ONNX Runtime's CPU provider.
+
+    Takes and returns torch tensors like the eager model, so callers need not know which backend
+    they use. The module has no parameters; detection code reads its dtype as float32.
+
+    Arguments:
+        path {str} -- ONNX graph written by export_onnx.
+
+    Keyword Arguments:
+        providers {list} -- ONNX Runtime execution providers. (default: {['CPUExecutionProvider']})
+        num_threads {int} -- Intra-op threads of the session. 0 lets ONNX Runtime choose.
+            (default: {0})
+    """
+
+    def __init__(self, path, providers=('CPUExecutionProvider',), num_threads=0):
+        super().__init__()
+        onnxruntime = import_onnxruntime()
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = num_threads
+        self.path = path
+        self.session = onnxruntime.InferenceSession(
+            path, sess_options=options, providers=list(providers)
+        )
+        self.input_name = self.session.get_inputs()[0].name
+        self.output_names = [output.name for output in self.session.get_outputs()]
+
+    def device(self):
+        return torch.device('cpu')
+
+    def forward(self, x):
+        x = np.ascontiguousarray(x.detach().cpu().numpy(), dtype=np.float32)
+        out = self.session.run(self.output_names, {self.input_name: x})
+        out = tuple(torch.from_numpy(o) for o in out)
+        return out[0] if len(out) == 1 else out
@@ -0,0 +1,172 @@
+import json
+import math
+import mmap
+import os
+
+import torch
+from torch import nn
+
+MAGIC = b'EKYCPACK'
+ALIGNMENT = 64
+DTYPES = {
+    str(dtype).split('.')[1]: dtype for dtype in (
+        torch.float64, torch.float32, torch.float16, torch.bfloat16, torch.int64, torch.int32,
+        torch.int16, torch.int8, torch.uint8, torch.bool,
+    )
+}
+
+# Open files by absolute path, so that all models of a process share one mapping
+_packs = {}
+
+
+def pack_weights(state_dicts, path):
+    """Write several state dicts into one flat file of aligned, uncompressed tensors.
+
+    The file holds MAGIC, the length of a JSON header as 8 little-endian bytes, the header, which
+    gives the dtype, shape and offset of every '<name>/<key>' tensor, and then the tensor data.
+    Data starts on a page boundary and every tensor on a 64-byte boundary, so that PackedWeights
+    can map tensors in place. The file is written next to `path` and moved over it, so that
+    processes mapping the previous version keep a consistent view.
+
+    Arguments:
+        state_dicts {dict} -- State dict of every model, by name.
+        path {str} -- Output file.
+
+    Returns:
+        str -- path
+    """
+    entries, tensors, size = {}, [], 0
+    for name, state_dict in state_dicts.items():
+        for key, tensor in state_dict.items():
+            tensor = tensor.detach().cpu().contiguous()
+            offset = -(-size // ALIGNMENT) * ALIGNMENT
+            entries[name + '/' + key] = {
+                'dtype': str(tensor.dtype).split('.')[1],
+                'shape': list(tensor.shape),
+                'offset': offset,
+            }
+            tensors.append((offset, tensor))
+            size = offset + tensor.numel() * tensor.element_size()
+
+    header = json.dumps(entries).encode()
+    data_start = -(-(len(MAGIC) + 8 + len(header)) // mmap.PAGESIZE) * mmap.PAGESIZE
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(len(header).to_bytes(8, 'little'))
+        f.write(header)
+        for offset, tensor in tensors:
+            f.seek(data_start + offset)
+            f.write(tensor.reshape(-1).view(torch.uint8).numpy().tobytes())
+        f.truncate(data_start + size)
+    os.replace(tmp_path, path)
+    return path
+
+
+class PackedWeights:
+    """Memory-mapped file written by pack_weights.
+
+    Tensors are views of a private, copy-on-write mapping of the file. They take no memory of
+    their own unless written to, and every process mapping the file shares its page cache pages.
+    Use open_packed() to reuse the mapping of a file already opened by the process.
+
+    Arguments:
+        path {str} -- File written by pack_weights.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError('{} is not a packed weights file'.format(path))
+            header_size = int.from_bytes(f.read(8), 'little')
+            self.entries = json.loads(f.read(header_size))
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        self.data_start = -(-(len(MAGIC) + 8 + header_size) // mmap.PAGESIZE) * mmap.PAGESIZE
+
+    def names(self):
+        return sorted({key.split('/', 1)[0] for key in self.entries})
+
+    def tensor(self, key):
+        entry = self.entries[key]
+        dtype = DTYPES[entry['dtype']]
+        count = math.prod(entry['shape'])
+        if count == 0:
+            return torch.empty(entry['shape'], dtype=dtype)
+        return torch.frombuffer(
+            self.map, dtype=dtype, count=count, offset=self.data_start + entry['offset']
+        ).view(entry['shape'])
+
+    def state_dict(self, name):
+        """State dict of model `name`, as tensors mapped from the file."""
+        prefix = name + '/'
+        state_dict = {
+            key[len(prefix):]: self.tensor(key) for key in self.entries if key.startswith(prefix)
+        }
+        if not state_dict:
+            raise KeyError('No weights for {} in {}'.format(name, self.path))
+        return state_dict
+
+
+def open_packed(packed):
+    """PackedWeights of `packed`, a path or PackedWeights, opened once per process."""
+    if isinstance(packed, PackedWeights):
+        return packed
+    path = os.path.abspath(packed)
+    if path not in _packs:
+        _packs[path] = PackedWeights(path)
+    return _packs[path]
+
+
+def assign_state_dict(model, state_dict, strict=True):
+    """Make the tensors of `state_dict` the parameters and buffers of `model`, without copying
+    them, like load_state_dict(assign=True) of torch >= 2.1. Parameters do not require grad.
+
+    Arguments:
+        model {torch.nn.Module} -- Model to load, possibly built on the meta device.
+        state_dict {dict} -- Tensors to assign, by state dict key.
+
+    Keyword Arguments:
+        strict {bool} -- Raise if a key of the model is missing from state_dict, or the other way
+            around. (default: {True})
+
+    Returns:
+        tuple(list, list) -- Missing and unexpected keys.
+    """
+    missing, expected = [], set()
+    for prefix, module in model.named_modules():
+        prefix = prefix + '.' if prefix else ''
+        tensors = [(name, True, p) for name, p in module._parameters.items() if p is not None]
+        tensors += [
+            (name, False, b) for name, b in module._buffers.items()
+            if b is not None and name not in module._non_persistent_buffers_set
+        ]
+        for name, is_parameter, current in tensors:
+            key = prefix + name
+            expected.add(key)
+            if key not in state_dict:
+                missing.append(key)
+                continue
+            tensor = state_dict[key]
+            if tensor.shape != current.shape:
+                raise RuntimeError('{} has shape {} in the state dict, {} in the model'.format(
+                    key, tuple(tensor.shape), tuple(current.shape)
+                ))
+            if is_parameter:
+                module._parameters[name] = nn.Parameter(tensor, requires_grad=False)
+            else:
+                module._buffers[name] = tensor
+    unexpected = [key for key in state_dict if key not in expected]
+    if strict and (missing or unexpected):
+        raise RuntimeError('Missing keys {}, unexpected keys {} in state dict'.format(
+            missing, unexpected
+        ))
+    return missing, unexpected
+
+
+def load_packed(model, packed, name, strict=True):
+    """Point the parameters and buffers of `model` at the tensors of `name` in `packed` without
+    copying them. Build the model on the meta device to skip initializing weights that are
+    replaced anyway."""
+    assign_state_dict(model, open_packed(packed).state_dict(name), strict)
+    return model
@@ -0,0 +1,111 @@
+import json
+import time
+from collections import OrderedDict, defaultdict, deque
+
+import numpy as np
+import torch
+
+
+class DetectionProfile(object):
+    """Wall time per stage and candidate counts of one detect_face call.
+
+    detect_face calls lap() at the end of every stage, which charges the time elapsed since the
+    previous lap to that stage, and count() for the number of pyramid scales and the number of
+    candidates left after every threshold and NMS step. Both add up over repeated calls, e.g.
+    over the images of a mixed-size batch.
+
+    Keyword Arguments:
+        sync {bool} -- Synchronize CUDA before reading the clock, so that asynchronous kernels are
+            charged to the stage that launched them. (default: {False})
+    """
+
+    def __init__(self, sync=False):
+        self.sync = sync
+        self.times = OrderedDict()
+        self.counts = OrderedDict()
+        self.batch_size = 0
+        self.start()
+
+    def start(self):
+        """Restart the clock, e.g. when a pipelined call resumes on another thread."""
+        if self.sync:
+            torch.cuda.synchronize()
+        self._last = time.perf_counter()
+
+    def lap(self, stage):
+        if self.sync:
+            torch.cuda.synchronize()
+        now = time.perf_counter()
+        self.times[stage] = self.times.get(stage, 0.0) + now - self._last
+        self._last = now
+
+    def count(self, name, n):
+        self.counts[name] = self.counts.get(name, 0) + int(n)
+
+    def as_dict(self):
+        return {
+            'timestamp': time.time(),
+            'batch_size': self.batch_size,
+            'total': sum(self.times.values()),
+            'times': dict(self.times),
+            'counts': dict(self.counts),
+        }
+
+
+class HistogramSink(object):
+    """Profile sink keeping the most recent values of every stage time and count in memory.
+
+    Keyword Arguments:
+        maxlen {int} -- Number of detect calls kept per key. (default: {10000})
+    """
+
+    def __init__(self, maxlen=10000):
+        self.maxlen = maxlen
+        self.values = defaultdict(lambda: deque(maxlen=self.maxlen))
+
+    def __call__(self, record):
+        self.values['total'].append(record['total'])
+        for stage, seconds in record['times'].items():
+            self.values['time/' + stage].append(seconds)
+        for name, n in record['counts'].items():
+            self.values['count/' + name].append(n)
+
+    def histogram(self, key, bins=20):
+        """numpy.histogram of the recorded values of `key`, e.g. 'time/pnet' or 'count/rnet_nms'."""
+        return np.histogram(np.asarray(self.values[key]), bins=bins)
+
+    def summary(self, percentiles=(50, 90, 99)):
+        """Mean and percentiles of every key, stage times in milliseconds."""
+        summary = OrderedDict()
+        for key, values in self.values.items():
+            values = np.asarray(values, dtype=np.float64)
+            if key == 'total' or key.startswith('time/'):
+                values = values * 1000
+            summary[key] = OrderedDict(
+                [('n', len(values)), ('mean', values.mean())] +
+                [('p{}'.format(p), np.percentile(values, p)) for p in percentiles]
+            )
+        return summary
+
+    def clear(self):
+        self.values.clear()
+
+
+class JsonLinesSink(object):
+    """Profile sink appending every record as one JSON line to a file.
+
+    Arguments:
+        file {str or file} -- Path of the file to append to, or an open text file.
+    """
+
+    def __init__(self, file):
+        self.owns_file = isinstance(file, str)
+        self.file = open(file, 'a') if self.owns_file else file
+
+    def __call__(self, record):
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+
+    def close(self):
+        if self.owns_file:
+            self.file.close()
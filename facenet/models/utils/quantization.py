@@ -0,0 +1,214 @@
+import copy
+import os
+import warnings
+
+import numpy as np
+import torch
+from torch import nn
+from torch.ao.nn import quantized as nnq
+from torch.ao.quantization import (
+    QConfig, DeQuantStub, QuantStub, convert, default_weight_observer, get_default_qconfig, prepare
+)
+
+# OpenCV is optional, but required to read calibration folders
+try:
+    import cv2
+except:
+    pass
+
+ENGINE = 'x86' if 'x86' in torch.backends.quantized.supported_engines else 'fbgemm'
+NETS = ('pnet', 'rnet', 'onet')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+class QuantizedNet(nn.Module):
+    """Int8 wrapper of a PNet, RNet or ONet for eager-mode static quantization.
+
+    The input is quantized on entry and every output dequantized, so the wrapper is a drop-in
+    replacement of the float network. Softmax heads, which have no quantized kernel, run in float.
+
+    Arguments:
+        net {nn.Module} -- Float network. It is copied, not modified.
+    """
+
+    def __init__(self, net):
+        super().__init__()
+        net = copy.deepcopy(net)
+        for name, module in list(net.named_children()):
+            if isinstance(module, nn.Softmax):
+                setattr(net, name, nn.Sequential(DeQuantStub(), module))
+        self.quant = QuantStub()
+        self.net = net
+
+    def forward(self, x):
+        out = self.net(self.quant(x))
+        return tuple(o.dequantize() if o.is_quantized else o for o in out)
+
+
+def prepare_net(net):
+    """QuantizedNet of `net` with observers inserted, to be calibrated by running it."""
+    torch.backends.quantized.engine = ENGINE
+    qnet = QuantizedNet(net).eval()
+    qnet.qconfig = get_default_qconfig(ENGINE)
+    for module in qnet.modules():
+        # Per-channel observers do not handle the 1-d PReLU weights
+        if isinstance(module, nn.PReLU):
+            module.qconfig = QConfig(
+                activation=qnet.qconfig.activation, weight=default_weight_observer
+            )
+    return prepare(qnet)
+
+
+def quantized_state_dict(qnet):
+    """State dict of a converted QuantizedNet, including the output scale and zero point of
+    quantized PReLU modules, which their own state dict leaves out."""
+    state = qnet.state_dict()
+    for name, module in qnet.named_modules():
+        if isinstance(module, nnq.PReLU):
+            state[name + '.scale'] = torch.tensor(module.scale, dtype=torch.float64)
+            state[name + '.zero_point'] = torch.tensor(module.zero_point)
+    return state
+
+
+def load_quantized_net(net, path):
+    """Int8 version of `net` with the quantized state dict saved at `path` by quantize_mtcnn."""
+    with warnings.catch_warnings():
+        # Observers that never saw data warn when converted; the state dict overwrites them
+        warnings.simplefilter('ignore')
+        qnet = convert(prepare_net(net))
+    state = torch.load(path, map_location='cpu')
+    for name, module in qnet.named_modules():
+        if isinstance(module, nnq.PReLU):
+            module.scale = state.pop(name + '.scale').item()
+            module.zero_point = state.pop(name + '.zero_point').item()
+    qnet.load_state_dict(state)
+    return qnet
+
+
+def quantized_path(name, data_dir=None):
+    if data_dir is None:
+        data_dir = os.path.join(os.path.dirname(__file__), '../../data')
+    return os.path.join(data_dir, name + '_int8.pt')
+
+
+def box_iou(a, b):
+    """IoU matrix of Nx4 and Mx4 (x1, y1, x2, y2) boxes."""
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.clip(rb - lt, 0, None).prod(2)
+    area_a = (a[:, 2:] - a[:, :2]).prod(1)
+    area_b = (b[:, 2:] - b[:, :2]).prod(1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter)
+
+
+def compare_detections(reference, detections, iou_threshold=0.5):
+    """Match faces found by a quantized MTCNN to those of the float one, image by image.
+
+    Faces are matched greedily by IoU. Landmark error is the mean distance between matched
+    landmarks divided by the width of the reference box.
+
+    Arguments:
+        reference {list} -- (boxes, landmarks) of every image from MTCNN.detect(landmarks=True)
+            of the float model.
+        detections {list} -- The same for the quantized model.
+
+    Keyword Arguments:
+        iou_threshold {float} -- Minimum IoU of a match. (default: {0.5})
+
+    Returns:
+        dict -- Number of reference faces, recall, precision, mean IoU and landmark error of the
+            matched faces.
+    """
+    num_ref = num_found = 0
+    ious, errors = [], []
+    for (ref_boxes, ref_points), (boxes, points) in zip(reference, detections):
+        ref_boxes, ref_points, boxes, points = [
+            np.asarray(a if a is not None else [], dtype=np.float64).reshape((-1,) + shape)
+            for a, shape in [(ref_boxes, (4,)), (ref_points, (5, 2)), (boxes, (4,)), (points, (5, 2))]
+        ]
+        num_ref += len(ref_boxes)
+        num_found += len(boxes)
+        if len(ref_boxes) == 0 or len(boxes) == 0:
+            continue
+        iou = box_iou(ref_boxes, boxes)
+        while iou.max() >= iou_threshold:
+            i, j = np.unravel_index(iou.argmax(), iou.shape)
+            ious.append(iou[i, j])
+            width = ref_boxes[i, 2] - ref_boxes[i, 0]
+            errors.append(np.linalg.norm(ref_points[i] - points[j], axis=1).mean() / width)
+            iou[i, :] = -1
+            iou[:, j] = -1
+
+    return {
+        'faces': num_ref,
+        'recall': len(ious) / num_ref if num_ref else 1.0,
+        'precision': len(ious) / num_found if num_found else 1.0,
+        'mean_iou': float(np.mean(ious)) if ious else 0.0,
+        'landmark_error': float(np.mean(errors)) if errors else 0.0,
+    }
+
+
+def read_images(image_dir):
+    paths = sorted(
+        os.path.join(image_dir, name) for name in os.listdir(image_dir)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    if not paths:
+        raise ValueError('No images found in {}'.format(image_dir))
+    return [cv2.cvtColor(cv2.imread(path), cv2.COLOR_BGR2RGB) for path in paths]
+
+
+def quantize_mtcnn(
+    calibration_dir, nets=NETS, min_recall=0.95, eval_dir=None, data_dir=None, save=True
+):
+    """Quantize MTCNN networks to int8 and save them if they keep the float model's recall.
+
+    Observers are calibrated by running detection on every image of calibration_dir. The
+    quantized cascade is then compared with the float one with compare_detections(), on eval_dir
+    or the calibration images, and its state dicts are saved only if recall is at least
+    min_recall. MTCNN(quantized=True, quantized_dir=data_dir) loads them.
+
+    Arguments:
+        calibration_dir {str} -- Folder of face images representative of the deployment.
+
+    Keyword Arguments:
+        nets {list} -- Networks to quantize, among 'pnet', 'rnet' and 'onet'.
+            (default: {('pnet', 'rnet', 'onet')})
+        min_recall {float} -- Fraction of the float model's faces the quantized model must find.
+            (default: {0.95})
+        eval_dir {str} -- Folder of images to evaluate on. If None, the calibration images.
+            (default: {None})
+        data_dir {str} -- Output folder. If None, next to the float weights. (default: {None})
+        save {bool} -- Whether to save the state dicts when the check passes. (default: {True})
+
+    Returns:
+        tuple(MTCNN, dict) -- Quantized detector and the metrics of compare_detections().
+    """
+    from ..mtcnn import MTCNN
+
+    float_mtcnn = MTCNN(keep_all=True)
+    mtcnn = MTCNN(keep_all=True)
+    for name in nets:
+        setattr(mtcnn, name, prepare_net(getattr(float_mtcnn, name)))
+    with torch.no_grad():
+        for img in read_images(calibration_dir):
+            mtcnn.detect(img)
+    for name in nets:
+        setattr(mtcnn, name, convert(getattr(mtcnn, name)))
+
+    images = read_images(eval_dir or calibration_dir)
+    with torch.no_grad():
+        reference = [float_mtcnn.detect(img, landmarks=True)[::2] for img in images]
+        detections = [mtcnn.detect(img, landmarks=True)[::2] for img in images]
+    metrics = compare_detections(reference, detections)
+    if metrics['recall'] < min_recall:
+        raise ValueError(
+            'Quantized MTCNN recall {:.3f} is below {:.3f}, weights not saved: {}'.format(
+                metrics['recall'], min_recall, metrics
+            )
+        )
+
+    if save:
+        for name in nets:
+            torch.save(quantized_state_dict(getattr(mtcnn, name)), quantized_path(name, data_dir))
+    return mtcnn, metrics
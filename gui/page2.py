@@ -95,7 +95,7 @@ class VerificationWindow(QDialog):
             frame = cv.cvtColor(frame, cv.COLOR_BGR2RGB)
             
             # Detect face in camera frame
-            face, box, landmarks = extract_face(frame, self.main_window.mtcnn, padding=1.5)
+            face, box, landmarks = extract_face(frame, self.main_window.mtcnn, padding=1.5, track=True)
             self.face_box = box
             
             # Draw box around face if detected
@@ -189,6 +189,7 @@ class VerificationWindow(QDialog):
         except:
             pass
         self.timer.timeout.connect(self.update_camera)
+        self.main_window.mtcnn.reset_tracking()
         self.timer.start(30)  # Update every 30 milliseconds
         
         # Initialize camera label with proper dimensions
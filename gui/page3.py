@@ -98,7 +98,7 @@ class ChallengeWindow(QDialog):
                 # Process challenge response
                 if self.isCorrect == False and self.count_correct < 3:
                     # Check if the user completed the challenge
-                    self.isCorrect = result_challenge_response(frame, self.challenge, self.question, self.list_models, self.mtcnn)
+                    self.isCorrect = result_challenge_response(frame, self.challenge, self.question, self.list_models, self.mtcnn, track=True)
                     
                     # If challenge is completed, show success message
                     if self.isCorrect:
@@ -163,6 +163,7 @@ class ChallengeWindow(QDialog):
         except:
             pass
         self.timer.timeout.connect(self.update_camera)
+        self.mtcnn.reset_tracking()
         self.timer.start(30)  # Update every 30 milliseconds
         
         # Initialize camera label with proper dimensions
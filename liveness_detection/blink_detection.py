@@ -1,11 +1,15 @@
-import dlib
 import cv2 as cv
 import numpy as np
-from imutils import face_utils
 import os
 import torch
 import math
 
+from utils.lazy_import import lazy_import
+
+# Optional, only needed once a BlinkDetector is created
+dlib = lazy_import('dlib')
+face_utils = lazy_import('imutils.face_utils')
+
 class BlinkDetector():
     '''A class for detecting eye blinking in facial images'''
     
@@ -19,7 +23,7 @@ class BlinkDetector():
         self.counter = 0
         self.total = 0
 
-    def eye_blink(self, rgb_image: np.ndarray, rect : (np.ndarray, torch.Tensor, list, tuple, dlib.rectangle), thresh = 1):
+    def eye_blink(self, rgb_image: np.ndarray, rect : (np.ndarray, torch.Tensor, list, tuple, 'dlib.rectangle'), thresh = 1):
         '''
         Detects eye blinking in a given face region of an input BGR image.
 
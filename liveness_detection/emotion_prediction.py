@@ -2,10 +2,15 @@ import torch
 from torch import nn 
 from torch.nn import functional as F
 import os
-from torchvision import transforms as T
 import numpy as np
 from PIL import Image
 
+from facenet.models.utils.onnx_backend import load_onnx
+from facenet.models.utils.packed_weights import load_packed
+from utils.lazy_import import lazy_import
+
+T = lazy_import('torchvision.transforms')
+
 class EmotionDetectionModel(nn.Module):
     "VGG-Face"
     def __init__(self):
@@ -62,7 +67,7 @@ class EmotionDetectionModel(nn.Module):
     
 class EmotionPredictor():
     
-    def __init__(self, pretrained = 'landmarks/emotion_weights.pt', device = 'cpu', img_size = (64,64), classes = ['smile', 'neutral', 'other']):
+    def __init__(self, pretrained = 'landmarks/emotion_weights.pt', device = 'cpu', img_size = (64,64), classes = ['smile', 'neutral', 'other'], backend = 'torch', packed_weights = None):
         
         if isinstance(device, str):
             if (device == 'cuda' or device == 'gpu') and torch.cuda.is_available():
@@ -71,17 +76,42 @@ class EmotionPredictor():
                 device = torch.device('cpu')
         self.device = device
         
-        self.model = EmotionDetectionModel().to(device)
-        self.model.eval() 
+        if backend == 'onnx':
+            # ONNX Runtime runs on the CPU provider, the eager model is only built to export it
+            if not pretrained:
+                raise ValueError('The ONNX backend needs pretrained weights')
+            self.device = torch.device('cpu')
+            state_dict_path = os.path.join(os.path.dirname(__file__), pretrained)
+            self.model = load_onnx(
+                os.path.splitext(state_dict_path)[0] + '.onnx',
+                lambda: self.load_model(pretrained),
+                torch.rand(2, 1, *img_size) * 2 - 1,
+                ['logits'],
+            )
+        elif backend == 'torch':
+            self.model = self.load_model(pretrained, packed_weights)
+        else:
+            raise ValueError(f'Unknown backend {backend}')
+        
+        self.img_size = img_size
+        self.classes = np.array(classes) 
+    
+    def load_model(self, pretrained, packed_weights = None):
+        if packed_weights is not None:
+            # Map the weights from the file written by pack_weights.py, without initializing any
+            with torch.device('meta'):
+                model = EmotionDetectionModel()
+            return load_packed(model, packed_weights, 'emotion').eval().to(self.device)
+
+        model = EmotionDetectionModel().to(self.device)
+        model.eval() 
         
         if pretrained:
             state_dict_path = os.path.join(os.path.dirname(__file__), pretrained)
-            self.model.load_state_dict(torch.load(state_dict_path, map_location= 'cpu'))
+            model.load_state_dict(torch.load(state_dict_path, map_location= 'cpu'))
             # print('Weights loaded successfully from path:', state_dict_path)
             # print('====================================================')
-        
-        self.img_size = img_size
-        self.classes = np.array(classes) 
+        return model
     
     def transform(self, image: Image.Image):
         return T.Compose(
@@ -1,23 +1,30 @@
+import os
 import sys
 
 import cv2 as cv
 import numpy as np
+import torch
 
-from face_verification import *
 from facenet.models.mtcnn import MTCNN
-from gui.page1 import *
-from gui.page2 import *
-from gui.page3 import *
-from gui.page4 import *
-from gui.utils import *
+from gui.page1 import IDCardPhoto
+from gui.page2 import VerificationWindow
+from gui.page3 import ChallengeWindow
+from gui.page4 import ResultsWindow
 from liveness_detection.blink_detection import BlinkDetector
 from liveness_detection.emotion_prediction import EmotionPredictor
 from liveness_detection.face_orientation import FaceOrientationDetector
 from PyQt5.QtWidgets import QApplication, QMainWindow, QStackedWidget
-from utils.functions import *
+from utils.distance import Euclidean_Distance, findThreshold
+from utils.functions import extract_faces, get_image
 from utils.plot import plot_landmarks_mtcnn
+from utils.startup import (
+    Startup, warm_up_blink, warm_up_emotion, warm_up_mtcnn, warm_up_verifier
+)
 from verification_models import VGGFace2
 
+# Written by pack_weights.py; the models map their weights from it when it exists
+PACKED_WEIGHTS = "weights.pack"
+
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -44,24 +51,39 @@ class MainWindow(QMainWindow):
         # Model
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
-        self.mtcnn = MTCNN(device=self.device)
-
-        self.verification_model = VGGFace2.load_model(device=self.device)
+        packed_weights = PACKED_WEIGHTS if os.path.exists(PACKED_WEIGHTS) else None
 
-        self.blink_detector = BlinkDetector()
-        self.face_orientation_detector = FaceOrientationDetector()
-        self.emotion_preidictor = EmotionPredictor(device=self.device)
+        # Models load and warm up on a thread pool while the camera opens
+        startup = Startup()
+        startup.submit(
+            "mtcnn",
+            lambda: MTCNN(device=self.device, packed_weights=packed_weights),
+            warm_up_mtcnn,
+        )
+        startup.submit(
+            "verifier",
+            lambda: VGGFace2.load_model(
+                device=self.device, inference_only=True, packed_weights=packed_weights
+            ),
+            warm_up_verifier,
+        )
+        startup.submit("blink", BlinkDetector, warm_up_blink)
+        startup.submit("orientation", FaceOrientationDetector)
+        startup.submit(
+            "emotion",
+            lambda: EmotionPredictor(device=self.device, packed_weights=packed_weights),
+            warm_up_emotion,
+        )
+        startup.submit("camera", self.open_camera)
+        models = startup.wait()
+        print(startup.report())
 
-        # camera
-        self.camera = cv.VideoCapture(0)
-        # Check if camera opened successfully
-        if not self.camera.isOpened():
-            print("Error: Could not open camera.")
-            self.camera = cv.VideoCapture(0)  # Try reopening
-        
-        # Set camera properties for better resolution
-        self.camera.set(cv.CAP_PROP_FRAME_WIDTH, 640)
-        self.camera.set(cv.CAP_PROP_FRAME_HEIGHT, 480)
+        self.mtcnn = models["mtcnn"]
+        self.verification_model = models["verifier"]
+        self.blink_detector = models["blink"]
+        self.face_orientation_detector = models["orientation"]
+        self.emotion_preidictor = models["emotion"]
+        self.camera = models["camera"]
 
         # stack widget
         self.stacked_widget = QStackedWidget()
@@ -86,16 +108,29 @@ class MainWindow(QMainWindow):
         self.stacked_widget.addWidget(self.third_page)
         self.stacked_widget.addWidget(self.fourth_page)
 
+    def open_camera(self):
+        camera = cv.VideoCapture(0)
+        # Check if camera opened successfully
+        if not camera.isOpened():
+            print("Error: Could not open camera.")
+            camera = cv.VideoCapture(0)  # Try reopening
+        
+        # Set camera properties for better resolution
+        camera.set(cv.CAP_PROP_FRAME_WIDTH, 640)
+        camera.set(cv.CAP_PROP_FRAME_HEIGHT, 480)
+        return camera
+
     def verify(self):
         id_image = get_image(self.first_page.img_path)
         verification_image = self.second_page.verification_image
 
-        # Extract faces and plot landmarks
-        face1, box1, landmarks1 = extract_face(id_image, self.mtcnn, padding=1)
+        # Extract faces from both images with a single detection call, and plot landmarks
+        (face1, box1, landmarks1), (face2, box2, landmarks2) = extract_faces(
+            [id_image, verification_image], self.mtcnn, padding=1
+        )
         id_image_with_landmarks = plot_landmarks_mtcnn(id_image.copy(), landmarks1)
         self.first_page.update_id_image(id_image_with_landmarks)
         
-        face2, box2, landmarks2 = extract_face(verification_image, self.mtcnn, padding=1)
         verification_image_with_landmarks = plot_landmarks_mtcnn(verification_image.copy(), landmarks2)
         self.second_page.update_verification_image(verification_image_with_landmarks)
         
@@ -103,13 +138,10 @@ class MainWindow(QMainWindow):
         distance_metric_name = "euclidean"
         model_name = "VGG-Face2"
         
-        face1_transformed = face_transform(face1, model_name=model_name, device=self.verification_model.device())
-        face2_transformed = face_transform(face2, model_name=model_name, device=self.verification_model.device())
-        
-        result1 = self.verification_model(face1_transformed)
-        result2 = self.verification_model(face2_transformed)
+        # ID face and selfie are embedded in a single forward pass
+        embeddings = VGGFace2.embed_faces([face1, face2], self.verification_model)
         
-        distance = Euclidean_Distance(result1, result2)
+        distance = Euclidean_Distance(embeddings[0:1], embeddings[1:2])
         threshold = findThreshold(model_name=model_name, distance_metric=distance_metric_name)
         
         # Calculate match percentage (lower distance means higher similarity)
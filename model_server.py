@@ -0,0 +1,303 @@
+"""Pre-fork server of the face verification and liveness models.
+
+The parent process loads every model once, in eval mode with gradients disabled, and warms them
+up. It then forks workers that inherit them. Weights are never written after the fork, so their
+pages stay shared copy-on-write between the parent and all workers. A worker only adds the memory
+of its own activations. Workers accept connections on one listening socket, handle one connection
+at a time, and answer (command, *args) requests sent with ModelClient:
+    ('verify', id_image, selfie) -> dict of distance, threshold, verified and, when no face is
+        found in an image, the reason it is not verified
+    ('emotion', face) -> emotion label
+    ('blink', frame, box, thresh) -> whether the blink challenge of this connection passed
+    ('stats',) -> pid, time from fork until ready ('startup') and until the first reply was sent
+        ('first_request'), and memory of the worker
+Connections must present the server's authkey, as requests are unpickled by the workers, and the
+socket is only accessible to the user running the server. Start it with:
+    MODEL_SERVER_AUTHKEY=<hex key> python model_server.py [--workers N] [--threads T]
+        [--address PATH] [--packed-weights FILE]
+Without a key, one is generated and printed for the clients.
+"""
+import argparse
+import copy
+import gc
+import os
+import signal
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+import cv2 as cv
+import numpy as np
+import torch
+
+from facenet.models.mtcnn import MTCNN
+from liveness_detection.emotion_prediction import EmotionPredictor
+from utils.distance import Euclidean_Distance, findThreshold
+from utils.functions import extract_faces
+from verification_models import VGGFace2
+
+MODELS = ("mtcnn", "verifier", "emotion", "blink")
+
+
+def load_models(
+    models=MODELS, device="cpu", verifier_weights="weights/vggface2_weights.pt",
+    emotion_weights="landmarks/emotion_weights.pt", packed_weights=None
+):
+    """
+    Load and warm up the models the server answers with.
+
+    Torch and OpenCV are limited to one thread in this process, as no thread pool may exist when
+    workers are forked from it. Workers set their own thread counts.
+
+    Parameters:
+        models (list): Models to load among 'mtcnn', 'verifier', 'emotion' and 'blink'. 'verify'
+            requests need 'mtcnn' and 'verifier'.
+        device (str or torch.device): The device to run the models on.
+        verifier_weights (str): VGGFace2 weights, relative to verification_models.
+        emotion_weights (str): Emotion model weights, relative to liveness_detection.
+        packed_weights (str): File written by pack_weights.py to map the torch weights from.
+
+    Returns:
+        dict: The loaded models by name.
+    """
+    torch.set_num_threads(1)
+    cv.setNumThreads(1)
+    loaded = {}
+    if "mtcnn" in models:
+        loaded["mtcnn"] = MTCNN(device=device, packed_weights=packed_weights)
+    if "verifier" in models:
+        loaded["verifier"] = VGGFace2.load_model(
+            verifier_weights, device, inference_only=True, packed_weights=packed_weights
+        )
+    if "emotion" in models:
+        loaded["emotion"] = EmotionPredictor(
+            emotion_weights, device, packed_weights=packed_weights
+        )
+    if "blink" in models:
+        # dlib is only needed by the blink detector
+        from liveness_detection.blink_detection import BlinkDetector
+
+        loaded["blink"] = BlinkDetector()
+
+    for model in loaded.values():
+        model = getattr(model, "model", model)
+        if isinstance(model, torch.nn.Module):
+            model.eval().requires_grad_(False)
+    warm_up(loaded)
+    return loaded
+
+
+def warm_up(models):
+    # Run every model once, so that lazy allocations happen before workers are forked
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 256, (480, 640, 3), dtype=np.uint8)
+    face = frame[:160, :160]
+    with torch.inference_mode():
+        if "mtcnn" in models:
+            models["mtcnn"].detect(frame)
+        if "verifier" in models:
+            VGGFace2.embed_faces([face, face], models["verifier"])
+        if "emotion" in models:
+            models["emotion"].predict(face)
+    if "blink" in models:
+        models["blink"].eye_blink(frame, [0, 0, 160, 160])
+        models["blink"].counter = models["blink"].total = 0
+
+
+def memory_usage():
+    """Resident, proportional and private (not shared with any process) set sizes in bytes."""
+    with open("/proc/self/smaps_rollup") as f:
+        fields = dict(line.split()[:2] for line in f if line.endswith("kB\n"))
+    return {
+        "rss": int(fields["Rss:"]) * 1024,
+        "pss": int(fields["Pss:"]) * 1024,
+        "private": (int(fields["Private_Clean:"]) + int(fields["Private_Dirty:"])) * 1024,
+    }
+
+
+class Worker:
+    """Request handlers of one forked worker process."""
+
+    def __init__(self, models, threads):
+        self.models = models
+        self.threads = threads
+        self.forked = time.perf_counter()
+        self.startup = None
+        self.first_request = None
+
+    def serve(self, listener):
+        torch.set_num_threads(self.threads)
+        cv.setNumThreads(self.threads)
+        self.startup = time.perf_counter() - self.forked
+        while True:
+            try:
+                conn = listener.accept()
+            except (AuthenticationError, EOFError, ConnectionError):
+                # A client that fails the handshake or goes away during it is dropped
+                continue
+            with conn:
+                # Blink counters belong to one connection, the landmark predictor is shared
+                blink = copy.copy(self.models.get("blink"))
+                while True:
+                    try:
+                        command, *args = conn.recv()
+                    except EOFError:
+                        break
+                    try:
+                        reply = self.handle(command, args, blink)
+                    except Exception as e:
+                        reply = e
+                    conn.send(reply)
+                    if self.first_request is None:
+                        # Like startup, measured from the fork, until the first reply is sent
+                        self.first_request = time.perf_counter() - self.forked
+
+    def handle(self, command, args, blink):
+        with torch.inference_mode():
+            if command == "verify":
+                return self.verify(*args)
+            if command == "emotion":
+                return str(self.models["emotion"].predict(args[0]))
+        if command == "blink":
+            return blink.eye_blink(*args)
+        if command == "stats":
+            return {
+                "pid": os.getpid(),
+                "startup": self.startup,
+                "first_request": self.first_request,
+                **memory_usage(),
+            }
+        raise ValueError(f"Unknown command {command}")
+
+    def verify(self, id_image, selfie):
+        threshold = findThreshold(model_name="VGG-Face2", distance_metric="euclidean")
+        faces = []
+        for name, (face, box, _) in zip(
+            ["ID image", "selfie"],
+            extract_faces([id_image, selfie], self.models["mtcnn"], padding=1),
+        ):
+            # No detection, or none above the probability threshold, is never a match
+            if box is None or face.size == 0:
+                return {
+                    "distance": None, "threshold": threshold, "verified": False,
+                    "reason": f"No face found in the {name}",
+                }
+            faces.append(face)
+        embeddings = VGGFace2.embed_faces(faces, self.models["verifier"])
+        distance = Euclidean_Distance(embeddings[0:1], embeddings[1:2]).item()
+        return {
+            "distance": distance, "threshold": threshold, "verified": distance < threshold,
+            "reason": None,
+        }
+
+
+class ModelServer:
+    """
+    Fork workers that share the already loaded models and serve them on one socket.
+
+    Parameters:
+        models (dict): Models returned by load_models.
+        workers (int): Number of worker processes. None starts one per core.
+        threads (int): Torch and OpenCV intra-op threads of every worker.
+        address (str): Unix socket path. None picks a temporary one, see the address attribute.
+        authkey (bytes): Key clients must present, as in multiprocessing.connection. None
+            generates a random one, see the authkey attribute.
+    """
+
+    def __init__(self, models, workers=None, threads=1, address=None, authkey=None):
+        self.models = models
+        self.num_workers = workers or os.cpu_count()
+        self.threads = threads
+        self.authkey = authkey or os.urandom(32)
+        # The socket file is created readable and writable by its owner only
+        umask = os.umask(0o177)
+        try:
+            self.listener = Listener(address, family="AF_UNIX", authkey=self.authkey)
+        finally:
+            os.umask(umask)
+        self.address = self.listener.address
+        self.pids = []
+
+    def start(self):
+        # Objects surviving to this point are never collected, so the collector does not write
+        # to their pages in the workers
+        gc.freeze()
+        for _ in range(self.num_workers):
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    Worker(self.models, self.threads).serve(self.listener)
+                finally:
+                    os._exit(0)
+            self.pids.append(pid)
+        return self
+
+    def stop(self):
+        for pid in self.pids:
+            os.kill(pid, signal.SIGTERM)
+        for pid in self.pids:
+            os.waitpid(pid, 0)
+        self.pids = []
+        self.listener.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class ModelClient:
+    """
+    Connection to a ModelServer. Requests of one client are answered by the same worker.
+
+    Parameters:
+        address (str): The server's address.
+        authkey (bytes): The server's key.
+    """
+
+    def __init__(self, address, authkey):
+        self.conn = Client(address, family="AF_UNIX", authkey=authkey)
+
+    def __call__(self, command, *args):
+        self.conn.send((command, *args))
+        reply = self.conn.recv()
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=None, help="Default: one per core")
+    parser.add_argument("--threads", type=int, default=1, help="Intra-op threads per worker")
+    parser.add_argument("--address", default=None, help="Unix socket path")
+    parser.add_argument("--packed-weights", default=None, help="File written by pack_weights.py")
+    parser.add_argument("--models", nargs="+", choices=MODELS, default=list(MODELS))
+    parser.add_argument(
+        "--authkey", default=os.environ.get("MODEL_SERVER_AUTHKEY"),
+        help="Hex key clients must present. Default: $MODEL_SERVER_AUTHKEY, else a random key",
+    )
+    args = parser.parse_args()
+
+    authkey = bytes.fromhex(args.authkey) if args.authkey else None
+    server = ModelServer(
+        load_models(args.models, packed_weights=args.packed_weights),
+        args.workers, args.threads, args.address, authkey
+    )
+    with server:
+        print(f"Serving {', '.join(args.models)} on {server.address}, {server.num_workers} workers")
+        if authkey is None:
+            print(f"authkey {server.authkey.hex()}")
+        # Blocked only now, so that forked workers still die on SIGTERM
+        signal.pthread_sigmask(signal.SIG_BLOCK, [signal.SIGINT, signal.SIGTERM])
+        signal.sigwait([signal.SIGINT, signal.SIGTERM])
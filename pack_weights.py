@@ -0,0 +1,47 @@
+"""Pack the MTCNN, VGGFace2 and emotion model weights into one memory-mapped file.
+
+Tensors are stored flat and aligned, so that MTCNN, VGGFace2.load_model and EmotionPredictor
+given packed_weights map them straight from the file instead of deserializing every .pt file,
+and worker processes on a node share their page cache pages. main.py uses the file when it
+exists. VGGFace2 is packed without its unused classification layer:
+    python pack_weights.py [--output weights.pack] [--models mtcnn vggface2 emotion]
+The dlib landmark predictor has its own format and is still loaded from its .dat file.
+"""
+import argparse
+import os
+
+from export_onnx import EMOTION_WEIGHTS, VGGFACE2_WEIGHTS
+from facenet.models.mtcnn import MTCNN
+from facenet.models.utils.packed_weights import pack_weights
+from liveness_detection.emotion_prediction import EmotionPredictor
+from verification_models import VGGFace2
+
+PACKED_WEIGHTS = "weights.pack"
+
+
+def model_state_dicts(models):
+    state_dicts = {}
+    if "mtcnn" in models:
+        mtcnn = MTCNN()
+        for name in ["pnet", "rnet", "onet"]:
+            state_dicts[name] = getattr(mtcnn, name).state_dict()
+    if "vggface2" in models:
+        model = VGGFace2.load_model(VGGFACE2_WEIGHTS, inference_only=True)
+        state_dicts["vggface2"] = model.state_dict()
+    if "emotion" in models:
+        state_dicts["emotion"] = EmotionPredictor(EMOTION_WEIGHTS).model.state_dict()
+    return state_dicts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", default=PACKED_WEIGHTS)
+    parser.add_argument(
+        "--models", nargs="+", choices=["mtcnn", "vggface2", "emotion"],
+        default=["mtcnn", "vggface2", "emotion"]
+    )
+    args = parser.parse_args()
+
+    path = pack_weights(model_state_dicts(args.models), args.output)
+    size = os.path.getsize(path) / 2 ** 20
+    print(f"Packed {', '.join(args.models)} into {path} ({size:.1f} MiB)")
@@ -0,0 +1,28 @@
+"""Quantize the MTCNN networks to int8 with calibration images.
+
+The int8 networks are checked against the float ones and saved next to facenet/data/*.pt, where
+MTCNN(quantized=True) loads them, or to --data-dir, loaded with MTCNN(quantized=True,
+quantized_dir=DATA_DIR), only if they find at least --min-recall of the float model's faces:
+    python quantize_mtcnn.py CALIBRATION_DIR [--eval-dir DIR] [--nets pnet rnet onet]
+        [--data-dir DIR]
+"""
+import argparse
+
+from facenet.models.utils.quantization import NETS, quantize_mtcnn
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("calibration_dir", help="Folder of face images to calibrate on")
+    parser.add_argument("--eval-dir", default=None, help="Folder of images to check recall on")
+    parser.add_argument("--nets", nargs="+", choices=NETS, default=list(NETS))
+    parser.add_argument("--min-recall", type=float, default=0.95)
+    parser.add_argument(
+        "--data-dir", default=None, help="Output folder of the int8 weights (MTCNN quantized_dir)"
+    )
+    args = parser.parse_args()
+
+    _, metrics = quantize_mtcnn(
+        args.calibration_dir, args.nets, args.min_recall, args.eval_dir, args.data_dir
+    )
+    for key, value in metrics.items():
+        print(f"{key:<15} {value:.4f}" if isinstance(value, float) else f"{key:<15} {value}")
@@ -0,0 +1,44 @@
+"""Quantize the VGGFace2 embedding model to int8 with calibration face crops.
+
+The int8 model is checked against the float one on every pair of faces of --eval-dir, which holds
+one subfolder of crops per identity. Genuine and impostor distance distributions, verification
+accuracy and the agreement of both models' decisions at the findThreshold distance are printed.
+The int8 weights are saved next to the float ones, where VGGFace2.load_model(quantized=True) loads
+them, only if the decisions agree on at least --min-agreement of the pairs:
+    python quantize_vggface2.py CALIBRATION_DIR [--eval-dir DIR] [--weights PATH]
+With --evaluate, the saved int8 model is evaluated on CALIBRATION_DIR or --eval-dir instead:
+    python quantize_vggface2.py EVAL_DIR --evaluate
+"""
+import argparse
+
+from verification_models import VGGFace2
+from verification_models.quantization import evaluate, quantize_vggface2
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("calibration_dir", help="Folder of face crops to calibrate on")
+    parser.add_argument("--eval-dir", default=None, help="Folder of identity subfolders of crops")
+    parser.add_argument(
+        "--weights", default="weights/vggface2_weights.pt",
+        help="Float weights, relative to verification_models"
+    )
+    parser.add_argument("--min-agreement", type=float, default=0.99)
+    parser.add_argument("--max-batch", type=int, default=32, help="Faces per forward pass")
+    parser.add_argument(
+        "--evaluate", action="store_true", help="Only evaluate the saved int8 model"
+    )
+    args = parser.parse_args()
+
+    if args.evaluate:
+        metrics = evaluate(
+            VGGFace2.load_model(args.weights, inference_only=True),
+            VGGFace2.load_model(args.weights, quantized=True),
+            args.eval_dir or args.calibration_dir,
+            args.max_batch,
+        )
+    else:
+        _, metrics = quantize_vggface2(
+            args.calibration_dir, args.eval_dir, args.weights, args.min_agreement, args.max_batch
+        )
+    for key, value in metrics.items():
+        print(f"{key:<20} {value:.4f}" if isinstance(value, float) else f"{key:<20} {value}")
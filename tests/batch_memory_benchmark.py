@@ -0,0 +1,65 @@
+"""Benchmark peak memory and time of the RNet/ONet passes under different memory budgets.
+
+A large batch of random ONet (48x48) and RNet (24x24) candidates, as a cluttered image would
+produce, goes through fixed_batch_process with fixed chunks of 512 and with several values of
+MTCNN(batch_memory_budget=...). Every setting runs in a fresh process, since the peak resident
+set size can only be read as a high-water mark of the whole process. Run from the repository root:
+    python -m tests.batch_memory_benchmark
+"""
+import io
+import subprocess
+import sys
+import time
+
+import torch
+
+from facenet.models.mtcnn import ONet, RNet
+from facenet.models.utils.detect_face import candidate_bytes, fixed_batch_process
+from tests.bench_utils import peak_rss
+
+NUM_CANDIDATES = 4096
+BUDGETS = [None, 256 << 20, 64 << 20, 16 << 20]
+
+
+def run(budget):
+    # Child process: report peak RSS growth, time and outputs for one budget
+    torch.set_grad_enabled(False)
+    torch.manual_seed(0)
+    nets = [
+        (RNet(), torch.rand(NUM_CANDIDATES, 3, 24, 24)),
+        (ONet(), torch.rand(NUM_CANDIDATES, 3, 48, 48)),
+    ]
+    for model, im_data in nets:
+        fixed_batch_process(im_data[:8], model, budget)
+    base = peak_rss()
+    start = time.perf_counter()
+    out = [fixed_batch_process(im_data, model, budget) for model, im_data in nets]
+    elapsed = time.perf_counter() - start
+    torch.save((peak_rss() - base, elapsed, out), sys.stdout.buffer)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        run(None if sys.argv[1] == "None" else int(sys.argv[1]))
+        sys.exit()
+
+    for model, size in [(RNet(pretrained=False), 24), (ONet(pretrained=False), 48)]:
+        per = candidate_bytes(model, torch.zeros(1, 3, size, size))
+        print(f"{type(model).__name__} {per / 1024:.0f} KiB per candidate")
+
+    print(f"{NUM_CANDIDATES} candidates per network")
+    print(f"{'budget':>10} {'peak MiB':>9} {'ms':>8} {'max diff':>10}")
+    ref = None
+    for budget in BUDGETS:
+        result = subprocess.run(
+            [sys.executable, "-m", "tests.batch_memory_benchmark", str(budget)],
+            stdout=subprocess.PIPE, check=True
+        )
+        growth, elapsed, out = torch.load(io.BytesIO(result.stdout))
+        if ref is None:
+            ref = out
+        diff = max(
+            (a - b).abs().max().item() for o, r in zip(out, ref) for a, b in zip(o, r)
+        )
+        label = "512 fixed" if budget is None else f"{budget >> 20} MiB"
+        print(f"{label:>10} {growth / 2 ** 20:>9.1f} {elapsed * 1000:>8.1f} {diff:>10.2g}")
@@ -0,0 +1,49 @@
+"""Timing and memory helpers shared by the tests/*_benchmark.py scripts."""
+import resource
+import time
+
+
+def timeit(fn, repeat=5, reduce=min):
+    """
+    Time fn after one warm-up call.
+
+    Parameters:
+        fn (callable): Function to time, called without arguments.
+        repeat (int): Number of timed calls.
+        reduce (callable): Statistic of the call times, such as min or np.median.
+
+    Returns:
+        tuple: The reduced call time in seconds, and the output of the last call.
+    """
+    fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn()
+        times.append(time.perf_counter() - start)
+    return reduce(times), out
+
+
+def rss():
+    """Resident memory of this process, in bytes."""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * resource.getpagesize()
+
+
+def peak_rss():
+    """Peak resident memory of this process, in bytes."""
+    # VmHWM belongs to this address space, unlike ru_maxrss, which survives exec
+    with open("/proc/self/status") as f:
+        return next(int(line.split()[1]) * 1024 for line in f if line.startswith("VmHWM"))
+
+
+def smaps():
+    """Rss, Pss and private memory of this process, in bytes: Pss splits the pages shared with
+    other processes, such as memory-mapped weights, between them."""
+    with open("/proc/self/smaps_rollup") as f:
+        fields = dict(line.split()[:2] for line in f if line.endswith("kB\n"))
+    memory = {key: int(fields[key + ":"]) * 1024 for key in ["Rss", "Pss"]}
+    memory["Private"] = sum(
+        int(fields[key + ":"]) * 1024 for key in ["Private_Clean", "Private_Dirty"]
+    )
+    return memory
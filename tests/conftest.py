@@ -0,0 +1,9 @@
+import os
+import sys
+
+# Tests import the project's packages from the repository root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# The *_test.py scripts are interactive camera and video demos, not tests
+collect_ignore_glob = ["*_test.py"]
@@ -0,0 +1,70 @@
+"""Benchmark the batched RNet/ONet crop-resize against the per-box interpolate loop.
+
+The candidate boxes are the ones detect_face actually sends to RNet and ONet on the repo images.
+Run from the repository root:
+    python -m tests.crop_resample_benchmark
+"""
+import cv2 as cv
+import torch
+
+from facenet.models.mtcnn import MTCNN
+from facenet.models.utils import detect_face
+from tests.bench_utils import timeit
+
+
+def loop_crop_resample(imgs, image_inds, y, ey, x, ex, sz):
+    # The crop loop detect_face used before crop_resample
+    im_data = []
+    for k in range(len(y)):
+        if ey[k] > (y[k] - 1) and ex[k] > (x[k] - 1):
+            img_k = imgs[image_inds[k], :, (y[k] - 1):ey[k], (x[k] - 1):ex[k]].unsqueeze(0)
+            im_data.append(detect_face.imresample(img_k, sz))
+    return torch.cat(im_data, dim=0)
+
+
+def collect_candidates(mtcnn, img):
+    """Run one detection and record the arguments of every crop_resample call."""
+    calls = []
+    crop_resample = detect_face.crop_resample
+
+    def record(*args):
+        calls.append(args[1:])
+        return crop_resample(*args)
+
+    detect_face.crop_resample = record
+    try:
+        mtcnn.detect(img)
+    finally:
+        detect_face.crop_resample = crop_resample
+    return calls
+
+
+if __name__ == "__main__":
+    torch.set_grad_enabled(False)
+    mtcnn = MTCNN()
+
+    print(f"{'image':<28} {'boxes':>6} {'size':>5} {'loop ms':>8} {'batched ms':>11} {'speedup':>8}")
+    for path in ["facenet/data/multiface.jpg", "SAM_ID.png", "ID2.png"]:
+        img = cv.cvtColor(cv.imread(path), cv.COLOR_BGR2RGB)
+        raw_imgs = torch.as_tensor(img).permute(2, 0, 1).unsqueeze(0)
+        imgs = raw_imgs.float()
+
+        # The integral image is built once per call and shared by both stages
+        t_integral, integral = timeit(lambda: detect_face.integral_image(raw_imgs), 7)
+        total_loop, total_batched = 0.0, t_integral
+        for image_inds, y, ey, x, ex, sz in collect_candidates(mtcnn, img):
+            t_loop, ref = timeit(lambda: loop_crop_resample(imgs, image_inds, y, ey, x, ex, sz), 7)
+            t_batched, out = timeit(
+                lambda: detect_face.crop_resample(integral, image_inds, y, ey, x, ex, sz), 7
+            )
+            assert torch.allclose(ref, out.float(), atol=1e-3)
+            total_loop += t_loop
+            total_batched += t_batched
+            print(
+                f"{path:<28} {len(y):>6} {sz[0]:>5} {t_loop * 1000:>8.2f} "
+                f"{t_batched * 1000:>11.2f} {t_loop / t_batched:>7.1f}x"
+            )
+        print(
+            f"{path:<28} {'total (incl. integral image)':>20} {total_loop * 1000:>8.2f} "
+            f"{total_batched * 1000:>11.2f} {total_loop / total_batched:>7.1f}x"
+        )
@@ -0,0 +1,54 @@
+"""Benchmark the uint8 cv2 scale pyramid against the float interpolate pyramid.
+
+Reports the time to build and normalize all pyramid levels, the full detection time with each
+pyramid and the number of faces found. Run from the repository root:
+    python -m tests.cv2_pyramid_benchmark
+"""
+import cv2 as cv
+import torch
+
+from facenet.models.mtcnn import MTCNN
+from facenet.models.utils.detect_face import DetectionPlan, pyramid_levels, pyramid_levels_cv2
+from tests.bench_utils import timeit
+
+IMAGES = ["facenet/data/multiface.jpg", "ID2.png", "ID3.jpg", "SAM_ID.png", "resources/ekyc.jpg"]
+
+
+if __name__ == "__main__":
+    torch.set_grad_enabled(False)
+    mtcnn = MTCNN(keep_all=True)
+    mtcnn_cv2 = MTCNN(keep_all=True, cv2_pyramid=True)
+
+    print(
+        f"{'image':<28} {'levels':>7} {'torch pyr ms':>13} {'cv2 pyr ms':>11} "
+        f"{'torch ms':>9} {'cv2 ms':>7} {'faces':>6}"
+    )
+    for path in IMAGES:
+        img = cv.cvtColor(cv.imread(path), cv.COLOR_BGR2RGB)
+        h, w = img.shape[:2]
+        # Level sizes and preallocated buffers as detect_face sets them up
+        plan = DetectionPlan(h, w, mtcnn.min_face_size, mtcnn.factor)
+        frames = torch.as_tensor(img).unsqueeze(0)
+        outs = [
+            plan.buffer(("level", k), (1,) + size + (3,), torch.float32, "cpu").permute(0, 3, 1, 2)
+            for k, size in enumerate(plan.sizes)
+        ]
+        frame_bufs = [
+            plan.buffer(("frame", k), (1,) + size + (3,), torch.uint8, "cpu").numpy()
+            for k, size in enumerate(plan.sizes)
+        ]
+
+        t_torch, _ = timeit(
+            lambda: list(pyramid_levels(frames.permute(0, 3, 1, 2).float(), plan.sizes))
+        )
+        t_cv2, _ = timeit(
+            lambda: list(pyramid_levels_cv2(frames.numpy(), plan.sizes, frame_bufs, outs))
+        )
+        t_detect, (boxes, _) = timeit(lambda: mtcnn.detect(img))
+        t_detect_cv2, (boxes_cv2, _) = timeit(lambda: mtcnn_cv2.detect(img))
+        faces = 0 if boxes is None else len(boxes)
+        faces_cv2 = 0 if boxes_cv2 is None else len(boxes_cv2)
+        print(
+            f"{path:<28} {len(plan.scales):>7} {t_torch * 1000:>13.1f} {t_cv2 * 1000:>11.1f} "
+            f"{t_detect * 1000:>9.1f} {t_detect_cv2 * 1000:>7.1f} {f'{faces}/{faces_cv2}':>6}"
+        )
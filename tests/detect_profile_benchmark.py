@@ -0,0 +1,50 @@
+"""Report where MTCNN detection time goes, stage by stage, on the repo images.
+
+Every image is detected several times with profiling on; the median time of each stage and the
+candidate counts after each threshold and NMS step are printed per image, followed by the cost of
+the hook itself. Run from the repository root:
+    python -m tests.detect_profile_benchmark
+"""
+import time
+
+import cv2 as cv
+import numpy as np
+import torch
+
+from facenet.models.mtcnn import MTCNN
+from facenet.models.utils.profiling import HistogramSink
+
+IMAGES = ["facenet/data/multiface.jpg", "ID2.png", "SAM_ID.png", "resources/ekyc.jpg"]
+REPEAT = 5
+
+if __name__ == "__main__":
+    torch.set_grad_enabled(False)
+    for path in IMAGES:
+        img = cv.cvtColor(cv.imread(path), cv.COLOR_BGR2RGB)
+        sink = HistogramSink()
+        mtcnn = MTCNN(keep_all=True, profile_sink=sink)
+        for _ in range(REPEAT + 1):
+            mtcnn.detect(img)
+
+        summary = sink.summary()
+        print(f"\n{path} ({img.shape[1]}x{img.shape[0]}), total {summary['total']['p50']:.1f} ms")
+        for key, stats in summary.items():
+            if key.startswith("time/"):
+                print(f"  {key[5:]:<16} {stats['p50']:>8.2f} ms")
+        counts = ", ".join(
+            f"{key[6:]} {int(stats['p50'])}" for key, stats in summary.items()
+            if key.startswith("count/")
+        )
+        print(f"  counts: {counts}")
+
+    # Cost of the hook: plain detection against detection with profiling on
+    img = cv.cvtColor(cv.imread(IMAGES[1]), cv.COLOR_BGR2RGB)
+    for label, sink in [("off", None), ("on", HistogramSink())]:
+        mtcnn = MTCNN(profile_sink=sink)
+        mtcnn.detect(img)
+        times = []
+        for _ in range(10):
+            start = time.perf_counter()
+            mtcnn.detect(img)
+            times.append(time.perf_counter() - start)
+        print(f"profiling {label:<3} {np.median(times) * 1000:>8.2f} ms")
@@ -0,0 +1,58 @@
+"""Benchmark face selection and padding on flat Detections against the per-face Python loop.
+
+Synthetic detections for batches of images with many faces are post-processed the way
+extract_face did before (min_prob filter, largest box, padding_face in a loop over dtype=object
+arrays) and with select_faces over a Detections object. Run from the repository root:
+    python -m tests.detections_benchmark
+"""
+import numpy as np
+
+from facenet.models.utils.detections import Detections
+from tests.bench_utils import timeit
+from utils.functions import padding_face, select_faces
+
+
+def loop_select(batch_boxes, batch_probs, padding=1.5, min_prob=0.9):
+    # The per-image, per-face loop extract_face used before select_faces
+    selected = []
+    for boxes, prob in zip(batch_boxes, batch_probs):
+        boxes = boxes[prob > min_prob]
+        max_area = 0
+        max_box = np.array([0, 0, 0, 0])
+        for box in boxes:
+            box = np.clip(box, 0, np.inf).astype(np.uint32)
+            x1, y1, x2, y2 = box
+            if (x2 - x1) * (y2 - y1) > max_area:
+                max_box = np.array(padding_face(box, padding))
+                max_area = (x2 - x1) * (y2 - y1)
+        selected.append(max_box)
+    return np.stack(selected)
+
+
+def random_detections(rng, num_images, faces_per_image):
+    counts = rng.integers(0, 2 * faces_per_image + 1, num_images)
+    xy = rng.uniform(0, 600, (counts.sum(), 2))
+    size = rng.uniform(20, 200, (counts.sum(), 1))
+    boxes = np.concatenate([xy, xy + size], axis=1).astype(np.float32)
+    probs = rng.uniform(0.7, 1.0, counts.sum()).astype(np.float32)
+    landmarks = np.zeros((counts.sum(), 5, 2), dtype=np.float32)
+    image_inds = np.repeat(np.arange(num_images), counts)
+    return Detections(boxes, probs, landmarks, image_inds, [(640, 800)] * num_images)
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    print(f"{'images':>7} {'faces':>7} {'loop ms':>9} {'flat ms':>9} {'speedup':>8}")
+    for num_images, faces_per_image in [(16, 1), (256, 1), (256, 8), (1024, 4)]:
+        detections = random_detections(rng, num_images, faces_per_image)
+        per_image = [detections[i] for i in range(num_images)]
+        batch_boxes = np.array([boxes for boxes, _, _ in per_image], dtype=object)
+        batch_probs = np.array([probs for _, probs, _ in per_image], dtype=object)
+
+        t_loop, ref = timeit(lambda: loop_select(batch_boxes, batch_probs))
+        t_flat, (_, out) = timeit(lambda: select_faces(detections, 1.5))
+        assert np.array_equal(ref, out)
+        print(
+            f"{num_images:>7} {len(detections):>7} {t_loop * 1000:>9.2f} {t_flat * 1000:>9.2f} "
+            f"{t_loop / t_flat:>7.1f}x"
+        )
@@ -0,0 +1,49 @@
+"""Benchmark batched VGGFace2.embed_faces against one face_transform and forward per face.
+
+Face crops of random sizes are embedded once per face, as verification used to, and with
+embed_faces for a verification pair and for offline batches with several max_batch values. Only the
+batching differs between the two, so a seeded random-weight InceptionResnetV1 times them like the
+trained one, and its embeddings are checked against the per-face ones.
+Run from the repository root:
+    python -m tests.embed_faces_benchmark
+"""
+import numpy as np
+import torch
+
+from tests.bench_utils import timeit
+from utils.functions import face_transform
+from verification_models.VGGFace2 import embed_faces, load_model
+
+REPEAT = 5
+
+
+def per_face(faces, model):
+    with torch.inference_mode():
+        return torch.cat([
+            model(face_transform(face, model_name="VGG-Face2", device=model.device()))
+            for face in faces
+        ])
+
+
+if __name__ == "__main__":
+    torch.manual_seed(0)
+    rng = np.random.default_rng(0)
+    model = load_model(pretrained=None)
+    faces = [
+        rng.integers(0, 256, (h, w, 3), dtype=np.uint8)
+        for h, w in rng.integers(80, 300, (64, 2))
+    ]
+
+    print(f"{'faces':>5} {'max_batch':>9} {'per-face ms':>12} {'batched ms':>11} {'speedup':>8} "
+          f"{'max diff':>9}")
+    for n, max_batch in [(2, 32), (16, 4), (16, 16), (64, 32), (64, 64)]:
+        t_ref, ref = timeit(lambda: per_face(faces[:n], model), REPEAT, np.median)
+        t_batch, out = timeit(
+            lambda: embed_faces(faces[:n], model, max_batch=max_batch), REPEAT, np.median
+        )
+        diff = (out - ref).abs().max().item()
+        assert out.shape == (n, 512) and diff < 1e-4
+        print(
+            f"{n:>5} {max_batch:>9} {t_ref * 1000:>12.1f} {t_batch * 1000:>11.1f} "
+            f"{t_ref / t_batch:>7.2f}x {diff:>9.2g}"
+        )
@@ -0,0 +1,48 @@
+"""Profile the import time of the headless entry points.
+
+Every entry point is imported in a fresh interpreter with python -X importtime, REPEAT times. The
+best total time and the time on top of importing torch, which they all need, are printed with
+the slowest modules imported on the way that are not part of torch. Times depend on the machine,
+so nothing is asserted here; tests/test_imports.py checks that the heavy optional dependencies
+stay unimported, and that the time outside torch and OpenCV stays within a generous budget. Run from the repository root:
+    python -m tests.import_time_benchmark
+"""
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPEAT = 3
+ENTRY_POINTS = ["face_verification", "challenge_response", "model_server", "utils.startup"]
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def import_time(module):
+    """Cumulative import time of every module imported by `module`, in seconds."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            times[match.group(4)] = int(match.group(2)) / 1e6
+    return times
+
+
+if __name__ == "__main__":
+    print(f"{'entry point':<20} {'total ms':>9} {'w/o torch ms':>13}  slowest other imports")
+    for module in ENTRY_POINTS:
+        times = min((import_time(module) for _ in range(REPEAT)), key=lambda run: run[module])
+        total = times[module]
+        own = total - times["torch"]
+        slowest = sorted(
+            (name for name in times if name.split(".")[0] != "torch" and name != module),
+            key=times.get, reverse=True
+        )[:3]
+        print(
+            f"{module:<20} {total * 1000:>9.1f} {own * 1000:>13.1f}  "
+            + ", ".join(f"{name} {times[name] * 1000:.0f}" for name in slowest)
+        )
@@ -0,0 +1,73 @@
+"""Benchmark the resident memory saved by loading verification models with inference_only=True.
+
+Memory depends on the shapes of the weights, not their values, so seeded random state dicts of
+VGGFace and VGGFace2 with every layer, including the classifier heads that inference_only drops,
+are saved to a temporary directory. Every model is then loaded by its load_model in a fresh
+process, with and without inference_only, which reports the resident set size added by loading and
+at its peak, the parameter count and the output on a fixed input. VGGFace2 embeddings must not
+change; VGGFace returns fc7 descriptors instead of class probabilities.
+Run from the repository root:
+    python -m tests.inference_loading_benchmark
+"""
+import contextlib
+import io
+import os
+import subprocess
+import sys
+import tempfile
+
+import torch
+
+from tests.bench_utils import peak_rss, rss
+from verification_models import VGGFace, VGGFace2
+
+MODELS = {"vggface": (VGGFace, 224), "vggface2": (VGGFace2, 160)}
+
+
+def run(name, weights, inference_only):
+    # Child process: load one model and report its memory
+    torch.set_grad_enabled(False)
+    module, size = MODELS[name]
+    base = rss()
+    with contextlib.redirect_stdout(sys.stderr):
+        model = module.load_model(weights, inference_only=inference_only == "True")
+    loaded = rss() - base
+    peak = peak_rss() - base
+    params = sum(p.numel() for p in model.parameters())
+    torch.manual_seed(0)
+    out = model(torch.rand(2, 3, size, size) * 2 - 1)
+    torch.save((loaded, peak, params, out), sys.stdout.buffer)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        run(*sys.argv[1:])
+        sys.exit()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(
+            f"{'model':<9} {'inference_only':<15} {'params M':>9} {'load MiB':>9} {'peak MiB':>9} "
+            f"{'saved MiB':>10}"
+        )
+        for name, (module, _) in MODELS.items():
+            weights = os.path.join(tmp, name + ".pt")
+            torch.manual_seed(0)
+            full = module.VGGFace() if name == "vggface" else module.InceptionResnetV1()
+            torch.save(full.state_dict(), weights)
+            del full
+
+            results = {}
+            for inference_only in [False, True]:
+                result = subprocess.run(
+                    [sys.executable, "-m", __spec__.name, name, weights, str(inference_only)],
+                    stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True
+                )
+                results[inference_only] = torch.load(io.BytesIO(result.stdout))
+                loaded, peak, params, out = results[inference_only]
+                print(
+                    f"{name:<9} {str(inference_only):<15} {params / 1e6:>9.2f} "
+                    f"{loaded / 2 ** 20:>9.1f} {peak / 2 ** 20:>9.1f} "
+                    f"{(results[False][0] - loaded) / 2 ** 20:>10.1f}"
+                )
+            if name == "vggface2":
+                assert torch.equal(results[False][3], results[True][3])
@@ -0,0 +1,89 @@
+"""Benchmark VGGFace.load_model(lean=True) against the full float32 model.
+
+Two seeded random state dicts are saved to a temporary directory, as the weight file is not part
+of the repository: the default initialization, whose fc6 and fc7 have a flat singular value
+spectrum and are the worst case for a low-rank factorization, and one where 90% of their energy
+lies in 256 directions, closer to trained layers. Lean state dicts are built up front, then every
+configuration is loaded in a fresh process, which reports the resident set size added by loading,
+the median latency of a batch, and its fc7 descriptors. Cosine similarity of the descriptors with
+those of the full model is printed. Run from the repository root:
+    python -m tests.lean_vggface_benchmark
+"""
+import contextlib
+import io
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+import torch
+
+from tests.bench_utils import rss, timeit
+from verification_models import VGGFace
+
+RANKS = [None, 1024, 256]
+REPEAT = 5
+
+
+def run(weights, rank):
+    # Child process: load one configuration, time it and return its descriptors
+    torch.set_grad_enabled(False)
+    base = rss()
+    if rank == "fp32":
+        model = VGGFace.load_model(weights, inference_only=True)
+    else:
+        model = VGGFace.load_model(weights, lean=True, rank=None if rank == "full" else int(rank))
+    loaded = rss() - base
+    torch.manual_seed(0)
+    x = torch.rand(4, 3, 224, 224) * 2 - 1
+    t, out = timeit(lambda: model(x), REPEAT, np.median)
+    torch.save((loaded, rss() - base, float(t), out), sys.stdout.buffer)
+
+
+def state_dict(low_rank_energy=None):
+    torch.manual_seed(0)
+    state = VGGFace.VGGFace().state_dict()
+    if low_rank_energy:
+        for name in ["fc6", "fc7"]:
+            noise = state[name + ".weight"]
+            low_rank = torch.randn(noise.shape[0], 256) @ torch.randn(256, noise.shape[1])
+            low_rank *= noise.norm() / low_rank.norm()
+            state[name + ".weight"] = (
+                low_rank_energy ** 0.5 * low_rank + (1 - low_rank_energy) ** 0.5 * noise
+            )
+    return state
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        run(*sys.argv[1:])
+        sys.exit()
+
+    print(
+        f"{'weights':<10} {'model':<12} {'load MiB':>9} {'run MiB':>9} {'ms':>8} "
+        f"{'mean cos':>9} {'min cos':>8}"
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, energy in [("random", None), ("low-rank", 0.9)]:
+            weights = os.path.join(tmp, label + ".pt")
+            torch.save(state_dict(energy), weights)
+            for rank in RANKS:
+                # Build the lean state dict once, so children measure loading it
+                with contextlib.redirect_stdout(sys.stderr):
+                    VGGFace.load_model(weights, lean=True, rank=rank)
+
+            ref = None
+            for rank in ["fp32"] + ["full" if r is None else str(r) for r in RANKS]:
+                result = subprocess.run(
+                    [sys.executable, "-m", __spec__.name, weights, rank],
+                    stdout=subprocess.PIPE, check=True
+                )
+                loaded, used, seconds, out = torch.load(io.BytesIO(result.stdout))
+                ref = out if ref is None else ref
+                cos = torch.nn.functional.cosine_similarity(out, ref)
+                name = rank if rank == "fp32" else f"fp16 r={rank}"
+                print(
+                    f"{label:<10} {name:<12} {loaded / 2 ** 20:>9.1f} {used / 2 ** 20:>9.1f} "
+                    f"{seconds * 1000:>8.1f} {cos.mean():>9.4f} {cos.min():>8.4f}"
+                )
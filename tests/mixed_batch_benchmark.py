@@ -0,0 +1,44 @@
+"""Benchmark MTCNN throughput on batches of differently sized images.
+
+Compares detecting the repo images one at a time with a single MTCNN.detect() call on the mixed
+list, checks that both find the same boxes and reports images per second.
+Run from the repository root:
+    python -m tests.mixed_batch_benchmark
+"""
+import cv2 as cv
+import numpy as np
+import torch
+
+from facenet.models.mtcnn import MTCNN
+from tests.bench_utils import timeit
+
+IMAGES = [
+    "facenet/data/multiface.jpg", "ID2.png", "ID3.jpg", "SAM_ID.png", "resources/ekyc.jpg",
+    "resources/flow.jpg"
+]
+
+
+def same_boxes(a, b):
+    if a is None or b is None:
+        return a is None and b is None
+    return a.shape == b.shape and np.allclose(a, b, atol=1e-3)
+
+
+if __name__ == "__main__":
+    torch.set_grad_enabled(False)
+    imgs = [cv.cvtColor(cv.imread(path), cv.COLOR_BGR2RGB) for path in IMAGES]
+    for path, img in zip(IMAGES, imgs):
+        print(f"{path:<28} {img.shape[1]}x{img.shape[0]}")
+
+    print(f"\n{'config':<24} {'batch':>6} {'one by one':>11} {'mixed batch':>12} {'speedup':>8}")
+    for config in [{}, {"mosaic": True}, {"cv2_pyramid": True}]:
+        mtcnn = MTCNN(keep_all=True, **config)
+        for repeat in [1, 4]:
+            batch = imgs * repeat
+            t_single, single = timeit(lambda: [mtcnn.detect(img)[0] for img in batch])
+            t_mixed, (mixed, _) = timeit(lambda: mtcnn.detect(batch))
+            assert all(same_boxes(a, b) for a, b in zip(single, mixed))
+            print(
+                f"{str(config):<24} {len(batch):>6} {len(batch) / t_single:>8.1f}/s "
+                f"{len(batch) / t_mixed:>9.1f}/s {t_single / t_mixed:>7.2f}x"
+            )
@@ -0,0 +1,110 @@
+"""Benchmark the pre-fork ModelServer against independent processes that each load the models.
+
+MTCNN, VGGFace2 and the emotion model are served. What is measured is how loaded weights are shared
+between processes, so VGGFace2 and the emotion model load seeded random weights of the real shapes
+from a temporary directory; the blink detector is left out, as dlib and its landmark file are
+optional. First, WORKERS independent processes load the models and answer one verification each.
+Then a parent loads them once and forks WORKERS workers, each of which answers one verification of
+its own client connection. For every process, the time from start (or fork) until it is ready to
+serve, the time until the client has its first answer, and the private memory and PSS while all are
+alive are printed; private memory is what each additional worker costs. Pre-forked workers answer
+one after the other on one core, so later ones wait for earlier ones. Run from the repository root:
+    python -m tests.model_server_benchmark
+"""
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2 as cv
+import torch
+
+from liveness_detection.emotion_prediction import EmotionDetectionModel
+from model_server import ModelClient, ModelServer, Worker, load_models, memory_usage
+from verification_models import VGGFace2
+
+WORKERS = 4
+MODELS = ["mtcnn", "verifier", "emotion"]
+IMAGES = ["ID2.png", "resources/ekyc.jpg"]
+
+
+def read_images():
+    return [cv.cvtColor(cv.imread(path), cv.COLOR_BGR2RGB) for path in IMAGES]
+
+
+def models(tmp):
+    return load_models(
+        MODELS, verifier_weights=os.path.join(tmp, "vggface2.pt"),
+        emotion_weights=os.path.join(tmp, "emotion.pt")
+    )
+
+
+def standalone(tmp):
+    # Independent process: load everything, answer once, then wait for the others
+    start = time.perf_counter()
+    sys.stdout = sys.stderr
+    worker = Worker(models(tmp), threads=1)
+    startup = time.perf_counter() - start
+    result = worker.verify(*read_images())
+    first = time.perf_counter() - start
+    sys.stdout = sys.__stdout__
+    sys.stdout.buffer.write(b"ready\n")
+    sys.stdout.flush()
+    sys.stdin.readline()
+    torch.save((startup, first, memory_usage(), result), sys.stdout.buffer)
+
+
+def print_row(mode, i, startup, first, memory):
+    print(
+        f"{mode:<11} {i:>6} {startup * 1000:>10.1f} {first * 1000:>15.1f} "
+        f"{memory['private'] / 2 ** 20:>12.1f} {memory['pss'] / 2 ** 20:>8.1f}"
+    )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        standalone(*sys.argv[1:])
+        sys.exit()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        torch.manual_seed(0)
+        torch.save(VGGFace2.InceptionResnetV1().state_dict(), os.path.join(tmp, "vggface2.pt"))
+        torch.save(EmotionDetectionModel().state_dict(), os.path.join(tmp, "emotion.pt"))
+
+        print(
+            f"{'mode':<11} {'worker':>6} {'startup ms':>10} {'first answer ms':>15} "
+            f"{'private MiB':>12} {'PSS MiB':>8}"
+        )
+        processes = []
+        for _ in range(WORKERS):
+            processes.append(subprocess.Popen(
+                [sys.executable, "-m", __spec__.name, tmp],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+            ))
+            assert processes[-1].stdout.readline() == b"ready\n"
+        for process in processes:
+            process.stdin.write(b"\n")
+            process.stdin.flush()
+        for i, process in enumerate(processes):
+            startup, first, memory, reference = torch.load(io.BytesIO(process.communicate()[0]))
+            print_row("standalone", i + 1, startup, first, memory)
+
+        loaded = models(tmp)
+        images = read_images()
+        with ModelServer(loaded, workers=WORKERS) as server:
+            start = time.perf_counter()
+            # Every open connection is held by its own worker
+            clients = [ModelClient(server.address, server.authkey) for _ in range(WORKERS)]
+            firsts = []
+            for client in clients:
+                assert client("verify", *images) == reference
+                firsts.append(time.perf_counter() - start)
+            stats = [client("stats") for client in clients]
+            assert len({s["pid"] for s in stats}) == WORKERS
+            print_row("parent", 0, 0, 0, memory_usage())
+            for i, (first, s) in enumerate(zip(firsts, stats)):
+                print_row("pre-fork", i + 1, s["startup"], first, s)
+            for client in clients:
+                client.close()
@@ -0,0 +1,101 @@
+"""Benchmark the ONNX Runtime backend against eager PyTorch for MTCNN, VGGFace2 and emotion models.
+
+Every model and backend runs in a fresh process, which reports the resident set size added by
+loading the model and by running it, the median latency, and its outputs, which are compared with
+eager PyTorch's. The comparison only needs the same weights on both backends, so VGGFace2 and the
+emotion model are built from seeded random weights. Graphs are exported to a temporary directory up
+front. Run from the repository root:
+    python -m tests.onnx_backend_benchmark
+"""
+import io
+import os
+import subprocess
+import sys
+import tempfile
+
+import cv2 as cv
+import numpy as np
+import torch
+
+from facenet.models.mtcnn import MTCNN
+from facenet.models.utils.onnx_backend import load_onnx
+from liveness_detection.emotion_prediction import EmotionDetectionModel
+from tests.bench_utils import rss, timeit
+from verification_models.VGGFace2 import InceptionResnetV1
+
+IMAGES = ["facenet/data/multiface.jpg", "ID2.png", "SAM_ID.png", "resources/ekyc.jpg"]
+REPEAT = 10
+
+
+CLASSIFIERS = {
+    "vggface2": (InceptionResnetV1, (8, 3, 160, 160), ["embedding"]),
+    "emotion": (EmotionDetectionModel, (8, 1, 64, 64), ["logits"]),
+}
+
+
+def classifier(name, backend, onnx_dir):
+    # Seeded, so the eager model and the exported graph get the same weights and inputs
+    torch.manual_seed(0)
+    build, shape, outputs = CLASSIFIERS[name]
+    sample = torch.rand(shape)
+    if backend == "onnx":
+        path = os.path.join(onnx_dir, name + ".onnx")
+        model = load_onnx(path, lambda: build().eval(), sample[:2], outputs)
+    else:
+        model = build().eval()
+    return lambda: model(sample)
+
+
+def run(name, backend, onnx_dir):
+    # Child process: load one model on one backend and time it
+    torch.set_grad_enabled(False)
+    base = rss()
+    if name == "mtcnn":
+        mtcnn = MTCNN(keep_all=True, backend=backend, onnx_dir=onnx_dir)
+        imgs = [cv.cvtColor(cv.imread(path), cv.COLOR_BGR2RGB) for path in IMAGES]
+        fn = lambda: [mtcnn.detect(img, landmarks=True) for img in imgs]
+    else:
+        fn = classifier(name, backend, onnx_dir)
+    loaded = rss() - base
+    t, out = timeit(fn, REPEAT, np.median)
+    torch.save((loaded, rss() - base, t, out), sys.stdout.buffer)
+
+
+def max_diff(a, b):
+    if isinstance(a, (list, tuple)):
+        return max([max_diff(x, y) for x, y in zip(a, b)] + [0.0])
+    if a is None or (isinstance(a, np.ndarray) and a.dtype == object):
+        return max_diff(list(a), list(b)) if a is not None else 0.0
+    return float(np.abs(np.asarray(a, dtype=np.float64) - np.asarray(b, dtype=np.float64)).max())
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        run(*sys.argv[1:])
+        sys.exit()
+
+    with tempfile.TemporaryDirectory() as onnx_dir:
+        # Export once up front, so that export time is not charged to the ONNX runs
+        MTCNN().export_onnx(onnx_dir)
+        for name in ["vggface2", "emotion"]:
+            classifier(name, "onnx", onnx_dir)
+
+        print(
+            f"{'model':<9} {'backend':<8} {'load MiB':>9} {'run MiB':>9} {'ms':>9} "
+            f"{'max diff':>9}"
+        )
+        for name in ["mtcnn", "vggface2", "emotion"]:
+            ref = None
+            for backend in ["torch", "onnx"]:
+                result = subprocess.run(
+                    [sys.executable, "-m", __spec__.name, name, backend, onnx_dir],
+                    stdout=subprocess.PIPE, check=True
+                )
+                loaded, used, seconds, out = torch.load(
+                    io.BytesIO(result.stdout), weights_only=False
+                )
+                ref = out if ref is None else ref
+                print(
+                    f"{name:<9} {backend:<8} {loaded / 2 ** 20:>9.1f} {used / 2 ** 20:>9.1f} "
+                    f"{seconds * 1000:>9.1f} {max_diff(out, ref):>9.2g}"
+                )
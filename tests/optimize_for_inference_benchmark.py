@@ -0,0 +1,64 @@
+"""Benchmark VGGFace2.optimize_for_inference against the unmodified InceptionResnetV1.
+
+A seeded random-weight model, with random batch norm statistics so that folding is not a no-op,
+is saved to a temporary file and loaded by load_model as is, optimized, and optimized with
+channels_last weights. The second optimized load reads the cached folded state dict. Embeddings of
+NHWC batches, laid out as embed_faces builds them, are checked against the original model's and
+median latencies are printed. Run from the repository root:
+    python -m tests.optimize_for_inference_benchmark
+"""
+import os
+import tempfile
+import time
+
+import numpy as np
+import torch
+from torch import nn
+
+from tests.bench_utils import timeit
+from verification_models.VGGFace2 import InceptionResnetV1, load_model
+
+REPEAT = 10
+
+
+def random_model():
+    torch.manual_seed(0)
+    model = InceptionResnetV1()
+    with torch.no_grad():
+        for module in model.modules():
+            if isinstance(module, (nn.BatchNorm1d, nn.BatchNorm2d)):
+                module.weight.uniform_(0.5, 1.5)
+                module.bias.uniform_(-0.1, 0.1)
+                module.running_mean.uniform_(-0.1, 0.1)
+                module.running_var.uniform_(0.5, 1.5)
+    return model
+
+
+if __name__ == "__main__":
+    torch.set_grad_enabled(False)
+    with tempfile.TemporaryDirectory() as tmp:
+        weights = os.path.join(tmp, "vggface2.pt")
+        torch.save(random_model().state_dict(), weights)
+        models = {"original": load_model(weights)}
+        start = time.perf_counter()
+        load_model(weights, optimize=True)
+        fold_time = time.perf_counter() - start
+        start = time.perf_counter()
+        models["folded"] = load_model(weights, optimize=True)
+        cached_time = time.perf_counter() - start
+        models["folded+channels_last"] = load_model(weights, optimize=True, channels_last=True)
+        assert os.path.exists(os.path.join(tmp, "vggface2_folded.pt"))
+    print(f"load with folding {fold_time * 1000:.0f} ms, from cache {cached_time * 1000:.0f} ms")
+
+    print(f"{'model':<22} {'batch':>5} {'ms':>9} {'speedup':>8} {'max diff':>9}")
+    for batch_size in [1, 16]:
+        # NHWC buffer viewed as NCHW, as embed_faces passes it
+        x = torch.rand(batch_size, 160, 160, 3).sub(0.5).mul(2).permute(0, 3, 1, 2)
+        results = {
+            name: timeit(lambda: model(x), REPEAT, np.median) for name, model in models.items()
+        }
+        t_ref, ref = results["original"]
+        for name, (t, out) in results.items():
+            diff = (out - ref).abs().max().item()
+            assert diff < 1e-4
+            print(f"{name:<22} {batch_size:>5} {t * 1000:>9.1f} {t_ref / t:>7.2f}x {diff:>9.2g}")
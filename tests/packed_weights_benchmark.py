@@ -0,0 +1,117 @@
+"""Benchmark cold start and memory of models loaded from a packed weights file against torch.load.
+
+MTCNN, VGGFace2 (inference only) and the emotion model are loaded as main.py loads them, from
+their .pt files or from one file written by pack_weights. VGGFace2 and the emotion model use
+seeded random weights saved to a temporary directory, as their weight files are not part of the
+repository. For every mode two worker processes start one after the other and stay alive
+together. Each reports the time to load the models and to run their first inference, and its
+resident (RSS), proportional (PSS) and private set sizes once both are loaded. Pages mapped from
+the packed file are shared, so they count half in each worker's PSS and not in its private size.
+Cold runs first evict all weight files from the page cache. Run from the repository root:
+    python -m tests.packed_weights_benchmark
+"""
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2 as cv
+import torch
+
+from facenet.models.mtcnn import MTCNN
+from facenet.models.utils.packed_weights import pack_weights
+from liveness_detection.emotion_prediction import EmotionDetectionModel, EmotionPredictor
+from tests.bench_utils import smaps
+from verification_models import VGGFace2
+
+MTCNN_WEIGHTS = [f"facenet/data/{name}.pt" for name in ["pnet", "rnet", "onet"]]
+
+
+def load(mode, tmp):
+    if mode == "packed":
+        packed = os.path.join(tmp, "weights.pack")
+        mtcnn = MTCNN(packed_weights=packed)
+        verifier = VGGFace2.load_model(inference_only=True, packed_weights=packed)
+        emotion = EmotionPredictor(packed_weights=packed)
+    else:
+        mtcnn = MTCNN()
+        verifier = VGGFace2.load_model(os.path.join(tmp, "vggface2.pt"), inference_only=True)
+        emotion = EmotionPredictor(os.path.join(tmp, "emotion.pt"))
+    return mtcnn, verifier, emotion
+
+
+def run(mode, tmp):
+    # Worker process: load, run once, then wait for the other worker before measuring memory
+    torch.set_grad_enabled(False)
+    img = cv.cvtColor(cv.imread("facenet/data/multiface.jpg"), cv.COLOR_BGR2RGB)
+    sys.stdout = sys.stderr
+    start = time.perf_counter()
+    mtcnn, verifier, emotion = load(mode, tmp)
+    loaded = time.perf_counter() - start
+    mtcnn.detect(img)
+    VGGFace2.embed_faces([img[:160, :160]], verifier)
+    emotion.model(torch.rand(1, 1, *emotion.img_size))
+    first = time.perf_counter() - start - loaded
+    sys.stdout = sys.__stdout__
+    sys.stdout.buffer.write(b"ready\n")
+    sys.stdout.flush()
+    sys.stdin.readline()
+    torch.save((loaded, first, smaps()), sys.stdout.buffer)
+
+
+def evict(paths):
+    for path in paths:
+        fd = os.open(path, os.O_RDONLY)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        os.close(fd)
+
+
+def start_worker(mode, tmp):
+    worker = subprocess.Popen(
+        [sys.executable, "-m", __spec__.name, mode, tmp],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+    )
+    assert worker.stdout.readline() == b"ready\n"
+    return worker
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        run(*sys.argv[1:])
+        sys.exit()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        torch.manual_seed(0)
+        vggface2 = VGGFace2.InceptionResnetV1().state_dict()
+        emotion = EmotionDetectionModel().state_dict()
+        torch.save(vggface2, os.path.join(tmp, "vggface2.pt"))
+        torch.save(emotion, os.path.join(tmp, "emotion.pt"))
+        mtcnn = MTCNN()
+        state_dicts = {name: getattr(mtcnn, name).state_dict() for name in ["pnet", "rnet", "onet"]}
+        state_dicts["vggface2"] = {k: v for k, v in vggface2.items() if not k.startswith("logits")}
+        state_dicts["emotion"] = emotion
+        pack_weights(state_dicts, os.path.join(tmp, "weights.pack"))
+        files = MTCNN_WEIGHTS + [os.path.join(tmp, name) for name in os.listdir(tmp)]
+
+        print(
+            f"{'mode':<7} {'cache':<5} {'worker':>6} {'load ms':>8} {'first ms':>9} "
+            f"{'RSS MiB':>8} {'PSS MiB':>8} {'private MiB':>12}"
+        )
+        for mode in ["torch", "packed"]:
+            for cache in ["cold", "warm"]:
+                if cache == "cold":
+                    evict(files)
+                workers = [start_worker(mode, tmp), start_worker(mode, tmp)]
+                # Both measure while the other is still alive
+                for worker in workers:
+                    worker.stdin.write(b"\n")
+                    worker.stdin.flush()
+                results = [torch.load(io.BytesIO(w.communicate()[0])) for w in workers]
+                for i, (loaded, first, memory) in enumerate(results):
+                    print(
+                        f"{mode:<7} {cache:<5} {i + 1:>6} {loaded * 1000:>8.1f} "
+                        f"{first * 1000:>9.1f} {memory['Rss'] / 2 ** 20:>8.1f} "
+                        f"{memory['Pss'] / 2 ** 20:>8.1f} {memory['Private'] / 2 ** 20:>12.1f}"
+                    )
@@ -0,0 +1,42 @@
+"""Benchmark the MTCNN detection plan cache on camera-sized frames.
+
+Frames are resized to the 640x480 used by the camera in main.MainWindow. For each pyramid
+configuration, reports the bytes allocated by tensor operations per detect() call and the detection
+time with the plan cache disabled and enabled. Run from the repository root:
+    python -m tests.plan_cache_benchmark
+"""
+import cv2 as cv
+import torch
+from torch.profiler import ProfilerActivity, profile
+
+from facenet.models.mtcnn import MTCNN
+from tests.bench_utils import timeit
+
+IMAGES = ["facenet/data/multiface.jpg", "ID2.png", "resources/ekyc.jpg"]
+CONFIGS = [{}, {"mosaic": True}, {"cv2_pyramid": True}, {"cv2_pyramid": True, "mosaic": True}]
+
+
+def allocated_bytes(fn):
+    """Total bytes allocated by CPU tensor operations during one call of fn."""
+    fn()
+    with profile(activities=[ProfilerActivity.CPU], profile_memory=True) as prof:
+        fn()
+    return sum(max(event.self_cpu_memory_usage, 0) for event in prof.key_averages())
+
+
+if __name__ == "__main__":
+    torch.set_grad_enabled(False)
+
+    print(f"{'image':<28} {'config':<32} {'MB/call':>14} {'ms':>14}")
+    print(f"{'':<28} {'':<32} {'none':>6} {'cache':>7} {'none':>6} {'cache':>7}")
+    for path in IMAGES:
+        frame = cv.resize(cv.cvtColor(cv.imread(path), cv.COLOR_BGR2RGB), (640, 480))
+        for config in CONFIGS:
+            uncached = MTCNN(keep_all=True, plan_cache_size=0, **config)
+            cached = MTCNN(keep_all=True, plan_cache_size=4, **config)
+            mb = [allocated_bytes(lambda: m.detect(frame)) / 2 ** 20 for m in (uncached, cached)]
+            ms = [timeit(lambda: m.detect(frame), 10)[0] * 1000 for m in (uncached, cached)]
+            print(
+                f"{path:<28} {str(config):<32} {mb[0]:>6.1f} {mb[1]:>7.1f} "
+                f"{ms[0]:>6.1f} {ms[1]:>7.1f}"
+            )
@@ -0,0 +1,37 @@
+"""Benchmark the PNet work saved by bounding the MTCNN scale pyramid with face size hints.
+
+For each repo image and (min, max) face size range, reports the number of pyramid levels, the
+number of pixels PNet has to process, the detection time and the number of faces found.
+Run from the repository root:
+    python -m tests.pyramid_bounds_benchmark
+"""
+import cv2 as cv
+import torch
+
+from facenet.models.mtcnn import MTCNN
+from facenet.models.utils.detect_face import compute_scales
+from tests.bench_utils import timeit
+
+IMAGES = ["facenet/data/multiface.jpg", "ID2.png", "ID3.jpg", "SAM_ID.png", "resources/ekyc.jpg"]
+
+# (min, max) face size in pixels; (20, None) is the unbounded default pyramid
+RANGES = [(20, None), (20, 300), (40, 300), (60, 250)]
+
+
+if __name__ == "__main__":
+    torch.set_grad_enabled(False)
+    mtcnn = MTCNN(keep_all=True)
+
+    print(f"{'image':<28} {'range':>11} {'levels':>7} {'PNet Mpx':>9} {'ms':>8} {'faces':>6}")
+    for path in IMAGES:
+        img = cv.cvtColor(cv.imread(path), cv.COLOR_BGR2RGB)
+        h, w = img.shape[:2]
+        for face_size_range in RANGES:
+            scales = compute_scales(h, w, face_size_range[0], mtcnn.factor, face_size_range[1])
+            pixels = sum(int(h * s + 1) * int(w * s + 1) for s in scales)
+            t, (boxes, _) = timeit(lambda: mtcnn.detect(img, face_size_range=face_size_range))
+            faces = 0 if boxes is None else len(boxes)
+            print(
+                f"{path:<28} {str(face_size_range[0]) + '-' + str(face_size_range[1]):>11} "
+                f"{len(scales):>7} {pixels / 1e6:>9.3f} {t * 1000:>8.1f} {faces:>6}"
+            )
@@ -0,0 +1,49 @@
+"""Benchmark int8 quantized MTCNN networks against the float ones.
+
+The repo images are copied to a temporary calibration folder and quantize_mtcnn is run, without
+saving, for all three networks and for RNet and ONet only. Recall, IoU and landmark error
+against the float cascade and the median detection time per image are printed. Run from the
+repository root:
+    python -m tests.quantization_benchmark
+"""
+import shutil
+import tempfile
+import time
+
+import cv2 as cv
+import numpy as np
+import torch
+
+from facenet.models.mtcnn import MTCNN
+from facenet.models.utils.quantization import quantize_mtcnn
+
+IMAGES = ["facenet/data/multiface.jpg", "ID2.png", "ID3.jpg", "SAM_ID.png", "resources/ekyc.jpg"]
+
+
+def median_time(mtcnn, imgs, repeat=5):
+    times = []
+    for img in imgs:
+        mtcnn.detect(img)
+        for _ in range(repeat):
+            start = time.perf_counter()
+            mtcnn.detect(img)
+            times.append(time.perf_counter() - start)
+    return np.median(times)
+
+
+if __name__ == "__main__":
+    torch.set_grad_enabled(False)
+    imgs = [cv.cvtColor(cv.imread(path), cv.COLOR_BGR2RGB) for path in IMAGES]
+    print(f"engine {torch.backends.quantized.engine}")
+    print(f"{'nets':<16} {'recall':>7} {'IoU':>6} {'lmk err':>8} {'ms':>8}")
+    print(f"{'float':<16} {'':>7} {'':>6} {'':>8} {median_time(MTCNN(), imgs) * 1000:>8.1f}")
+    with tempfile.TemporaryDirectory() as calibration_dir:
+        for path in IMAGES:
+            shutil.copy(path, calibration_dir)
+        for nets in [("pnet", "rnet", "onet"), ("rnet", "onet")]:
+            mtcnn, metrics = quantize_mtcnn(calibration_dir, nets, min_recall=0, save=False)
+            mtcnn.keep_all = False
+            print(
+                f"{'+'.join(nets):<16} {metrics['recall']:>7.3f} {metrics['mean_iou']:>6.3f} "
+                f"{metrics['landmark_error']:>8.4f} {median_time(mtcnn, imgs) * 1000:>8.1f}"
+            )
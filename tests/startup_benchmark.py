@@ -0,0 +1,97 @@
+"""Benchmark MainWindow's startup: models loaded one after another against the Startup pool.
+
+MTCNN, VGGFace2 (inference only), the face orientation detector and the emotion model are loaded as
+main.py loads them. VGGFace2 and the emotion model load seeded random weights of their real sizes
+from a temporary directory, which takes as long as loading the trained ones, and the blink detector
+is left out, as dlib and its landmark file are optional. There is no camera here, so opening it is
+stood in for by a CAMERA_OPEN second wait, which releases the GIL as cv.VideoCapture does. Every
+mode runs in a fresh process and prints its startup timeline, the time to ready and the time of the
+first and second frame after it: detecting the faces of a 640x480 image, embedding an ID face and
+selfie pair and predicting one emotion. Run from the repository root:
+    python -m tests.startup_benchmark
+"""
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2 as cv
+import torch
+
+from facenet.models.mtcnn import MTCNN
+from liveness_detection.emotion_prediction import EmotionDetectionModel, EmotionPredictor
+from liveness_detection.face_orientation import FaceOrientationDetector
+from utils.startup import Startup, warm_up_emotion, warm_up_mtcnn, warm_up_verifier
+from verification_models import VGGFace2
+
+CAMERA_OPEN = 0.5
+
+
+def open_camera():
+    time.sleep(CAMERA_OPEN)
+    return None
+
+
+def loaders(tmp):
+    return {
+        "mtcnn": (MTCNN, warm_up_mtcnn),
+        "verifier": (
+            lambda: VGGFace2.load_model(os.path.join(tmp, "vggface2.pt"), inference_only=True),
+            warm_up_verifier,
+        ),
+        "orientation": (FaceOrientationDetector, None),
+        "emotion": (lambda: EmotionPredictor(os.path.join(tmp, "emotion.pt")), warm_up_emotion),
+        "camera": (open_camera, None),
+    }
+
+
+def frame(models, img):
+    start = time.perf_counter()
+    models["mtcnn"].detect(img)
+    face = img[:160, :160]
+    VGGFace2.embed_faces([face, face], models["verifier"])
+    with torch.inference_mode():
+        models["emotion"].predict(img[:64, :64])
+    return time.perf_counter() - start
+
+
+def run(mode, tmp):
+    img = cv.cvtColor(cv.imread("facenet/data/multiface.jpg"), cv.COLOR_BGR2RGB)
+    img = cv.resize(img, (640, 480))
+    sys.stdout = sys.stderr
+    if mode == "sequential":
+        # One thread, the pool only records the timeline
+        startup = Startup(max_workers=1)
+        for name, (load, _) in loaders(tmp).items():
+            startup.submit(name, load)
+    else:
+        startup = Startup()
+        for name, (load, warm_up) in loaders(tmp).items():
+            startup.submit(name, load, warm_up)
+    models = startup.wait()
+    frames = [frame(models, img), frame(models, img)]
+    sys.stdout = sys.__stdout__
+    torch.save((startup.report(), frames), sys.stdout.buffer)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        run(*sys.argv[1:])
+        sys.exit()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        torch.manual_seed(0)
+        torch.save(VGGFace2.InceptionResnetV1().state_dict(), os.path.join(tmp, "vggface2.pt"))
+        torch.save(EmotionDetectionModel().state_dict(), os.path.join(tmp, "emotion.pt"))
+
+        for mode in ["sequential", "parallel"]:
+            output = subprocess.run(
+                [sys.executable, "-m", __spec__.name, mode, tmp],
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True
+            ).stdout
+            report, (first, second) = torch.load(io.BytesIO(output))
+            print(f"{mode}, {os.cpu_count()} cores")
+            print(report)
+            print(f"first frame {first * 1000:.1f} ms, second frame {second * 1000:.1f} ms\n")
@@ -0,0 +1,46 @@
+"""Benchmark pipelined streaming detection against sequential MTCNN.detect() calls.
+
+A sequence of 640x480 frames made from the repo images is run through MTCNN.detect() one frame at
+a time and through a StreamingDetector at several depths. The streamed results are checked to be
+identical, and frames per second are reported. Run from the repository root:
+    python -m tests.streaming_benchmark
+"""
+import os
+import pickle
+
+import cv2 as cv
+import torch
+
+from facenet.models.mtcnn import MTCNN
+from tests.bench_utils import timeit
+
+IMAGES = ["facenet/data/multiface.jpg", "ID2.png", "ID3.jpg", "SAM_ID.png", "resources/ekyc.jpg"]
+
+
+def run_stream(mtcnn, frames, depth):
+    results = []
+    with mtcnn.stream(depth=depth, landmarks=True) as stream:
+        for frame in frames:
+            stream.submit(frame)
+            results.extend(stream.results())
+        results.extend(stream.results(wait=True))
+    return results
+
+
+if __name__ == "__main__":
+    torch.set_grad_enabled(False)
+    frames = [
+        cv.resize(cv.cvtColor(cv.imread(path), cv.COLOR_BGR2RGB), (640, 480)) for path in IMAGES
+    ] * 4
+    mtcnn = MTCNN(keep_all=True)
+    print(f"{len(frames)} frames, {os.cpu_count()} CPUs, {torch.get_num_threads()} intra-op threads")
+
+    t_seq, ref = timeit(lambda: [mtcnn.detect(frame, landmarks=True) for frame in frames], 3)
+    print(f"{'sequential':<12} {len(frames) / t_seq:>7.1f} frames/s")
+    for depth in [1, 2, 4]:
+        t_stream, out = timeit(lambda: run_stream(mtcnn, frames, depth), 3)
+        assert pickle.dumps(out) == pickle.dumps(ref)
+        print(
+            f"{'depth ' + str(depth):<12} {len(frames) / t_stream:>7.1f} frames/s "
+            f"{t_seq / t_stream:>6.2f}x"
+        )
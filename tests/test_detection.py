@@ -0,0 +1,439 @@
+"""Equivalence tests of the MTCNN detection paths: every faster path must find the same faces as
+the reference path it replaces, on the repository images."""
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2 as cv
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+
+from facenet.models.mtcnn import MTCNN, ONet, RNet
+from facenet.models.utils import detect_face
+from facenet.models.utils.detect_face import (
+    batched_nms, batched_nms_numpy, batched_nms_torch, nms_numpy, nms_torch
+)
+from facenet.models.utils.detections import Detections
+from facenet.models.utils.profiling import HistogramSink, JsonLinesSink
+from facenet.models.utils.quantization import quantize_mtcnn
+from utils.functions import extract_face, extract_faces
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMAGES = ["facenet/data/multiface.jpg", "ID2.png", "resources/ekyc.jpg"]
+
+
+def read_image(path):
+    return cv.cvtColor(cv.imread(os.path.join(ROOT, path)), cv.COLOR_BGR2RGB)
+
+
+def random_crops(img, n, seed):
+    """Crops of random, often odd, sizes and positions, which give odd-sized pyramid levels."""
+    rng = np.random.default_rng(seed)
+    crops = []
+    for _ in range(n):
+        h, w = rng.integers(100, img.shape[0]), rng.integers(100, img.shape[1])
+        y, x = rng.integers(0, img.shape[0] - h + 1), rng.integers(0, img.shape[1] - w + 1)
+        crops.append(img[y:(y + h), x:(x + w)])
+    return crops
+
+
+def random_boxes(n, seed):
+    rng = np.random.default_rng(seed)
+    xy = rng.uniform(0, 200, (n, 2))
+    boxes = np.concatenate([xy, xy + rng.uniform(5, 60, (n, 2))], 1).astype(np.float32)
+    # Distinct scores, so that the pick order is fully determined
+    scores = rng.permutation(n).astype(np.float32) / n
+    idxs = rng.integers(0, 3, n)
+    return torch.from_numpy(boxes), torch.from_numpy(scores), torch.from_numpy(idxs)
+
+
+@pytest.fixture(scope="module")
+def images():
+    return [read_image(path) for path in IMAGES]
+
+
+@pytest.fixture(scope="module")
+def mtcnn():
+    return MTCNN(keep_all=True)
+
+
+def assert_same_detections(actual, expected, atol=0.0):
+    (boxes, probs, points), (ref_boxes, ref_probs, ref_points) = actual, expected
+    for box, prob, point, ref_box, ref_prob, ref_point in zip(
+        boxes, probs, points, ref_boxes, ref_probs, ref_points
+    ):
+        if ref_box is None:
+            assert box is None
+            continue
+        # detect() returns object arrays for a single image
+        for value, ref_value in [(box, ref_box), (prob, ref_prob), (point, ref_point)]:
+            value, ref_value = np.asarray(value, dtype=float), np.asarray(ref_value, dtype=float)
+            np.testing.assert_allclose(value, ref_value, atol=atol, rtol=0)
+
+
+def box_iou(boxes, ref_boxes):
+    lt = np.maximum(boxes[:, None, :2], ref_boxes[None, :, :2])
+    rb = np.minimum(boxes[:, None, 2:], ref_boxes[None, :, 2:])
+    inter = np.prod(np.clip(rb - lt, 0, None), 2)
+    areas = np.prod(boxes[:, 2:] - boxes[:, :2], 1)
+    ref_areas = np.prod(ref_boxes[:, 2:] - ref_boxes[:, :2], 1)
+    return inter / (areas[:, None] + ref_areas[None] - inter)
+
+
+def assert_same_faces(boxes, ref_boxes, min_iou=0.8):
+    """The same faces, one to one, in any order: faces with close probabilities may swap."""
+    iou = box_iou(boxes.astype(float), ref_boxes.astype(float))
+    assert len(boxes) == len(ref_boxes)
+    assert sorted(iou.argmax(1)) == list(range(len(ref_boxes)))
+    assert iou.max(1).min() >= min_iou
+
+
+def test_mosaic_matches_pyramid(images, mtcnn):
+    mosaic = MTCNN(keep_all=True, mosaic=True)
+    crops = random_crops(images[0], 40, seed=0) + [images[0][:401, :570], images[0][:333, :517]]
+    for img in images + crops:
+        expected = mtcnn.detect([img], landmarks=True)
+        assert_same_detections(mosaic.detect([img], landmarks=True), expected, atol=1e-3)
+
+
+def test_mixed_mosaic_matches_pyramid(images, mtcnn):
+    mosaic = MTCNN(keep_all=True, mosaic=True)
+    crops = random_crops(images[0], 6, seed=1)
+    expected = list(zip(*[mtcnn.detect(img, landmarks=True) for img in crops]))
+    assert_same_detections(mosaic.detect(crops, landmarks=True), expected, atol=1e-3)
+
+
+@pytest.mark.parametrize("dtype", [torch.uint8, torch.float32])
+def test_crop_resample_matches_imresample(dtype):
+    rng = np.random.default_rng(0)
+    imgs = torch.from_numpy(rng.integers(0, 256, (2, 3, 90, 120))).to(dtype)
+    n = 200
+    image_inds = torch.from_numpy(rng.integers(0, 2, n))
+    # Boxes in pad() coordinates: rows (y - 1):ey and columns (x - 1):ex, down to a single pixel
+    y = torch.from_numpy(rng.integers(1, 91, n))
+    x = torch.from_numpy(rng.integers(1, 121, n))
+    ey = torch.minimum(y + torch.from_numpy(rng.integers(0, 60, n)), torch.tensor(90))
+    ex = torch.minimum(x + torch.from_numpy(rng.integers(0, 60, n)), torch.tensor(120))
+    integral = detect_face.integral_image(imgs)
+    for sz in [[24, 24], [48, 48]]:
+        out = detect_face.crop_resample(integral, image_inds, y, ey, x, ex, sz)
+        expected = torch.cat([
+            detect_face.imresample(imgs[k, :, (y0 - 1):y1, (x0 - 1):x1].unsqueeze(0).float(), sz)
+            for k, y0, y1, x0, x1 in zip(image_inds, y, ey, x, ex)
+        ])
+        torch.testing.assert_close(out.float(), expected, atol=1e-3, rtol=0)
+
+
+def test_batched_nms_matches_torchvision():
+    from torchvision.ops import batched_nms as batched_nms_torchvision
+
+    # More than 4000 boxes takes torchvision's per-index path
+    for n in [0, 50, 5000]:
+        boxes, scores, idxs = random_boxes(n, n)
+        np.testing.assert_array_equal(
+            batched_nms(boxes, scores, idxs, 0.5), batched_nms_torchvision(boxes, scores, idxs, 0.5)
+        )
+
+
+@pytest.mark.parametrize("method", ["Union", "Min"])
+@pytest.mark.parametrize("threshold", [0.3, 0.7])
+def test_nms_torch_matches_numpy(method, threshold):
+    for seed in range(5):
+        boxes, scores, idxs = random_boxes(300, seed)
+        expected = nms_numpy(boxes.numpy(), scores.numpy(), threshold, method)
+        np.testing.assert_array_equal(nms_torch(boxes, scores, threshold, method), expected)
+        np.testing.assert_array_equal(
+            batched_nms_torch(boxes, scores, idxs, threshold, method),
+            batched_nms_numpy(boxes, scores, idxs, threshold, method),
+        )
+
+
+def test_track_refreshes_and_falls_back(images):
+    mtcnn = MTCNN(keep_all=True, track_interval=3)
+    img = images[0]
+    ref_boxes, _ = mtcnn.detect(img)
+
+    # The first frame is a full detection
+    boxes, _ = mtcnn.track(img)
+    np.testing.assert_array_equal(boxes, ref_boxes)
+    assert mtcnn.track_count == 0
+
+    # Following frames are refreshed by ONet, close to a full detection
+    for count in [1, 2]:
+        boxes, _ = mtcnn.track(img)
+        assert mtcnn.track_count == count
+        assert_same_faces(boxes, ref_boxes)
+
+    # track_interval forces a full detection
+    boxes, _ = mtcnn.track(img)
+    assert mtcnn.track_count == 0
+    np.testing.assert_array_equal(boxes, ref_boxes)
+
+    # A lost face falls back to a full detection, which finds nothing
+    boxes, _ = mtcnn.track(np.zeros_like(img))
+    assert boxes is None and mtcnn.track_count == 0
+    mtcnn.reset_tracking()
+    assert mtcnn.track_boxes is None
+
+
+@pytest.mark.parametrize("prev_boxes", [
+    [[2000, 2000, 2100, 2100]], [[-300, -300, -200, -200]], [[100, 80, 40, 20]],
+    [[100, 100, 140, 140], [5000, 10, 5100, 110]],
+])
+def test_track_boxes_outside_the_frame(images, prev_boxes):
+    # Faces that left the frame, or empty boxes, fall back to a full detection
+    mtcnn = MTCNN(keep_all=True)
+    ref_boxes, _ = mtcnn.detect(images[0])
+    boxes, _ = mtcnn.track(images[0], prev_boxes=np.array(prev_boxes, dtype=np.float32))
+    assert mtcnn.track_count == 0
+    np.testing.assert_array_equal(boxes, ref_boxes)
+
+
+def test_bounded_pyramid(images, mtcnn):
+    img = images[0]
+    h, w = img.shape[:2]
+    scales = detect_face.compute_scales(h, w, 20, mtcnn.factor)
+    bounded = detect_face.compute_scales(h, w, 40, mtcnn.factor, 300)
+    # Levels for faces between 40 and 300 pixels, down to the first one that reaches 300
+    assert bounded[0] == 12 / 40 and 12 / bounded[-1] >= 300 > 12 / bounded[-2]
+    assert len(bounded) < len(scales)
+
+    # The faces of multiface.jpg are 70 to 100 pixels wide, inside both ranges
+    ref_boxes, _ = mtcnn.detect(img)
+    assert_same_faces(mtcnn.detect(img, face_size_range=(40, 300))[0], ref_boxes)
+    bounded_mtcnn = MTCNN(keep_all=True, min_face_size=40, max_face_size=300)
+    assert_same_faces(bounded_mtcnn.detect(img)[0], ref_boxes)
+
+
+def test_cap_candidates():
+    boxes, scores, image_inds = random_boxes(100, 0)
+    pick = torch.arange(0, 100, 2)
+    capped, dropped = detect_face.cap_candidates(pick, scores[pick], image_inds[pick], 5)
+    assert dropped == len(pick) - len(capped)
+    # The 5 highest scores of every image are kept, in their original order
+    for k in range(3):
+        kept = capped[image_inds[capped] == k]
+        candidates = pick[image_inds[pick] == k]
+        expected = candidates[scores[candidates].argsort(descending=True)[:5]].sort()[0]
+        np.testing.assert_array_equal(kept, expected)
+
+
+def test_max_candidates(images, mtcnn):
+    img = images[0]
+    ref_boxes, _ = mtcnn.detect(img)
+    # Caps above the candidate counts change nothing
+    loose = MTCNN(keep_all=True, max_candidates=[100000, 100000])
+    np.testing.assert_array_equal(loose.detect(img)[0], ref_boxes)
+    assert loose.dropped_candidates == {"pnet": 0, "rnet": 0}
+    # Tight caps drop candidates, and never return more faces than the last cap
+    capped = MTCNN(keep_all=True, max_candidates=[50, 3])
+    boxes, _ = capped.detect(img)
+    assert capped.dropped_candidates["pnet"] > 0 and capped.dropped_candidates["rnet"] > 0
+    assert len(boxes) <= 3
+
+
+def test_cv2_pyramid_finds_the_same_faces(images, mtcnn):
+    cv2_pyramid = MTCNN(keep_all=True, cv2_pyramid=True)
+    for img in images:
+        assert_same_faces(cv2_pyramid.detect(img)[0], mtcnn.detect(img)[0])
+
+
+@pytest.mark.parametrize("options", [{}, {"mosaic": True}, {"cv2_pyramid": True}])
+def test_plan_cache_is_bit_identical(images, options):
+    cached = MTCNN(keep_all=True, plan_cache_size=4, **options)
+    uncached = MTCNN(keep_all=True, **options)
+    for img in images + images:
+        assert_same_detections(
+            cached.detect(img, landmarks=True), uncached.detect(img, landmarks=True)
+        )
+    assert len(cached.plans.plans) == len(images) and not uncached.plans.plans
+
+
+def test_detect_from_several_threads(images):
+    # Without the plan cache, concurrent calls on one MTCNN share no buffers
+    mtcnn = MTCNN(keep_all=True, mosaic=True)
+    frames = [images[0][:480, :640], images[0][-480:, -640:]] * 4
+    expected = [mtcnn.detect(frame, landmarks=True) for frame in frames]
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(lambda frame: mtcnn.detect(frame, landmarks=True), frames))
+    for result, ref in zip(results, expected):
+        assert_same_detections(result, ref)
+
+
+def test_mixed_batch_matches_single_images(images, mtcnn):
+    batch = mtcnn.detect(images, landmarks=True)
+    singles = [mtcnn.detect(img, landmarks=True) for img in images]
+    assert_same_detections(batch, list(zip(*singles)), atol=1e-4)
+
+
+def test_detections_round_trip():
+    rng = np.random.default_rng(0)
+    counts = [3, 0, 1, 4]
+    batch_boxes = [rng.uniform(0, 100, (n, 5)).astype(np.float32) for n in counts]
+    batch_points = [rng.uniform(0, 100, (n, 5, 2)).astype(np.float32) for n in counts]
+    detections = Detections.from_batch(batch_boxes, batch_points, [(100, 120)] * len(counts))
+    assert list(detections.counts) == counts and len(detections) == sum(counts)
+    for i, (box, point) in enumerate(zip(batch_boxes, batch_points)):
+        boxes, probs, landmarks = detections[i]
+        np.testing.assert_array_equal(boxes, box[:, :4])
+        np.testing.assert_array_equal(probs, box[:, 4])
+        np.testing.assert_array_equal(landmarks, point)
+    boxes, probs, points = detections.to_batch()
+    assert boxes[1] is None and probs[1] == [None] and points[1] is None
+    np.testing.assert_array_equal(boxes[3], batch_boxes[3][:, :4])
+
+
+def test_detections_match_detect(images, mtcnn):
+    detections = mtcnn.detect_flat(images)
+    assert list(detections.counts) == [len(boxes) for boxes, _ in map(mtcnn.detect, images)]
+    assert_same_detections(detections.to_batch(), mtcnn.detect(images, landmarks=True))
+
+
+@pytest.mark.parametrize(
+    "method", ["probability", "largest", "largest_over_threshold", "center_weighted_size"]
+)
+def test_select_matches_select_boxes(images, mtcnn, method):
+    boxes, probs, points = mtcnn.detect(images, landmarks=True)
+    # select_boxes() reads the image size from PIL images
+    pil_images = [Image.fromarray(img) for img in images]
+    ref_boxes, _, _ = mtcnn.select_boxes(boxes, probs, points, pil_images, method=method)
+    detections = mtcnn.detect_flat(images)
+    selected = detections.select(method)
+    for ind, ref_box in zip(selected, ref_boxes):
+        if ref_box is None:
+            assert ind == -1
+        else:
+            np.testing.assert_array_equal(detections.boxes[ind], ref_box[0])
+
+
+def test_extract_faces_matches_extract_face(images, mtcnn):
+    blank = np.zeros_like(images[1])
+    batch = extract_faces(images + [blank], mtcnn, padding=1)
+    for (face, box, points), img in zip(batch, images):
+        ref_face, ref_box, ref_points = extract_face(img, mtcnn, padding=1)
+        np.testing.assert_array_equal(box, ref_box)
+        np.testing.assert_array_equal(face, ref_face)
+        np.testing.assert_allclose(points, ref_points, atol=1e-3, rtol=0)
+    # An image without a face is returned as is
+    face, box, points = batch[-1]
+    assert face is blank and box is None and points is None
+
+
+def test_stream_matches_detect(images):
+    mtcnn = MTCNN(keep_all=True, max_candidates=[50, 3])
+    frames = [img[:480, :640] for img in images] * 2
+    expected = [mtcnn.detect(frame, landmarks=True) for frame in frames]
+    expected_dropped = mtcnn.dropped_candidates
+    mtcnn.detect(np.zeros_like(frames[0]))
+    assert mtcnn.dropped_candidates == {"pnet": 0, "rnet": 0}
+
+    results = []
+    with mtcnn.stream(depth=2, landmarks=True) as stream:
+        for frame in frames:
+            stream.submit(frame)
+            results.extend(stream.results())
+        results.extend(stream.results(wait=True))
+    assert len(results) == len(frames)
+    for result, ref in zip(results, expected):
+        assert_same_detections(result, ref)
+    # The candidates dropped on the last frame are reported as for detect()
+    assert mtcnn.dropped_candidates == expected_dropped
+
+
+def test_profile_sink(images, mtcnn, tmp_path):
+    records = []
+    profiled = MTCNN(keep_all=True, profile_sink=records.append)
+    img = images[0]
+    expected = mtcnn.detect(img, landmarks=True)
+    assert_same_detections(profiled.detect(img, landmarks=True), expected)
+
+    record, = records
+    counts = record["counts"]
+    assert counts["scales"] == len(detect_face.compute_scales(*img.shape[:2], 20, mtcnn.factor))
+    assert counts["pnet_threshold"] >= counts["pnet_scale_nms"]
+    assert counts["rnet_threshold"] >= counts["rnet_nms"] >= counts["onet_threshold"]
+    assert counts["onet_threshold"] >= counts["onet_nms"] == len(expected[0])
+    assert {"pyramid", "pnet", "rnet", "onet"} <= set(record["times"])
+    assert record["total"] == pytest.approx(sum(record["times"].values()))
+
+    histogram = HistogramSink()
+    with open(tmp_path / "profile.jsonl", "w") as f:
+        sink = JsonLinesSink(f)
+        for record in records * 3:
+            histogram(record)
+            sink(record)
+    assert len(histogram.values["count/onet_nms"]) == 3
+    assert [json.loads(line) for line in open(tmp_path / "profile.jsonl")] == records * 3
+
+
+@pytest.mark.parametrize("net, size", [(RNet, 24), (ONet, 48)])
+def test_fixed_batch_process(net, size):
+    model = net()
+    batch_sizes = []
+    model.register_forward_pre_hook(lambda module, inputs: batch_sizes.append(len(inputs[0])))
+    im_data = torch.rand(100, 3, size, size) * 2 - 1
+    with torch.no_grad():
+        expected = model(im_data)
+        # A budget of about 7 candidates splits the batch into chunks with the same outputs
+        budget = detect_face.candidate_bytes(model, im_data) * 7.5
+        batch_sizes.clear()
+        out = detect_face.fixed_batch_process(im_data, model, budget)
+        assert batch_sizes == [7] * 14 + [2]
+        for o, e in zip(out, expected):
+            torch.testing.assert_close(o, e, atol=1e-6, rtol=0)
+
+        # No candidates give empty outputs, without running the model on an empty batch
+        for memory_budget in [None, budget]:
+            out = detect_face.fixed_batch_process(im_data[:0], model, memory_budget)
+            assert [o.shape for o in out] == [(0,) + e.shape[1:] for e in expected]
+        assert 0 not in batch_sizes
+
+
+def test_onnx_backend_finds_the_same_faces(images, mtcnn, tmp_path):
+    pytest.importorskip("onnxruntime")
+    onnx_mtcnn = MTCNN(keep_all=True, backend="onnx", onnx_dir=str(tmp_path))
+    assert sorted(os.listdir(tmp_path)) == ["onet.onnx", "pnet.onnx", "rnet.onnx"]
+    for img in images:
+        boxes, ref_boxes = onnx_mtcnn.detect(img)[0], mtcnn.detect(img)[0]
+        assert_same_faces(np.asarray(boxes, dtype=float), np.asarray(ref_boxes, dtype=float))
+
+
+def test_onnx_backend_without_onnxruntime(monkeypatch, tmp_path):
+    monkeypatch.setitem(sys.modules, "onnxruntime", None)
+    with pytest.raises(ImportError, match="requirements-onnx.txt"):
+        MTCNN(backend="onnx", onnx_dir=str(tmp_path))
+    assert os.listdir(tmp_path) == []
+
+
+def test_scripted_cascade_matches_detect_face(images, mtcnn, tmp_path):
+    mtcnn.script(str(tmp_path / "mtcnn.pt"))
+    cascade = torch.jit.load(str(tmp_path / "mtcnn.pt"))
+    for img in images:
+        imgs = np.stack([img] * 2)
+        with torch.no_grad():
+            expected = detect_face.detect_face(
+                imgs, mtcnn.min_face_size, mtcnn.pnet, mtcnn.rnet, mtcnn.onet, mtcnn.thresholds,
+                mtcnn.factor, mtcnn.device, flat=True
+            )
+        # Outside no_grad, the outputs must not require grad, so that .numpy() works
+        out = cascade(torch.from_numpy(imgs))
+        assert not any(o.requires_grad for o in out)
+        for o, e in zip(out, expected):
+            np.testing.assert_array_equal(o.numpy(), e)
+
+
+def test_quantized_mtcnn_loads_from_data_dir(images, tmp_path):
+    calibration_dir = tmp_path / "calibration"
+    calibration_dir.mkdir()
+    for i, img in enumerate(images):
+        cv.imwrite(str(calibration_dir / f"{i}.png"), cv.cvtColor(img, cv.COLOR_RGB2BGR))
+    quantized, _ = quantize_mtcnn(
+        str(calibration_dir), ["rnet", "onet"], min_recall=0, data_dir=str(tmp_path)
+    )
+    assert sorted(os.listdir(tmp_path)) == ["calibration", "onet_int8.pt", "rnet_int8.pt"]
+    loaded = MTCNN(keep_all=True, quantized=["rnet", "onet"], quantized_dir=str(tmp_path))
+    expected = quantized.detect(images[:2], landmarks=True)
+    assert_same_detections(loaded.detect(images[:2], landmarks=True), expected)
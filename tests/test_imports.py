@@ -0,0 +1,42 @@
+"""Headless entry points must not import the heavy optional dependencies, which are only imported
+once they are used, nor take long to import on top of torch and OpenCV.
+tests/import_time_benchmark.py profiles where their import time goes."""
+import os
+import subprocess
+import sys
+
+import pytest
+
+from tests.import_time_benchmark import REPEAT, import_time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENTRY_POINTS = ["face_verification", "challenge_response", "model_server", "utils.startup"]
+LAZY = ["torchvision", "matplotlib", "dlib", "imutils", "PyQt5", "onnxruntime", "requests"]
+# Seconds of import time on top of torch and OpenCV, which every entry point needs. It is about
+# 0.1 s, importing torchvision alone adds more than 1 s
+BUDGET = 1.0
+
+
+def imported_packages(module):
+    """Top-level packages in sys.modules after importing `module` in a fresh interpreter."""
+    code = f"import sys, {module}; print(' '.join({{m.split('.')[0] for m in sys.modules}}))"
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    return set(result.stdout.split())
+
+
+@pytest.mark.parametrize("module", ENTRY_POINTS)
+def test_no_heavy_imports(module):
+    assert not imported_packages(module).intersection(LAZY)
+
+
+@pytest.mark.parametrize("module", ENTRY_POINTS)
+def test_import_time_budget(module):
+    # The best of a few runs, as a loaded machine only ever makes imports slower
+    own = min(
+        times[module] - times["torch"] - times.get("cv2", 0)
+        for times in (import_time(module) for _ in range(REPEAT))
+    )
+    assert own < BUDGET
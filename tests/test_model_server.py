@@ -0,0 +1,81 @@
+"""Tests of the pre-fork model server. VGGFace2 and the emotion model use seeded random weights, as
+their weight files are not part of the repository."""
+import gc
+import os
+import time
+from multiprocessing import AuthenticationError
+
+import cv2 as cv
+import numpy as np
+import pytest
+import torch
+
+from liveness_detection.emotion_prediction import EmotionDetectionModel
+from model_server import ModelClient, ModelServer, Worker, load_models
+from verification_models import VGGFace2
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def read_image(path):
+    return cv.cvtColor(cv.imread(os.path.join(ROOT, path)), cv.COLOR_BGR2RGB)
+
+
+@pytest.fixture(scope="module")
+def models(tmp_path_factory):
+    tmp = tmp_path_factory.mktemp("weights")
+    torch.manual_seed(0)
+    torch.save(VGGFace2.InceptionResnetV1().state_dict(), str(tmp / "vggface2.pt"))
+    torch.save(EmotionDetectionModel().state_dict(), str(tmp / "emotion.pt"))
+    threads = torch.get_num_threads()
+    yield load_models(
+        ["mtcnn", "verifier", "emotion"], verifier_weights=str(tmp / "vggface2.pt"),
+        emotion_weights=str(tmp / "emotion.pt")
+    )
+    torch.set_num_threads(threads)
+
+
+@pytest.fixture(scope="module")
+def server(models):
+    with ModelServer(models, workers=2) as server:
+        yield server
+    # start() freezes the objects of this process for the forked workers
+    gc.unfreeze()
+
+
+def test_server_answers_like_a_worker(models, server):
+    id_image, selfie = read_image("ID2.png"), read_image("resources/ekyc.jpg")
+    expected = Worker(models, threads=1).verify(id_image, selfie)
+    with ModelClient(server.address, server.authkey) as client:
+        assert client("verify", id_image, selfie) == expected
+        assert client("emotion", id_image[:160, :160]) in ["smile", "neutral", "other"]
+        with pytest.raises(ValueError, match="Unknown command"):
+            client("recognize", id_image)
+        assert client("stats")["pid"] != os.getpid()
+
+
+def test_stats_time_the_first_reply_from_the_fork(models):
+    with ModelServer(models, workers=1) as server:
+        time.sleep(1)
+        with ModelClient(server.address, server.authkey) as client:
+            client("emotion", np.zeros((64, 64, 3), dtype=np.uint8))
+            stats = client("stats")
+    gc.unfreeze()
+    # The worker waited a second for its first request after it was forked and ready
+    assert 0 < stats["startup"] < 1 <= stats["first_request"]
+
+
+def test_verify_without_a_face(server):
+    blank = np.zeros((480, 640, 3), dtype=np.uint8)
+    with ModelClient(server.address, server.authkey) as client:
+        result = client("verify", read_image("ID2.png"), blank)
+    assert result["verified"] is False and result["distance"] is None
+    assert result["reason"] == "No face found in the selfie"
+
+
+def test_clients_need_the_authkey(server):
+    with pytest.raises(AuthenticationError):
+        ModelClient(server.address, os.urandom(32))
+    # The worker drops the connection and keeps serving
+    with ModelClient(server.address, server.authkey) as client:
+        assert client("stats")["pid"] != os.getpid()
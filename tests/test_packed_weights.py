@@ -0,0 +1,80 @@
+"""Models mapped from a packed weights file must give the same outputs as models loaded from their
+.pt files. VGGFace2 and the emotion model use seeded random weights, as their weight files are not
+part of the repository."""
+import os
+
+import cv2 as cv
+import numpy as np
+import pytest
+import torch
+
+from facenet.models.mtcnn import MTCNN
+from facenet.models.utils.packed_weights import assign_state_dict, open_packed, pack_weights
+from liveness_detection.emotion_prediction import EmotionDetectionModel, EmotionPredictor
+from verification_models import VGGFace2
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope="module")
+def weights(tmp_path_factory):
+    tmp = tmp_path_factory.mktemp("weights")
+    torch.manual_seed(0)
+    state_dicts = {
+        "vggface2": VGGFace2.InceptionResnetV1(inference_only=True).state_dict(),
+        "emotion": EmotionDetectionModel().state_dict(),
+    }
+    for name, state_dict in state_dicts.items():
+        torch.save(state_dict, str(tmp / f"{name}.pt"))
+    mtcnn = MTCNN()
+    for name in ["pnet", "rnet", "onet"]:
+        state_dicts[name] = getattr(mtcnn, name).state_dict()
+    return tmp, pack_weights(state_dicts, str(tmp / "weights.pack"))
+
+
+def test_packed_mtcnn_matches_pt_files(weights):
+    _, packed = weights
+    img = cv.imread(os.path.join(ROOT, "facenet/data/multiface.jpg"))
+    img = cv.cvtColor(img, cv.COLOR_BGR2RGB)
+    mtcnn, expected = MTCNN(packed_weights=packed), MTCNN()
+    for out, ref in zip(mtcnn.detect(img, landmarks=True), expected.detect(img, landmarks=True)):
+        np.testing.assert_array_equal(np.asarray(out, dtype=float), np.asarray(ref, dtype=float))
+    # The weights are the mapped tensors, not copies
+    pack = open_packed(packed).state_dict("onet")
+    assert mtcnn.onet.conv1.weight.data_ptr() == pack["conv1.weight"].data_ptr()
+
+
+@pytest.mark.parametrize("optimize", [False, True])
+def test_packed_vggface2_matches_pt_file(weights, optimize):
+    tmp, packed = weights
+    model = VGGFace2.load_model(inference_only=True, optimize=optimize, packed_weights=packed)
+    expected = VGGFace2.load_model(
+        str(tmp / "vggface2.pt"), inference_only=True, optimize=optimize
+    )
+    rng = np.random.default_rng(0)
+    faces = [rng.integers(0, 256, (160, 160, 3), dtype=np.uint8) for _ in range(2)]
+    torch.testing.assert_close(
+        VGGFace2.embed_faces(faces, model), VGGFace2.embed_faces(faces, expected), atol=0, rtol=0
+    )
+
+
+def test_packed_emotion_matches_pt_file(weights):
+    tmp, packed = weights
+    model = EmotionPredictor(packed_weights=packed).model
+    expected = EmotionPredictor(str(tmp / "emotion.pt")).model
+    x = torch.rand(2, 1, 64, 64)
+    with torch.inference_mode():
+        torch.testing.assert_close(model(x), expected(x), atol=0, rtol=0)
+
+
+def test_assign_state_dict_checks_keys():
+    model = torch.nn.Sequential(torch.nn.Linear(3, 2), torch.nn.BatchNorm1d(2))
+    state_dict = {key: torch.zeros_like(value) for key, value in model.state_dict().items()}
+    assert assign_state_dict(model, state_dict) == ([], [])
+    assert all(
+        value.data_ptr() == state_dict[key].data_ptr() for key, value in model.state_dict().items()
+    )
+    with pytest.raises(RuntimeError, match="Missing keys"):
+        assign_state_dict(model, {k: v for k, v in state_dict.items() if k != "0.bias"})
+    with pytest.raises(RuntimeError, match="has shape"):
+        assign_state_dict(model, {**state_dict, "0.bias": torch.zeros(3)})
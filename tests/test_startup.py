@@ -0,0 +1,74 @@
+"""Models loaded and warmed up on the Startup pool must give the same results as models loaded one
+after another. VGGFace2 and the emotion model use seeded random weights, as their weight files
+are not part of the repository."""
+import os
+
+import cv2 as cv
+import numpy as np
+import pytest
+import torch
+
+from facenet.models.mtcnn import MTCNN
+from liveness_detection.emotion_prediction import EmotionDetectionModel, EmotionPredictor
+from utils.startup import Startup, warm_up_emotion, warm_up_mtcnn, warm_up_verifier
+from verification_models import VGGFace2
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope="module")
+def loaders(tmp_path_factory):
+    tmp = tmp_path_factory.mktemp("weights")
+    torch.manual_seed(0)
+    torch.save(VGGFace2.InceptionResnetV1().state_dict(), str(tmp / "vggface2.pt"))
+    torch.save(EmotionDetectionModel().state_dict(), str(tmp / "emotion.pt"))
+    return {
+        "mtcnn": (MTCNN, warm_up_mtcnn),
+        "verifier": (
+            lambda: VGGFace2.load_model(str(tmp / "vggface2.pt"), inference_only=True),
+            warm_up_verifier,
+        ),
+        "emotion": (lambda: EmotionPredictor(str(tmp / "emotion.pt")), warm_up_emotion),
+    }
+
+
+def outputs(models, img):
+    boxes, probs = models["mtcnn"].detect(img)
+    embeddings = VGGFace2.embed_faces([img[:160, :160], img[:200, :120]], models["verifier"])
+    with torch.inference_mode():
+        x = torch.rand(2, 1, 64, 64, generator=torch.Generator().manual_seed(0))
+        emotion = models["emotion"].model(x)
+    return np.asarray(boxes, dtype=float), np.asarray(probs, dtype=float), embeddings, emotion
+
+
+def test_parallel_startup_matches_sequential_loading(loaders):
+    img = cv.cvtColor(cv.imread(os.path.join(ROOT, "ID2.png")), cv.COLOR_BGR2RGB)
+    expected = outputs({name: load() for name, (load, _) in loaders.items()}, img)
+
+    startup = Startup()
+    for name, (load, warm_up) in loaders.items():
+        startup.submit(name, load, warm_up)
+    models = startup.wait()
+    for out, ref in zip(outputs(models, img), expected):
+        np.testing.assert_array_equal(np.asarray(out), np.asarray(ref))
+
+    # Every step and its warm-up is on the timeline, the warm-up after the step
+    steps = {name: (start, end) for name, _, start, end in startup.timeline}
+    assert set(steps) == {name + suffix for name in loaders for suffix in ["", " warm-up"]}
+    for name in loaders:
+        assert steps[name][1] <= steps[name + " warm-up"][0]
+    assert startup.ready >= max(end for _, end in steps.values())
+    assert "ready after" in startup.report()
+
+
+def test_startup_raises_the_error_of_a_step():
+    def fail():
+        raise FileNotFoundError("weights")
+
+    startup = Startup()
+    startup.submit("model", fail)
+    startup.submit("camera", lambda: "camera")
+    assert startup.result("camera") == "camera"
+    with pytest.raises(FileNotFoundError):
+        startup.wait()
+    assert {name for name, *_ in startup.timeline} == {"model", "camera"}
@@ -0,0 +1,162 @@
+"""Tests of face verification: batched embedding and detection must give the same results as one
+forward pass and one detection per face. VGGFace2 runs with seeded random weights, as its weight
+file is not part of the repository."""
+import os
+
+import cv2 as cv
+import numpy as np
+import pytest
+import torch
+
+import face_verification
+from facenet.models.mtcnn import MTCNN
+from tests.optimize_for_inference_benchmark import random_model
+from utils.functions import extract_face, face_transform
+from verification_models import VGGFace
+from verification_models.VGGFace2 import InceptionResnetV1, embed_faces, load_model
+from verification_models.quantization import quantize_vggface2
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def read_image(path):
+    return cv.cvtColor(cv.imread(os.path.join(ROOT, path)), cv.COLOR_BGR2RGB)
+
+
+def face_crops(n, seed):
+    """Crops around the face of ID2.png, with random margins and brightness."""
+    img = read_image("ID2.png")
+    box = MTCNN().detect(img)[0][0].astype(int)
+    rng = np.random.default_rng(seed)
+    crops = []
+    for _ in range(n):
+        x1, y1, x2, y2 = box + rng.integers(-10, 11, 4)
+        crop = img[max(0, y1):y2, max(0, x1):x2] * rng.uniform(0.7, 1.3)
+        crops.append(np.clip(crop, 0, 255).astype(np.uint8))
+    return crops
+
+
+@pytest.fixture(scope="module")
+def verifier():
+    torch.manual_seed(0)
+    return load_model(pretrained=None, inference_only=True).eval()
+
+
+def per_face(faces, model):
+    with torch.inference_mode():
+        return torch.cat([
+            model(face_transform(face, model_name="VGG-Face2", device=model.device()))
+            for face in faces
+        ])
+
+
+@pytest.mark.parametrize("n, max_batch", [(0, 32), (2, 32), (7, 3)])
+def test_embed_faces_matches_per_face(verifier, n, max_batch):
+    rng = np.random.default_rng(n)
+    faces = [
+        rng.integers(0, 256, (h, w, 3), dtype=np.uint8) for h, w in rng.integers(80, 300, (n, 2))
+    ]
+    embeddings = embed_faces(faces, verifier, max_batch=max_batch)
+    assert embeddings.shape == (n, 512)
+    if n:
+        torch.testing.assert_close(embeddings, per_face(faces, verifier), atol=1e-4, rtol=0)
+
+
+def test_verify_detects_both_images_at_once(verifier, monkeypatch):
+    mtcnn = MTCNN()
+    id_image, selfie = read_image("ID2.png"), read_image("facenet/data/multiface.jpg")
+    faces = [extract_face(img, mtcnn, padding=1)[0] for img in [id_image, selfie]]
+    expected = face_verification.face_matching(
+        *faces, verifier, distance_metric_name="euclidean", model_name="VGG-Face2"
+    )
+
+    batches = []
+    detect_flat = mtcnn.detect_flat
+
+    def counting_detect_flat(imgs, **kwargs):
+        batches.append(len(imgs))
+        return detect_flat(imgs, **kwargs)
+
+    monkeypatch.setattr(mtcnn, "detect_flat", counting_detect_flat)
+    assert face_verification.verify(id_image, selfie, mtcnn, verifier).item() == expected.item()
+    assert batches == [2]
+
+
+def test_optimize_for_inference_matches_original(tmp_path):
+    weights = str(tmp_path / "vggface2.pt")
+    torch.save(random_model().state_dict(), weights)
+    original = load_model(weights)
+    # NHWC buffer viewed as NCHW, as embed_faces passes it
+    x = torch.rand(4, 160, 160, 3).sub(0.5).mul(2).permute(0, 3, 1, 2)
+    with torch.inference_mode():
+        expected = original(x)
+        # Folding, then loading the cached folded state dict, then channels_last weights
+        for channels_last in [False, False, True]:
+            model = load_model(weights, optimize=True, channels_last=channels_last)
+            assert not any(isinstance(m, torch.nn.BatchNorm2d) for m in model.modules())
+            torch.testing.assert_close(model(x), expected, atol=1e-4, rtol=0)
+    folded = torch.load(str(tmp_path / "vggface2_folded.pt"))
+    assert not any(key.endswith("running_mean") for key in folded)
+
+
+def test_quantized_vggface2_loads_back(tmp_path):
+    weights = str(tmp_path / "vggface2.pt")
+    torch.save(random_model().state_dict(), weights)
+    faces = face_crops(8, seed=0)
+    # Two identities, so that there are both genuine and impostor pairs
+    for i, face in enumerate(faces):
+        (tmp_path / "faces" / f"id{i % 2}").mkdir(parents=True, exist_ok=True)
+        path = str(tmp_path / "faces" / f"id{i % 2}" / f"{i}.png")
+        cv.imwrite(path, cv.cvtColor(face, cv.COLOR_RGB2BGR))
+    qmodel, metrics = quantize_vggface2(
+        str(tmp_path / "faces"), pretrained=weights, min_agreement=0
+    )
+    assert metrics["faces"] == len(faces) and metrics["min_cosine"] > 0.99
+    loaded = load_model(weights, quantized=True)
+    assert os.path.exists(str(tmp_path / "vggface2_int8.pt"))
+    torch.testing.assert_close(embed_faces(faces, loaded), embed_faces(faces, qmodel))
+
+
+def test_inference_only_vggface2_keeps_the_embeddings(tmp_path):
+    weights = str(tmp_path / "vggface2.pt")
+    torch.manual_seed(0)
+    torch.save(InceptionResnetV1().state_dict(), weights)
+    full, lean = load_model(weights), load_model(weights, inference_only=True)
+    # The 512x8631 classification layer is neither built nor loaded
+    assert "logits.weight" in full.state_dict() and "logits.weight" not in lean.state_dict()
+    x = torch.rand(2, 3, 160, 160) * 2 - 1
+    with torch.inference_mode():
+        torch.testing.assert_close(lean(x), full(x), atol=0, rtol=0)
+
+
+def test_inference_only_vggface_returns_fc7(tmp_path):
+    weights = str(tmp_path / "vggface.pt")
+    torch.manual_seed(0)
+    torch.save(VGGFace.VGGFace().state_dict(), weights)
+    full = VGGFace.load_model(weights)
+    fc7 = []
+    full.fc7.register_forward_hook(lambda module, inputs, output: fc7.append(output.relu()))
+    x = torch.rand(2, 3, 224, 224) * 2 - 1
+    with torch.inference_mode():
+        full(x)
+        del full
+        lean = VGGFace.load_model(weights, inference_only=True)
+        assert not hasattr(lean, "fc8")
+        torch.testing.assert_close(lean(x), fc7[0], atol=0, rtol=0)
+
+
+@pytest.mark.parametrize("shape", [(96, 160), (160, 96)])
+@pytest.mark.parametrize("rank", [None, 8, 32])
+def test_factorized_linear_error_bound(shape, rank):
+    torch.manual_seed(0)
+    weight, bias = torch.randn(*shape) / shape[1] ** 0.5, torch.randn(shape[0])
+    layer = VGGFace.FactorizedLinear(shape[1], shape[0], rank).factorize(weight, bias)
+    approx = layer.weight.float() if rank is None else layer.u.float() @ layer.v.float()
+    # The best rank approximation misses the singular values past the rank, up to float16 rounding
+    singular_values = torch.linalg.svdvals(weight.double())
+    best = 0.0 if rank is None else singular_values[rank].item()
+    fp16 = 2 ** -10 * singular_values[0].item()
+    assert torch.linalg.matrix_norm(weight - approx, 2).item() <= best + fp16
+    x = torch.randn(4, shape[1])
+    error = (layer(x) - torch.nn.functional.linear(x, weight, bias)).norm(dim=1)
+    assert (error <= (best + fp16) * x.norm(dim=1)).all()
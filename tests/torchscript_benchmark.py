@@ -0,0 +1,50 @@
+"""Benchmark the TorchScript-compiled MTCNN cascade against eager detect_face.
+
+The cascade is compiled with MTCNN.script(), saved and loaded back with torch.jit.load, then run
+on the repo images, single and in batches of 4 copies. Its boxes, landmarks and image indices are
+checked to be identical to those of detect_face(flat=True). Run from the repository root:
+    python -m tests.torchscript_benchmark
+"""
+import os
+import tempfile
+
+import cv2 as cv
+import numpy as np
+import torch
+
+from facenet.models.mtcnn import MTCNN
+from facenet.models.utils.detect_face import detect_face
+from tests.bench_utils import timeit
+
+IMAGES = ["facenet/data/multiface.jpg", "ID2.png", "SAM_ID.png", "resources/ekyc.jpg"]
+
+
+if __name__ == "__main__":
+    torch.set_grad_enabled(False)
+    mtcnn = MTCNN()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "mtcnn.pt")
+        mtcnn.script(path)
+        cascade = torch.jit.load(path)
+
+    def eager(imgs):
+        return detect_face(
+            imgs, mtcnn.min_face_size, mtcnn.pnet, mtcnn.rnet, mtcnn.onet, mtcnn.thresholds,
+            mtcnn.factor, mtcnn.device, flat=True
+        )
+
+    def scripted(imgs):
+        return tuple(t.numpy() for t in cascade(torch.from_numpy(imgs)))
+
+    print(f"{'image':<28} {'batch':>5} {'eager ms':>9} {'script ms':>10} {'speedup':>8}")
+    for path in IMAGES:
+        img = cv.cvtColor(cv.imread(path), cv.COLOR_BGR2RGB)
+        for batch_size in [1, 4]:
+            imgs = np.stack([img] * batch_size)
+            t_eager, ref = timeit(lambda: eager(imgs), reduce=np.median)
+            t_script, out = timeit(lambda: scripted(imgs), reduce=np.median)
+            assert all(np.array_equal(r, o) for r, o in zip(ref, out))
+            print(
+                f"{path:<28} {batch_size:>5} {t_eager * 1000:>9.1f} {t_script * 1000:>10.1f} "
+                f"{t_eager / t_script:>7.2f}x"
+            )
@@ -0,0 +1,82 @@
+"""Benchmark the int8 quantized VGGFace2 embedder against the float one.
+
+Faces detected by MTCNN in the repo images are cropped four times each, with small shifts,
+brightness changes and flips, into one identity folder per face. quantize_vggface2 calibrates and
+evaluates on them, starting from seeded random weights with random batch norm statistics, so that
+folding has statistics to fold; with random weights only the embedding drift and decision agreement
+between the float and int8 models are meaningful, not accuracy. The saved int8 model is loaded back
+with load_model(quantized=True), and the weight file size and median latency per batch are printed
+for the float, BN-folded and int8 models. Run from the repository root:
+    python -m tests.vggface2_quantization_benchmark
+"""
+import os
+import tempfile
+
+import cv2 as cv
+import numpy as np
+import torch
+
+from facenet.models.mtcnn import MTCNN
+from tests.bench_utils import timeit
+from tests.optimize_for_inference_benchmark import REPEAT, random_model
+from verification_models.VGGFace2 import embed_faces, load_model
+from verification_models.quantization import quantize_vggface2
+
+IMAGES = ["facenet/data/multiface.jpg", "ID2.png", "ID3.jpg", "SAM_ID.png", "resources/ekyc.jpg"]
+
+
+def write_crops(face_dir, crops_per_face=4):
+    rng = np.random.default_rng(0)
+    mtcnn = MTCNN(keep_all=True)
+    identity = 0
+    for path in IMAGES:
+        img = cv.imread(path)
+        boxes, _ = mtcnn.detect(cv.cvtColor(img, cv.COLOR_BGR2RGB))
+        for box in [] if boxes is None else boxes:
+            x1, y1, x2, y2 = box.astype(int)
+            folder = os.path.join(face_dir, f"id{identity}")
+            os.makedirs(folder)
+            identity += 1
+            for k in range(crops_per_face):
+                dy1, dy2, dx1, dx2 = rng.integers(-3, 4, 4)
+                crop = img[max(0, y1 + dy1):y2 + dy2, max(0, x1 + dx1):x2 + dx2]
+                crop = np.clip(crop * rng.uniform(0.8, 1.2), 0, 255).astype(np.uint8)
+                cv.imwrite(os.path.join(folder, f"{k}.png"), crop[:, ::-1] if k % 2 else crop)
+    return identity
+
+
+if __name__ == "__main__":
+    torch.set_grad_enabled(False)
+    with tempfile.TemporaryDirectory() as tmp:
+        face_dir = os.path.join(tmp, "faces")
+        print(f"{write_crops(face_dir)} identities")
+        weights = os.path.join(tmp, "vggface2.pt")
+        torch.save(random_model().state_dict(), weights)
+        _, metrics = quantize_vggface2(face_dir, pretrained=weights)
+        for key, value in metrics.items():
+            print(f"{key:<20} {value:.4f}" if isinstance(value, float) else f"{key:<20} {value}")
+
+        models = {
+            "fp32": load_model(weights),
+            "fp32 folded": load_model(weights, optimize=True, channels_last=True),
+            "int8": load_model(weights, quantized=True),
+        }
+        sizes = {
+            name: os.path.getsize(os.path.join(tmp, "vggface2" + suffix))
+            for name, suffix in [("fp32", ".pt"), ("fp32 folded", "_folded.pt"), ("int8", "_int8.pt")]
+        }
+
+        rng = np.random.default_rng(0)
+        faces = [rng.integers(0, 256, (160, 160, 3), dtype=np.uint8) for _ in range(16)]
+        print(f"{'model':<12} {'MiB':>6} {'batch':>5} {'ms':>8} {'speedup':>8}")
+        for batch_size in [1, 16]:
+            t_ref = None
+            for name, model in models.items():
+                t, _ = timeit(
+                    lambda: embed_faces(faces[:batch_size], model), REPEAT, np.median
+                )
+                t_ref = t_ref or t
+                print(
+                    f"{name:<12} {sizes[name] / 2 ** 20:>6.1f} {batch_size:>5} {t * 1000:>8.1f} "
+                    f"{t_ref / t:>7.2f}x"
+                )
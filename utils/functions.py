@@ -4,20 +4,25 @@ import torch
 from PIL import Image
 
 from facenet.models.mtcnn import MTCNN
+from facenet.models.utils.detections import Detections
 
 
 def padding_face(box: np.ndarray, padding=None):
     """
-    Pad the given bounding box.
+    Pad the given bounding box, or every box of an array of boxes.
 
     Parameters:
-        box (np.ndarray): A bounding box in the format [x1, y1, x2, y2].
+        box (np.ndarray): A bounding box in the format [x1, y1, x2, y2], or an (N, 4) array of them.
         padding (float or int, optional): Padding value. If a float is provided, it's a scaling factor. If an int is provided, it's added to the width and height.
 
     Returns:
-        np.ndarray: Padded bounding box.
+        np.ndarray: Padded bounding box(es).
     """
-    x1, y1, x2, y2 = box
+    box = np.asarray(box)
+    if box.dtype.kind in "ui":
+        # Signed arithmetic, so that a box padded past the image border is clipped instead of wrapping
+        box = box.astype(np.int64)
+    x1, y1, x2, y2 = box[..., 0], box[..., 1], box[..., 2], box[..., 3]
     cx = (x1 + x2) // 2
     cy = (y1 + y2) // 2
     w = x2 - x1
@@ -35,11 +40,44 @@ def padding_face(box: np.ndarray, padding=None):
     y1 = cy - h // 2
     y2 = cy + h // 2
 
-    box = np.clip([x1, y1, x2, y2], 0, np.inf).astype(np.uint32)
+    box = np.clip(np.stack([x1, y1, x2, y2], axis=-1), 0, np.inf).astype(np.uint32)
     return box
 
 
-def extract_face(img: np.ndarray, model: MTCNN, padding=None, min_prob=0.9):
+def select_faces(detections: Detections, padding=None, min_prob=0.9):
+    """
+    Pick the largest face above min_prob in every image of a batch of detections.
+
+    Parameters:
+        detections (Detections): Faces detected in a batch of images.
+        padding (float or int, optional): Padding value for the selected boxes, 1.5 if None.
+        min_prob (float, optional): Minimum probability threshold for face detection.
+
+    Returns:
+        np.ndarray: Index into detections of the face selected in every image, -1 if there is none.
+        np.ndarray: (B, 4) padded bounding boxes of the selected faces, zeros if there is none.
+    """
+    candidates = detections.filter(min_prob)
+    # Areas of the integer boxes, the first face wins ties
+    boxes = np.clip(candidates.boxes, 0, np.inf).astype(np.uint32).astype(np.int64)
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    first = candidates.first(candidates.order(areas))
+    found = first >= 0
+    found[found] = areas[first[found]] > 0
+
+    # If padding is not specified, use a default value of 1.5 to ensure full face capture
+    actual_padding = 1.5 if padding is None else padding
+    selected_boxes = np.zeros((detections.num_images, 4), dtype=np.uint32)
+    selected_boxes[found] = padding_face(boxes[first[found]], actual_padding)
+
+    selected = np.full(detections.num_images, -1, dtype=np.int64)
+    selected[found] = np.flatnonzero(detections.probs > min_prob)[first[found]]
+    return selected, selected_boxes
+
+
+def extract_face(
+    img: np.ndarray, model: MTCNN, padding=None, min_prob=0.9, track=False, face_size_range=None
+):
     """
     Extract the face from an RGB image using the given MTCNN model.
 
@@ -48,6 +86,10 @@ def extract_face(img: np.ndarray, model: MTCNN, padding=None, min_prob=0.9):
         model (MTCNN): The MTCNN face detection model.
         padding (float or int, optional): Padding value for the extracted face's bounding box.
         min_prob (float, optional): Minimum probability threshold for face detection.
+        track (bool, optional): If True, img is treated as the next frame of a video stream and the
+            faces are refreshed from the previous frame with MTCNN.track instead of a full detection.
+        face_size_range (tuple, optional): (min, max) face size in pixels expected in img, used to
+            skip pyramid levels that cannot contain such faces.
 
     Returns:
         np.ndarray: Extracted face image.
@@ -55,32 +97,54 @@ def extract_face(img: np.ndarray, model: MTCNN, padding=None, min_prob=0.9):
         list: Landmarks of the extracted face.
 
     """
-    boxes, prob, landmarks = model.detect(img, landmarks=True)
+    if track:
+        boxes, prob, landmarks = model.track(img, landmarks=True)
+        if boxes is None:
+            return img, None, None
+        detections = Detections(boxes, prob, landmarks, np.zeros(len(boxes)), [img.shape[:2]])
+    else:
+        detections = model.detect_flat(img, face_size_range=face_size_range)
+        if len(detections) == 0:
+            return img, None, None
+
+    return crop_faces([img], detections, padding, min_prob)[0]
 
-    if boxes is not None:
-        boxes = boxes[prob > min_prob]
 
-        max_area = 0
-        max_box = np.array([0, 0, 0, 0])
-        max_landmarks = []
+def extract_faces(
+    imgs: list, model: MTCNN, padding=None, min_prob=0.9, face_size_range=None
+):
+    """
+    Extract the largest face from each of a batch of RGB images with a single detection call.
 
-        for i, box in enumerate(boxes):
-            box = np.clip(box, 0, np.inf).astype(np.uint32)
-            x1, y1, x2, y2 = box
-            if (x2 - x1) * (y2 - y1) > max_area:
-                # If padding is not specified, use a default value of 1.5 to ensure full face capture
-                actual_padding = 1.5 if padding is None else padding
-                max_box = np.array(padding_face(box, actual_padding))
-                max_area = (x2 - x1) * (y2 - y1)
-                max_landmarks = landmarks[i]
+    Args:
+        imgs (list): The input RGB images, which may have different sizes.
+        model (MTCNN): The MTCNN face detection model.
+        padding (float or int, optional): Padding value for the extracted faces' bounding boxes.
+        min_prob (float, optional): Minimum probability threshold for face detection.
+        face_size_range (tuple, optional): (min, max) face size in pixels expected in the images.
 
-        x1, y1, x2, y2 = max_box
-        face = img[y1:y2, x1:x2, ...]
+    Returns:
+        list: For every image, the same (face, box, landmarks) tuple as extract_face.
+    """
+    detections = model.detect_flat(list(imgs), face_size_range=face_size_range)
+    results = crop_faces(imgs, detections, padding, min_prob)
+    return [
+        (img, None, None) if count == 0 else result
+        for img, count, result in zip(imgs, detections.counts, results)
+    ]
 
-        return face, max_box, max_landmarks
 
-    else:
-        return img, None, None
+def crop_faces(imgs: list, detections: Detections, padding=None, min_prob=0.9):
+    """
+    Crop the face picked by select_faces out of every image, as (face, box, landmarks) tuples.
+    """
+    selected, boxes = select_faces(detections, padding, min_prob)
+    results = []
+    for img, ind, box in zip(imgs, selected, boxes):
+        x1, y1, x2, y2 = box
+        landmarks = detections.landmarks[ind] if ind >= 0 else []
+        results.append((img[y1:y2, x1:x2, ...], box, landmarks))
+    return results
 
 
 def face_transform(face: np.ndarray, model_name="base", device="cpu"):
@@ -0,0 +1,52 @@
+import importlib
+import sys
+import threading
+
+
+class LazyModule:
+    """
+    Stand-in for a module that is only imported when one of its attributes is first used.
+
+    Heavy or optional dependencies (torchvision, dlib, matplotlib, PyQt5) are bound with
+    lazy_import at module level and used as usual, so that importing a module of this project
+    does not import them, and a missing optional dependency only fails the code that needs it.
+
+    Parameters:
+        name (str): Absolute name of the module, e.g. 'torchvision.transforms'.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = "imported" if self._module is not None else "not imported"
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+def lazy_import(name):
+    """
+    Module `name` if it is already imported, else a LazyModule importing it on first use.
+
+    Parameters:
+        name (str): Absolute name of the module.
+
+    Returns:
+        module or LazyModule: The module, or its stand-in.
+    """
+    module = sys.modules.get(name)
+    return module if module is not None else LazyModule(name)
@@ -0,0 +1,125 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+
+from verification_models import VGGFace2
+
+# Production input shapes: camera frames, aligned faces and emotion model inputs
+FRAME_SHAPE = (480, 640, 3)
+FACE_SHAPE = (160, 160, 3)
+EMOTION_SHAPE = (64, 64)
+
+
+class Startup:
+    """
+    Load models on a thread pool, next to other startup work such as opening the camera, and
+    record when every step starts and ends.
+
+    Model loading mostly runs in torch, OpenCV and dlib code that releases the GIL, reading files
+    and copying weights, so steps overlap even on few cores. A step may be followed by a warm-up
+    call on the loaded object, so that the first real frame does not pay for first-call
+    allocations.
+
+    Parameters:
+        max_workers (int, optional): Threads of the pool. None uses the ThreadPoolExecutor default.
+    """
+
+    def __init__(self, max_workers=None):
+        self.origin = time.perf_counter()
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix="startup")
+        self.futures = {}
+        self.timeline = []
+        self.ready = None
+        self.lock = threading.Lock()
+
+    def _record(self, name, fn, *args):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            with self.lock:
+                self.timeline.append(
+                    (name, threading.current_thread().name, start - self.origin,
+                     time.perf_counter() - self.origin)
+                )
+
+    def _run(self, name, load, warm_up):
+        result = self._record(name, load)
+        if warm_up is not None:
+            self._record(name + " warm-up", warm_up, result)
+        return result
+
+    def submit(self, name, load, warm_up=None):
+        """
+        Start a step on the pool.
+
+        Parameters:
+            name (str): Name of the step and of its result.
+            load (callable): Called without arguments, returns the result.
+            warm_up (callable, optional): Called with the result once it is loaded.
+
+        Returns:
+            concurrent.futures.Future: The result of load, once warmed up.
+        """
+        self.futures[name] = self.executor.submit(self._run, name, load, warm_up)
+        return self.futures[name]
+
+    def result(self, name):
+        """Wait for step `name` and return its result, raising its error if it failed."""
+        return self.futures[name].result()
+
+    def wait(self):
+        """
+        Wait for every step and shut the pool down.
+
+        Returns:
+            dict: The result of every step by name. The first error of a step is raised.
+        """
+        try:
+            results = {name: future.result() for name, future in self.futures.items()}
+        finally:
+            self.executor.shutdown(wait=True)
+        self.ready = time.perf_counter() - self.origin
+        return results
+
+    def report(self):
+        """Startup timeline, one line per step in start order, and the time to ready."""
+        lines = [f"{'step':<20} {'thread':<12} {'start ms':>9} {'end ms':>9} {'took ms':>9}"]
+        for name, thread, start, end in sorted(self.timeline, key=lambda step: step[2]):
+            lines.append(
+                f"{name:<20} {thread:<12} {start * 1000:>9.1f} {end * 1000:>9.1f} "
+                f"{(end - start) * 1000:>9.1f}"
+            )
+        if self.ready is not None:
+            lines.append(f"ready after {self.ready * 1000:.1f} ms")
+        return "\n".join(lines)
+
+
+def warm_up_mtcnn(mtcnn):
+    """Detect faces in a camera sized frame, and run the R- and O-nets, which only see the
+    candidates of real faces, on one crop each."""
+    mtcnn.detect(np.zeros(FRAME_SHAPE, dtype=np.uint8))
+    with torch.inference_mode():
+        mtcnn.rnet(torch.zeros(1, 3, 24, 24, device=mtcnn.device))
+        mtcnn.onet(torch.zeros(1, 3, 48, 48, device=mtcnn.device))
+
+
+def warm_up_verifier(model):
+    """Embed an ID face and selfie pair, as MainWindow.verify does."""
+    face = np.zeros(FACE_SHAPE, dtype=np.uint8)
+    VGGFace2.embed_faces([face, face], model)
+
+
+def warm_up_emotion(predictor):
+    """Predict the emotion of a grayscale face of the model's input size."""
+    with torch.inference_mode():
+        predictor.predict(np.zeros(EMOTION_SHAPE, dtype=np.uint8))
+
+
+def warm_up_blink(detector):
+    """Find the eye landmarks of a face in a camera sized frame, then reset the blink counters."""
+    detector.eye_blink(np.zeros(FRAME_SHAPE, dtype=np.uint8), [0, 0, *FACE_SHAPE[:2]])
+    detector.counter = detector.total = 0
@@ -4,11 +4,81 @@ import torch
 from torch import nn
 from torch.nn import functional as F
 
+from verification_models.weight_cache import load_cached, save_cached
+
+
+class FactorizedLinear(nn.Module):
+    def __init__(self, in_features, out_features, rank = None, dtype = torch.float16):
+        """
+        Linear layer storing its weight in low precision, optionally as a low-rank factorization.
+
+        With a rank, the out x in weight W is stored as U (out x rank) and V (rank x in). U @ V is
+        the best rank approximation of W, so the layer runs as two smaller matmuls. Weights are
+        upcast to the input dtype on use. The bias stays in float32. Parameters are left
+        uninitialized; fill them with factorize() or load_state_dict().
+
+        Parameters:
+            in_features (int): Size of each input sample.
+            out_features (int): Size of each output sample.
+            rank (int): Rank of the factorization. None stores the full weight.
+            dtype (torch.dtype): Storage dtype of the weights.
+        """
+        super().__init__()
+        self.in_features = in_features
+        self.out_features = out_features
+        self.rank = rank
+        if rank is None:
+            self.weight = self.empty_parameter(out_features, in_features, dtype=dtype)
+        else:
+            self.u = self.empty_parameter(out_features, rank, dtype=dtype)
+            self.v = self.empty_parameter(rank, in_features, dtype=dtype)
+        self.bias = self.empty_parameter(out_features)
+
+    @staticmethod
+    def empty_parameter(*size, dtype = None):
+        return nn.Parameter(torch.empty(*size, dtype=dtype), requires_grad=False)
+
+    @torch.no_grad()
+    def factorize(self, weight, bias):
+        """Set the layer from the float weight and bias of a full nn.Linear."""
+        if self.rank is None:
+            self.weight.copy_(weight)
+        else:
+            # Top left singular vectors from the eigenvectors of the smaller Gram matrix W W^T,
+            # much faster than a full SVD of W; U U^T W is then the best rank approximation
+            weight = weight.double()
+            transposed = weight.shape[0] > weight.shape[1]
+            if transposed:
+                weight = weight.T
+            eigenvectors = torch.linalg.eigh(weight @ weight.T).eigenvectors
+            u = eigenvectors[:, -self.rank:].flip(1)
+            v = u.T @ weight
+            if transposed:
+                u, v = v.T, u.T
+            self.u.copy_(u)
+            self.v.copy_(v)
+        self.bias.copy_(bias)
+        return self
+
+    def forward(self, x):
+        if self.rank is None:
+            return F.linear(x, self.weight.to(x.dtype), self.bias)
+        return F.linear(F.linear(x, self.v.to(x.dtype)), self.u.to(x.dtype), self.bias)
+
 
 class VGGFace(nn.Module):
-    def __init__(self):
-        
+    def __init__(self, inference_only = False, lean = False, rank = None):
+        """
+        VGG-Face network.
+
+        Parameters:
+            inference_only (bool): Do not build the fc8 identity classifier. The model then
+                returns the 4096-d fc7 descriptors instead of class probabilities.
+            lean (bool): Build fc6 and fc7 as float16 FactorizedLinear layers.
+            rank (int): With lean, rank of the fc6 and fc7 factorizations. None keeps them full.
+        """
         super().__init__()
+        self.inference_only = inference_only
         self.block_size = [2, 2, 3, 3, 3]
         self.conv_1_1 = nn.Conv2d(3, 64, 3, stride=1, padding=1)
         self.conv_1_2 = nn.Conv2d(64, 64, 3, stride=1, padding=1)
@@ -23,9 +93,14 @@ class VGGFace(nn.Module):
         self.conv_5_1 = nn.Conv2d(512, 512, 3, stride=1, padding=1)
         self.conv_5_2 = nn.Conv2d(512, 512, 3, stride=1, padding=1)
         self.conv_5_3 = nn.Conv2d(512, 512, 3, stride=1, padding=1)
-        self.fc6 = nn.Linear(512 * 7 * 7, 4096)
-        self.fc7 = nn.Linear(4096, 4096)
-        self.fc8 = nn.Linear(4096, 2622)
+        if lean:
+            self.fc6 = FactorizedLinear(512 * 7 * 7, 4096, rank)
+            self.fc7 = FactorizedLinear(4096, 4096, rank)
+        else:
+            self.fc6 = nn.Linear(512 * 7 * 7, 4096)
+            self.fc7 = nn.Linear(4096, 4096)
+        if not inference_only:
+            self.fc8 = nn.Linear(4096, 2622)
     
     def device(self):
         return next(self.parameters()).device
@@ -53,22 +128,67 @@ class VGGFace(nn.Module):
         x = F.relu(self.fc6(x))
         x = F.dropout(x, 0.5, self.training)
         x = F.relu(self.fc7(x))
+        if self.inference_only:
+            return x
         x = F.dropout(x, 0.5, self.training)
         return F.softmax(self.fc8(x), dim = 1)
     
-def load_model(pretrained = 'weights/vggface_weights.pt', device = 'cpu'):
+def load_model(pretrained = 'weights/vggface_weights.pt', device = 'cpu', inference_only = False,
+               lean = False, rank = 512):
+    """
+    Load the VGG-Face model.
+
+    Parameters:
+        pretrained (str): Weights file, relative to this directory. None keeps random weights.
+        device (str or torch.device): The device to run the model on.
+        inference_only (bool): Skip the 4096x2622 fc8 classifier, both when building the model and
+            when loading its weights. The model then returns fc7 descriptors.
+        lean (bool): Store fc6 and fc7 in float16, factorized to the given rank, to keep the
+            model loaded next to others. Implies inference_only. The lean state dict is saved as
+            <weights>_lean_r<rank>.pt on first use and loaded directly afterwards, until the
+            weights file changes.
+        rank (int): With lean, rank of the fc6 and fc7 factorizations. None keeps their full
+            weights, only in float16.
+
+    Returns:
+        torch.nn.Module: The VGG-Face model.
+    """
     if isinstance(device, str):
         if (device == 'cuda' or device == 'gpu') and torch.cuda.is_available():
             device = torch.device(device)
         else:
             device = torch.device('cpu')
     
-    model = VGGFace().to(device)
+    inference_only = inference_only or lean
+    model = VGGFace(inference_only, lean, rank).to(device)
     model.eval()
     
     if pretrained:
         state_dict_path = os.path.join(os.path.dirname(__file__), pretrained)
-        model.load_state_dict(torch.load(state_dict_path, map_location= 'cpu'))
+        lean_path = os.path.splitext(state_dict_path)[0] + f'_lean_r{rank or "full"}.pt'
+        state_dict = load_cached(lean_path, state_dict_path) if lean else None
+        cached = state_dict is not None
+        if not cached:
+            state_dict = torch.load(state_dict_path, map_location= 'cpu')
+        if lean and not cached:
+            for name in ['fc6', 'fc7']:
+                layer = FactorizedLinear(*state_dict[name + '.weight'].shape[::-1], rank).factorize(
+                    state_dict.pop(name + '.weight'), state_dict.pop(name + '.bias')
+                )
+                state_dict.update({f'{name}.{k}': v for k, v in layer.state_dict().items()})
+        if inference_only:
+            # Drop the entries of layers the model does not build, but still require all others
+            keys = model.state_dict().keys()
+            state_dict = {k: v for k, v in state_dict.items() if k in keys}
+            missing = model.load_state_dict(state_dict, strict=False).missing_keys
+            if missing:
+                path = lean_path if cached else state_dict_path
+                raise RuntimeError(f'Missing keys in {path}: {missing}')
+        else:
+            model.load_state_dict(state_dict)
+        del state_dict
+        if lean and not cached:
+            save_cached(model.state_dict(), lean_path, state_dict_path)
         # print('Weights loaded successfully from path:', state_dict_path)
         # print('====================================================')
         
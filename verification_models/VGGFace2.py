@@ -1,8 +1,16 @@
 import os
 
+import cv2 as cv
+import numpy as np
 import torch
 from torch import nn
 from torch.nn import functional as F
+from torch.nn.utils.fusion import fuse_conv_bn_eval, fuse_linear_bn_eval
+
+from facenet.models.utils.onnx_backend import load_onnx
+from facenet.models.utils.packed_weights import assign_state_dict, open_packed
+from verification_models.quantization import load_quantized_model, quantized_path
+from verification_models.weight_cache import load_cached, save_cached
 
 
 class BasicConv2d(nn.Module):
@@ -193,10 +201,16 @@ class InceptionResnetV1(nn.Module):
             equal to that used for the pretrained model, the final linear layer will be randomly
             initialized. (default: {None})
         dropout_prob {float} -- Dropout probability. (default: {0.6})
+        inference_only {bool} -- Do not build the classification layer, which embeddings never
+            use. Requires classify=False. (default: {False})
     """
-    def __init__(self, classify=False, num_classes=None, dropout_prob=0.6, device=None):
+    def __init__(self, classify=False, num_classes=None, dropout_prob=0.6, device=None,
+                 inference_only=False):
         super().__init__()
 
+        if classify and inference_only:
+            raise ValueError('An inference-only model has no classification layer')
+
         # Set simple attributes
         self.classify = classify
         self.num_classes = num_classes
@@ -243,7 +257,8 @@ class InceptionResnetV1(nn.Module):
         self.last_linear = nn.Linear(1792, 512, bias=False)
         self.last_bn = nn.BatchNorm1d(512, eps=0.001, momentum=0.1, affine=True)
 
-        self.logits = nn.Linear(512, 8631)
+        if not inference_only:
+            self.logits = nn.Linear(512, 8631)
 
     def device(self):
         return next(self.parameters()).device
@@ -281,22 +296,182 @@ class InceptionResnetV1(nn.Module):
         return x
 
 
-def load_model(pretrained = 'weights/vggface2_weights.pt', device = 'cpu'):
+def optimize_for_inference(model, channels_last = False):
+    """
+    Fold batch norms into the layers before them and make activations in place.
+
+    The model is modified in place and set to eval mode. Each BasicConv2d then runs one biased
+    conv followed by an in-place ReLU, and last_linear absorbs last_bn. The resulting state dict
+    has no batch norm entries. load_model(optimize=True) caches it next to the weights.
+
+    Parameters:
+        model (InceptionResnetV1): Model with trained batch norm statistics.
+        channels_last (bool): Whether to store conv weights in channels_last memory format, which
+            matches the NHWC layout of embed_faces inputs.
+
+    Returns:
+        InceptionResnetV1: The same model, optimized.
+    """
+    model.eval()
+    with torch.no_grad():
+        for module in list(model.modules()):
+            if isinstance(module, BasicConv2d) and not isinstance(module.bn, nn.Identity):
+                module.conv = fuse_conv_bn_eval(module.conv, module.bn)
+                module.bn = nn.Identity()
+            elif isinstance(module, nn.ReLU):
+                # Every ReLU input is a fresh conv or residual sum that nothing else reads
+                module.inplace = True
+        if not isinstance(model.last_bn, nn.Identity):
+            model.last_linear = fuse_linear_bn_eval(model.last_linear, model.last_bn)
+            model.last_bn = nn.Identity()
+    if channels_last:
+        model.to(memory_format=torch.channels_last)
+    return model
+
+
+def load_weights(model, state_dict, inference_only = False, assign = False):
+    """
+    Load state_dict into model. With inference_only, entries of layers the model does not build
+    are dropped, but all others are still required. With assign, the model keeps the given
+    tensors instead of copying them.
+    """
+    if inference_only:
+        keys = model.state_dict().keys()
+        state_dict = {k: v for k, v in state_dict.items() if k in keys}
+    if assign:
+        missing = assign_state_dict(model, state_dict, strict=not inference_only)[0]
+    else:
+        missing = model.load_state_dict(state_dict, strict=not inference_only).missing_keys
+    if missing:
+        raise RuntimeError(f'Missing keys in state dict: {missing}')
+
+
+def load_model(pretrained = 'weights/vggface2_weights.pt', device = 'cpu', backend = 'torch',
+               optimize = False, channels_last = False, quantized = False, inference_only = False,
+               packed_weights = None):
+    """
+    Load the VGGFace2 InceptionResnetV1 embedding model.
+
+    Parameters:
+        pretrained (str): Weights file, relative to this directory. None keeps random weights.
+        device (str or torch.device): The device to run the model on.
+        backend (str): 'torch' for the eager PyTorch model, 'onnx' to run its ONNX graph on ONNX
+            Runtime's CPU provider. The graph is exported next to the weights on first use.
+        optimize (bool): Apply optimize_for_inference to the torch model. Its folded state dict
+            is saved as <weights>_folded.pt on first use and loaded directly afterwards, until
+            the weights file changes. Implies inference_only.
+        channels_last (bool): With optimize, store conv weights in channels_last format.
+        quantized (bool): Load the int8 model saved by verification_models.quantization.
+            quantize_vggface2 next to the weights instead. It always runs on the CPU.
+        inference_only (bool): Skip the unused 512x8631 classification layer, both when building
+            the model and when loading its weights, to save memory.
+        packed_weights (str or PackedWeights): File written by pack_weights.py with a 'vggface2'
+            entry. The torch model then maps its weights from it instead of loading pretrained,
+            sharing page cache pages with other processes. optimize still works but copies the
+            folded weights into private memory.
+
+    Returns:
+        torch.nn.Module: Model mapping a batch of 3x160x160 faces to 512-d embeddings.
+    """
+    if backend == 'onnx':
+        if not pretrained:
+            raise ValueError('The ONNX backend needs pretrained weights')
+        state_dict_path = os.path.join(os.path.dirname(__file__), pretrained)
+        return load_onnx(
+            os.path.splitext(state_dict_path)[0] + '.onnx',
+            lambda: load_model(pretrained, 'cpu', inference_only=True),
+            torch.rand(2, 3, 160, 160) * 2 - 1,
+            ['embedding'],
+        )
+    elif backend != 'torch':
+        raise ValueError(f'Unknown backend {backend}')
+
+    if quantized:
+        if not pretrained:
+            raise ValueError('The quantized model needs pretrained weights')
+        return load_quantized_model(
+            InceptionResnetV1(inference_only=True), quantized_path(pretrained)
+        )
+
     if isinstance(device, str):
         if (device == 'cuda' or device == 'gpu') and torch.cuda.is_available():
             device = torch.device(device)
         else:
             device = torch.device('cpu')
     
-    model = InceptionResnetV1().to(device)
+    inference_only = inference_only or optimize
+    if packed_weights is not None:
+        # Weights are mapped from the file, so none are initialized or copied
+        with torch.device('meta'):
+            model = InceptionResnetV1(inference_only=inference_only)
+        load_weights(
+            model, open_packed(packed_weights).state_dict('vggface2'), inference_only, assign=True
+        )
+        model.eval()
+        if optimize:
+            optimize_for_inference(model, channels_last)
+        return model.to(device)
+
+    model = InceptionResnetV1(inference_only=inference_only)
     model.eval()
     if pretrained:
         state_dict_path = os.path.join(os.path.dirname(__file__), pretrained)
-        model.load_state_dict(torch.load(state_dict_path, map_location= 'cpu'))
+        folded_path = os.path.splitext(state_dict_path)[0] + '_folded.pt'
+        folded = load_cached(folded_path, state_dict_path) if optimize else None
+        if folded is not None:
+            # Random weights fold into the same structure, then the cached ones replace them
+            optimize_for_inference(model)
+            load_weights(model, folded, inference_only)
+            state_dict_path = folded_path
+        else:
+            load_weights(model, torch.load(state_dict_path, map_location= 'cpu'), inference_only)
         print('Weights loaded successfully from path:', state_dict_path)
         print('====================================================')
+        if optimize and folded is None:
+            optimize_for_inference(model)
+            save_cached(model.state_dict(), folded_path, state_dict_path)
+    elif optimize:
+        optimize_for_inference(model)
+    if optimize and channels_last:
+        model.to(memory_format=torch.channels_last)
         
-    return model
+    return model.to(device)
+
+
+def embed_faces(faces, model, max_batch = 32, size = 160):
+    """
+    Compute the embeddings of a list of face crops in as few forward passes as possible.
+
+    Crops are resized and normalized as utils.functions.face_transform does for 'VGG-Face2', into
+    one preallocated batch, and embedded max_batch at a time under torch.inference_mode().
+
+    Parameters:
+        faces (list of np.ndarray): RGB face crops, of any size.
+        model (torch.nn.Module): Model returned by load_model, on any backend.
+        max_batch (int): Largest number of faces per forward pass, to bound memory.
+        size (int): Side of the square model input.
+
+    Returns:
+        torch.Tensor: (N, 512) embeddings, one row per face, on the model's device.
+    """
+    batch = np.empty((len(faces), size, size, 3), dtype=np.float32)
+    for face, out in zip(faces, batch):
+        out[...] = cv.resize(face, (size, size))
+    batch -= 127.5
+    batch /= 128
+    # NHWC buffer viewed as NCHW, the same layout face_transform produces
+    batch = torch.from_numpy(batch).permute(0, 3, 1, 2).to(model.device())
+
+    embeddings = None
+    with torch.inference_mode():
+        for start in range(0, len(faces), max_batch):
+            out = model(batch[start:start + max_batch])
+            if embeddings is None:
+                embeddings = out.new_empty((len(faces),) + out.shape[1:])
+            embeddings[start:start + len(out)] = out
+    if embeddings is None:
+        embeddings = torch.empty((0, 512), device=model.device())
+    return embeddings
 
 if __name__ == '__main__':
     model = load_model()    
@@ -0,0 +1,197 @@
+import copy
+import os
+import warnings
+
+import cv2 as cv
+import numpy as np
+import torch
+from torch import nn
+from torch.ao.quantization import get_default_qconfig_mapping
+from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+from facenet.models.utils.quantization import ENGINE, IMAGE_EXTENSIONS
+from utils.distance import findThreshold
+
+SAMPLE_SHAPE = (1, 3, 160, 160)
+
+
+class QuantizedModel(nn.Module):
+    """Int8 InceptionResnetV1 graph with the device() method callers of the float model use.
+
+    Arguments:
+        model {torch.fx.GraphModule} -- Model prepared by prepare_model, calibrated or not.
+    """
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def device(self):
+        return torch.device('cpu')
+
+    def forward(self, x):
+        return self.model(x)
+
+
+def prepare_model(model):
+    """Copy of the float embedding model with observers inserted, to be calibrated by running it.
+
+    FX graph mode fuses every conv, batch norm and ReLU and quantizes convs and linears with
+    per-channel int8 weights. The final L2 normalization runs in float.
+    """
+    torch.backends.quantized.engine = ENGINE
+    model = copy.deepcopy(model).cpu().eval()
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', DeprecationWarning)
+        return prepare_fx(model, get_default_qconfig_mapping(ENGINE), (torch.zeros(SAMPLE_SHAPE),))
+
+
+def convert_model(prepared):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', DeprecationWarning)
+        return QuantizedModel(convert_fx(prepared))
+
+
+def load_quantized_model(model, path):
+    """Int8 version of the float `model` with the state dict saved at `path` by quantize_vggface2."""
+    with warnings.catch_warnings():
+        # Observers that never saw data warn when converted; the state dict overwrites them
+        warnings.simplefilter('ignore')
+        qmodel = convert_model(prepare_model(model))
+    qmodel.model.load_state_dict(torch.load(path, map_location='cpu'))
+    return qmodel
+
+
+def quantized_path(pretrained):
+    """Int8 state dict path of the float weights `pretrained`, relative to this directory."""
+    path = os.path.join(os.path.dirname(__file__), pretrained)
+    return os.path.splitext(path)[0] + '_int8.pt'
+
+
+def read_faces(face_dir):
+    """RGB face crops under face_dir and their identities, the name of the subfolder they are in.
+    Crops directly in face_dir are each their own identity."""
+    paths, labels = [], []
+    for name in sorted(os.listdir(face_dir)):
+        path = os.path.join(face_dir, name)
+        if os.path.isdir(path):
+            files = sorted(f for f in os.listdir(path) if f.lower().endswith(IMAGE_EXTENSIONS))
+            paths.extend(os.path.join(path, f) for f in files)
+            labels.extend([name] * len(files))
+        elif name.lower().endswith(IMAGE_EXTENSIONS):
+            paths.append(path)
+            labels.append(name)
+    if not paths:
+        raise ValueError('No images found in {}'.format(face_dir))
+    faces = [cv.cvtColor(cv.imread(path), cv.COLOR_BGR2RGB) for path in paths]
+    return faces, labels
+
+
+def compare_embeddings(reference, embeddings, labels, threshold):
+    """Compare the verification decisions of int8 embeddings with those of the float model.
+
+    Every pair of faces is a genuine pair if both have the same label and an impostor pair
+    otherwise. Faces match when the Euclidean distance of their embeddings is below threshold.
+
+    Arguments:
+        reference {torch.Tensor} -- Nx512 embeddings of the float model.
+        embeddings {torch.Tensor} -- Nx512 embeddings of the int8 model, of the same faces.
+        labels {list} -- Identity of every face.
+        threshold {float} -- Distance threshold, as returned by findThreshold.
+
+    Returns:
+        dict -- Number of faces and pairs; min cosine similarity of the int8 and float embedding
+            of a face; mean and std of genuine and impostor distances and verification accuracy
+            for both models; largest change of a pair distance; fraction of pairs on which both
+            models make the same decision.
+    """
+    reference, embeddings = reference.double().cpu(), embeddings.double().cpu()
+    n = len(labels)
+    i, j = torch.triu_indices(n, n, 1)
+    _, label_ids = np.unique(labels, return_inverse=True)
+    label_ids = torch.from_numpy(label_ids.reshape(-1))
+    genuine = label_ids[i] == label_ids[j]
+
+    metrics = {
+        'faces': n,
+        'genuine_pairs': int(genuine.sum()),
+        'impostor_pairs': int((~genuine).sum()),
+        'min_cosine': float(nn.functional.cosine_similarity(reference, embeddings).min()),
+    }
+    decisions = {}
+    for name, emb in [('fp32', reference), ('int8', embeddings)]:
+        dist = torch.cdist(emb, emb, compute_mode='donot_use_mm_for_euclid_dist')[i, j]
+        decisions[name] = (dist, dist < threshold)
+        for kind, mask in [('genuine', genuine), ('impostor', ~genuine)]:
+            metrics['{}_{}_mean'.format(name, kind)] = float(dist[mask].mean())
+            metrics['{}_{}_std'.format(name, kind)] = float(dist[mask].std())
+        metrics['{}_accuracy'.format(name)] = float(
+            (decisions[name][1] == genuine).double().mean()
+        )
+    metrics['max_distance_shift'] = float((decisions['fp32'][0] - decisions['int8'][0]).abs().max())
+    metrics['decision_agreement'] = float(
+        (decisions['fp32'][1] == decisions['int8'][1]).double().mean()
+    )
+    return metrics
+
+
+def evaluate(model, qmodel, eval_dir, max_batch=32):
+    """compare_embeddings of the float and int8 models on the face crops of eval_dir, at the
+    Euclidean threshold of findThreshold('VGG-Face2')."""
+    from verification_models.VGGFace2 import embed_faces
+
+    faces, labels = read_faces(eval_dir)
+    if len(faces) < 2:
+        raise ValueError('At least two faces are needed to evaluate, found {}'.format(len(faces)))
+    reference = embed_faces(faces, model, max_batch)
+    embeddings = embed_faces(faces, qmodel, max_batch)
+    threshold = findThreshold(model_name='VGG-Face2', distance_metric='euclidean')
+    return compare_embeddings(reference, embeddings, labels, threshold)
+
+
+def quantize_vggface2(
+    calibration_dir, eval_dir=None, pretrained='weights/vggface2_weights.pt', min_agreement=0.99,
+    max_batch=32, save=True
+):
+    """Quantize the VGGFace2 embedding model to int8 and save it if it keeps the float model's
+    verification decisions.
+
+    Observers are calibrated by embedding every face crop of calibration_dir. The int8 model is
+    then compared with the float one by evaluate(), on eval_dir or the calibration crops, and its
+    state dict is saved only if decision agreement is at least min_agreement.
+    VGGFace2.load_model(quantized=True) loads it.
+
+    Arguments:
+        calibration_dir {str} -- Folder of face crops, as extract_face returns them, representative
+            of the deployment.
+
+    Keyword Arguments:
+        eval_dir {str} -- Folder with a subfolder of face crops per identity. If None, the
+            calibration crops. (default: {None})
+        pretrained {str} -- Float weights, relative to verification_models. The int8 state dict
+            is saved next to them. (default: {'weights/vggface2_weights.pt'})
+        min_agreement {float} -- Fraction of face pairs on which both models must make the same
+            decision. (default: {0.99})
+        max_batch {int} -- Faces per forward pass. (default: {32})
+        save {bool} -- Whether to save the state dict when the check passes. (default: {True})
+
+    Returns:
+        tuple(QuantizedModel, dict) -- Int8 model and the metrics of compare_embeddings().
+    """
+    from verification_models.VGGFace2 import embed_faces, load_model
+
+    model = load_model(pretrained, inference_only=True)
+    prepared = prepare_model(model)
+    embed_faces(read_faces(calibration_dir)[0], QuantizedModel(prepared), max_batch)
+    qmodel = convert_model(prepared)
+
+    metrics = evaluate(model, qmodel, eval_dir or calibration_dir, max_batch)
+    if metrics['decision_agreement'] < min_agreement:
+        raise ValueError(
+            'Quantized VGGFace2 decision agreement {:.4f} is below {:.4f}, weights not saved: {}'
+            .format(metrics['decision_agreement'], min_agreement, metrics)
+        )
+
+    if save:
+        torch.save(qmodel.model.state_dict(), quantized_path(pretrained))
+    return qmodel, metrics
@@ -0,0 +1,34 @@
+import os
+
+import torch
+
+
+def source_stamp(path):
+    """Size and modification time of the weights file a cache is derived from."""
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def load_cached(cache_path, source_path):
+    """
+    State dict saved by save_cached, if it was derived from the current version of source_path.
+
+    Parameters:
+        cache_path (str): Cache file.
+        source_path (str): Weights file the cache was derived from.
+
+    Returns:
+        dict or None: The cached state dict, or None if there is no cache, or it is stale.
+    """
+    if not os.path.exists(cache_path):
+        return None
+    cache = torch.load(cache_path, map_location='cpu')
+    # Caches written before their source was recorded are rebuilt as well
+    if not isinstance(cache, dict) or cache.get('source') != source_stamp(source_path):
+        return None
+    return cache['state_dict']
+
+
+def save_cached(state_dict, cache_path, source_path):
+    """Save state_dict to cache_path, recording the version of source_path it is derived from."""
+    torch.save({'source': source_stamp(source_path), 'state_dict': state_dict}, cache_path)